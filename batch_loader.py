@@ -0,0 +1,154 @@
+""" Coalescing of individual lookups into bulk requests, in the style of the
+    DataLoader pattern [1]: load(key) returns a future immediately, the keys
+    loaded within a short window (or until a batch is full) are requested
+    together by a single call of the batch function, and loads of a key
+    already waiting or in flight share its future instead of requesting it
+    again.
+
+    TwitterReader uses it to send the single user and tweet lookups as
+    '/users/lookup' and '/statuses/lookup' requests of up to 100 ids.
+
+    Example:
+        loader = BatchLoader(lambda ids: { user['id_str']: user for user in twitter_conn.get_users_info(ids) }, window_sec=0.01)
+        futures = [ loader.load(user_id) for user_id in user_ids ]
+        loader.flush()      # no need to wait for the window
+        users = [ future.result() for future in futures ]
+
+References:
+    [1] https://github.com/graphql/dataloader
+"""
+
+
+import logging
+import threading
+import collections
+import concurrent.futures
+
+
+class BatchLoader:
+
+
+    _batch_function                 = None
+    _max_batch_size                 = 0
+    _window_sec                     = 0
+    _missing                        = None
+    _lock                           = None
+    _pending                        = None          # key -> future of the keys waiting for the next batch
+    _in_flight                      = None          # key -> future of the keys of the batches being requested
+    _timer                          = None
+    _loads                          = 0
+    _coalesced                      = 0
+    _batches                        = 0
+    _logger                         = None
+
+
+    def __init__(self, batch_function, max_batch_size = 100, window_sec = 0.01, missing = None):
+        """ 'batch_function' receives a list of up to 'max_batch_size' keys and
+            returns a dictionary mapping the keys found to their values. The
+            futures of the keys absent from it get the exception returned by
+            missing(key) (a KeyError by default). The batch is requested
+            'window_sec' seconds after its first key is loaded, or as soon as it
+            is full.
+        """
+        self._batch_function = batch_function
+        self._max_batch_size = max_batch_size
+        self._window_sec = window_sec
+        self._missing = missing or KeyError
+        self._lock = threading.Lock()
+        self._pending = collections.OrderedDict()
+        self._in_flight = {}
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+
+    def load(self, key):
+        """ Returns a concurrent.futures.Future of the value of 'key'.
+        """
+        with self._lock:
+            self._loads += 1
+            future = self._pending.get(key) or self._in_flight.get(key)
+            if future is not None:
+                self._coalesced += 1
+                return future
+            future = concurrent.futures.Future()
+            self._pending[key] = future
+            if len(self._pending) >= self._max_batch_size:
+                self._start_batch()
+            elif self._timer is None:
+                self._timer = threading.Timer(self._window_sec, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        return future
+
+
+    def load_many(self, keys):
+        """ Returns the futures of 'keys', requesting them in full batches.
+        """
+        futures = [ self.load(key) for key in keys ]
+        self.flush()
+        return futures
+
+
+    def flush(self):
+        """ Requests the keys waiting for the next batch without waiting for the
+            window to end.
+        """
+        with self._lock:
+            if self._pending:
+                self._start_batch()
+
+
+    def _start_batch(self):
+        """ Moves the pending keys to a new batch requested in its own thread.
+            Called with the lock held.
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch = self._pending
+        self._pending = collections.OrderedDict()
+        self._in_flight.update(batch)
+        self._batches += 1
+        threading.Thread(target=self._run_batch, args=(batch,), name=self.__class__.__name__, daemon=True).start()
+
+
+    def _run_batch(self, batch):
+        """ Requests a batch and resolves its futures. The futures are resolved
+            whatever happens (even on KeyboardInterrupt or SystemExit in the
+            batch thread), so no caller waits forever in result().
+        """
+        try:
+            try:
+                values = self._batch_function(list(batch))
+                error = None
+            except Exception as e:
+                values = {}
+                error = e
+            for key, future in batch.items():
+                if error is not None:
+                    future.set_exception(error)
+                elif key in values:
+                    future.set_result(values[key])
+                else:
+                    future.set_exception(self._missing(key))
+        finally:
+            with self._lock:
+                for key in batch:
+                    if self._in_flight.get(key) is batch[key]:
+                        del self._in_flight[key]
+            for future in batch.values():
+                if not future.done():   # interrupted by a BaseException
+                    future.set_exception(Exception('Batch of {} keys interrupted.'.format(len(batch))))
+
+
+    def stats(self):
+        """ Returns the number of loads, of loads sharing the future of another
+            load and of batches requested.
+        """
+        with self._lock:
+            return {'loads': self._loads, 'coalesced': self._coalesced, 'batches': self._batches}
+
+
+    def close(self):
+        """ Requests the keys still waiting, so no future is left unresolved.
+        """
+        self.flush()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+
+
+""" Compressed sinks for the collected data: gzip (standard library) or
+    Zstandard [1] (requires the zstandard package [2]).
+
+    Zstandard compresses faster and better than gzip, can use several threads
+    and, for small files of similar records (e.g. per-user or per-expression
+    tweet files), can use a dictionary trained on sample records [3]. The
+    dictionary is needed to decompress the files, so the collectors copy it to
+    their destination directory (DICTIONARY_FILENAME) next to the compressed
+    files.
+
+    Usage (training a dictionary from already collected files, JSON arrays or
+    JSON lines, optionally compressed):
+        ./compression.py tweets.dict collected/*.json.gz collected/*.jsonl
+
+References:
+    [1] https://facebook.github.io/zstd/
+    [2] https://python-zstandard.readthedocs.io/
+    [3] https://github.com/facebook/zstd#the-case-for-small-data-compression
+"""
+
+
+import os
+import sys
+import gzip
+import json
+import shutil
+import argparse
+import logging
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+DICTIONARY_FILENAME = 'zstd_dictionary.bin'
+_suffixes = {'gzip': '.gz', 'zstd': '.zst'}
+
+
+def _check_zstandard():
+    if zstandard is None:
+        raise Exception('Zstandard compression requires the zstandard package (pip install zstandard).')
+
+
+def suffix(codec):
+    """ Returns the filename suffix of the files compressed with 'codec' ('gzip'
+        or 'zstd').
+    """
+    return _suffixes[codec]
+
+
+def load_dictionary(filename):
+    _check_zstandard()
+    with open(filename, mode='rb') as fd:
+        return zstandard.ZstdCompressionDict(fd.read())
+
+
+def save_dictionary(dictionary, filename):
+    with open(filename, mode='wb') as fd:
+        fd.write(dictionary.as_bytes())
+
+
+def train_dictionary(records, dict_size = 112640):
+    """ Trains a Zstandard dictionary of 'dict_size' bytes (default = 110 KB, the
+        zstd command line default) from an iterable of sample records (JSON
+        serializable objects, e.g. tweets or users). Some thousands of samples
+        are recommended.
+    """
+    _check_zstandard()
+    samples = [ json.dumps(record, sort_keys=True, ensure_ascii=True).encode('ascii') for record in records ]
+    return zstandard.train_dictionary(dict_size, samples)
+
+
+def open_sink(filename, mode = 'wt', encoding = 'ascii', codec = 'gzip', level = None, threads = 0, dictionary = None):
+    """ Opens 'filename' for writing compressed with 'codec'. 'level' is the
+        compression level (default = 9 for gzip and 3 for zstd). Zstd only:
+        'threads' is the number of compression threads (0 = compression in the
+        calling thread; -1 = number of CPUs) and 'dictionary' a dictionary from
+        train_dictionary() or load_dictionary().
+    """
+    if codec == 'gzip':
+        return gzip.open(filename, mode=mode, encoding=encoding if 'b' not in mode else None, compresslevel=level or 9)
+    if codec != 'zstd':
+        raise ValueError('Invalid codec {}. Valid codecs: {}.'.format(codec, ', '.join(sorted(_suffixes))))
+    _check_zstandard()
+    compressor = zstandard.ZstdCompressor(level=level or 3, dict_data=dictionary, threads=threads, write_checksum=True)
+    return zstandard.open(filename, mode=mode, cctx=compressor, encoding=encoding if 'b' not in mode else None)
+
+
+def open_source(filename, mode = 'rt', encoding = 'utf-8', dictionary = None):
+    """ Opens for reading 'filename', decompressing it according to its suffix
+        (.gz, .zst or none). Zstd files compressed with a dictionary need the
+        same 'dictionary' (by default, the DICTIONARY_FILENAME file of the
+        directory of 'filename' is used when it exists).
+    """
+    if filename.endswith('.gz'):
+        return gzip.open(filename, mode=mode, encoding=encoding if 'b' not in mode else None)
+    if not filename.endswith('.zst'):
+        return open(filename, mode=mode, encoding=encoding if 'b' not in mode else None)
+    _check_zstandard()
+    if dictionary is None:
+        dictionary_filename = os.path.join(os.path.dirname(filename), DICTIONARY_FILENAME)
+        if os.path.exists(dictionary_filename):
+            dictionary = load_dictionary(dictionary_filename)
+    decompressor = zstandard.ZstdDecompressor(dict_data=dictionary)
+    return zstandard.open(filename, mode=mode, dctx=decompressor, encoding=encoding if 'b' not in mode else None)
+
+
+def install_dictionary(dictionary_filename, directory):
+    """ Copies the dictionary file to 'directory', where open_source() finds it,
+        and returns the loaded dictionary.
+    """
+    shutil.copyfile(dictionary_filename, os.path.join(directory, DICTIONARY_FILENAME))
+    return load_dictionary(dictionary_filename)
+
+
+def _iter_records(filename):
+    with open_source(filename) as fd:
+        data = fd.read()
+    if data.lstrip().startswith('['):
+        yield from json.loads(data)
+        return
+    for line in data.splitlines():
+        if line.strip():
+            yield json.loads(line)
+
+
+def command_line_parsing():
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('dictionary_filename',
+                        help='Filename where the trained dictionary is written.')
+    parser.add_argument('sample_filenames',
+                        nargs='+',
+                        help='Files with sample records (tweets or users).')
+    parser.add_argument('--max_samples', '-m',
+                        type=int,
+                        default=100000,
+                        help='Maximum number of sample records. Default = 100000.')
+    parser.add_argument('--dict_size', '-s',
+                        type=int,
+                        default=112640,
+                        help='Dictionary size in bytes. Default = 112640.')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = command_line_parsing()
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] - %(name)s - %(levelname)s - %(message)s')
+
+    samples = []
+    for filename in args.sample_filenames:
+        for record in _iter_records(filename):
+            samples.append(record)
+            if len(samples) >= args.max_samples:
+                break
+        if len(samples) >= args.max_samples:
+            break
+    if not samples:
+        logging.error('No sample records found. Quitting ...')
+        sys.exit(1)
+    logging.info('Training a dictionary of {} bytes from {} sample records ...'.format(args.dict_size, len(samples)))
+    save_dictionary(train_dictionary(samples, args.dict_size), args.dictionary_filename)
+    logging.info('Dictionary written to {}.'.format(args.dictionary_filename))
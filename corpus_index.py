@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+
+
+""" SQLite index over collected corpora, for random access to single tweets
+    without loading and parsing whole files. It maps each tweet id to the file,
+    byte offset and length of its JSON record, with secondary indexes on the
+    user id, creation time and expression id.
+
+    Indexed files: JSON arrays of tweets (the tweets.json files of
+    collect_timeline.py and the <id>.json files of collect_expressions*.py) and
+    JSON lines files (retrieve_tweets.py and daemon.py sinks), optionally gzip
+    compressed. Numbered files (<id>.json, <id>.json.gz) are indexed only in
+    the directories of the expression collectors, recognised by their
+    expression_ids.txt or expression_ids.json file, and their number is the
+    expression id: the numbered files of other directories hold users (e.g.
+    the output of collect_users.py) and are skipped.
+
+    Lookups are fast only in uncompressed files, where a record is read with a
+    single seek. Offsets in gzip files refer to the uncompressed stream and
+    gzip has no random access, so every lookup in them decompresses the file
+    from its start (or from the previous lookup, if it is before the record)
+    up to the offset, taking time proportional to the offset.
+
+    Usage:
+        ./corpus_index.py index.db index <collected files or directories> ...
+        ./corpus_index.py index.db tweet <tweet id>
+        ./corpus_index.py index.db user <user id>
+"""
+
+
+import os
+import re
+import sys
+import gzip
+import json
+import sqlite3
+import logging
+import datetime
+
+
+_created_at_format = '%a %b %d %H:%M:%S %z %Y'
+_expression_filename = re.compile(r'^(\d+)\.jsonl?(\.gz)?$')
+_expression_ids_filenames = ('expression_ids.txt', 'expression_ids.json')    # written by the expression collectors next to their numbered files
+
+
+def _is_expression_directory(directory):
+    return any(os.path.exists(os.path.join(directory, filename)) for filename in _expression_ids_filenames)
+
+
+def _open_binary(filename):
+    return gzip.open(filename, mode='rb') if filename.endswith('.gz') else open(filename, mode='rb')
+
+
+def _iter_json_lines(fd):
+    """ Yields (offset, length, tweet) for each record of a JSON lines file.
+    """
+    offset = 0
+    for line in fd:
+        stripped = line.strip()
+        if stripped:
+            yield offset, len(line.rstrip(b'\r\n')), json.loads(stripped)
+        offset += len(line)
+
+
+def _iter_json_array(fd, chunk_bytes = 1024 * 1024):
+    """ Yields (offset, length, tweet) for each element of the JSON array read
+        from 'fd'. The file is read in chunks of 'chunk_bytes', so only the
+        current chunk and the element being decoded are kept in memory.
+
+        The bytes are decoded as latin-1 so character offsets are byte offsets.
+        Non-ASCII text is garbled by this decoding, but only ids and dates are
+        used for indexing, and records are decoded again as UTF-8 when read.
+    """
+    decoder = json.JSONDecoder()
+    whitespace = re.compile(r'[\s,]*')
+    text = ''
+    base = 0                # byte offset of text[0] in the file
+    position = -1
+    while position < 0:
+        chunk = fd.read(chunk_bytes)
+        if not chunk:
+            return
+        text += chunk.decode('latin-1')
+        position = text.find('[')
+    position += 1
+    eof = False
+    while True:
+        position = whitespace.match(text, position).end()
+        if position < len(text):
+            if text[position] == ']':
+                return
+            try:
+                tweet, end = decoder.raw_decode(text, position)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                end = None
+            if end is not None and (end < len(text) or eof):    # an element ending with the chunk may continue in the next one
+                yield base + position, end - position, tweet
+                position = end
+                continue
+        elif eof:
+            return
+        chunk = fd.read(chunk_bytes)
+        eof = not chunk
+        text = text[position:] + chunk.decode('latin-1')
+        base += position
+        position = 0
+
+
+def _iter_records(filename):
+    with _open_binary(filename) as fd:
+        first = fd.read(1)
+        while first.isspace():
+            first = fd.read(1)
+        fd.seek(0)
+        if first == b'[':
+            yield from _iter_json_array(fd)
+        else:
+            yield from _iter_json_lines(fd)
+
+
+class CorpusIndex:
+
+
+    _filename                       = None
+    _connection                     = None
+    _open_files                     = None
+    _logger                         = None
+
+
+    def __init__(self, filename):
+        self._filename = filename
+        self._connection = sqlite3.connect(filename)
+        self._connection.executescript('''
+            CREATE TABLE IF NOT EXISTS files (
+                file_id         INTEGER PRIMARY KEY,
+                path            TEXT UNIQUE NOT NULL,
+                size            INTEGER NOT NULL,
+                mtime           REAL NOT NULL,
+                expression_id   INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS tweets (
+                tweet_id        INTEGER NOT NULL,
+                file_id         INTEGER NOT NULL REFERENCES files (file_id),
+                offset          INTEGER NOT NULL,
+                length          INTEGER NOT NULL,
+                user_id         INTEGER,
+                created_at      INTEGER,
+                PRIMARY KEY (tweet_id, file_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS tweets_user ON tweets (user_id, tweet_id);
+            CREATE INDEX IF NOT EXISTS tweets_created_at ON tweets (created_at);
+            CREATE INDEX IF NOT EXISTS tweets_file ON tweets (file_id);
+            CREATE INDEX IF NOT EXISTS files_expression ON files (expression_id);
+        ''')
+        self._open_files = {}
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+
+    @staticmethod
+    def _created_at_epoch(tweet):
+        try:
+            return int(datetime.datetime.strptime(tweet['created_at'], _created_at_format).timestamp())
+        except (KeyError, ValueError):
+            return None
+
+
+    def add_file(self, filename, expression_id = None):
+        """ Indexes the tweets of 'filename'. Files already indexed and unchanged
+            since are skipped. If 'expression_id' is None, it is taken from the
+            name of the numbered files of an expression directory. Returns the
+            number of indexed tweets.
+        """
+        path = os.path.abspath(filename)
+        stat = os.stat(path)
+        row = self._connection.execute('SELECT file_id, size, mtime FROM files WHERE path = ?', (path,)).fetchone()
+        if row and row[1] == stat.st_size and row[2] == stat.st_mtime:
+            return 0
+        if expression_id is None and _is_expression_directory(os.path.dirname(path)):
+            match = _expression_filename.match(os.path.basename(path))
+            expression_id = int(match.group(1)) if match else None
+        with self._connection:
+            if row:
+                self._connection.execute('DELETE FROM tweets WHERE file_id = ?', (row[0],))
+                self._connection.execute('DELETE FROM files WHERE file_id = ?', (row[0],))
+            file_id = self._connection.execute('INSERT INTO files (path, size, mtime, expression_id) VALUES (?, ?, ?, ?)',
+                                               (path, stat.st_size, stat.st_mtime, expression_id)).lastrowid
+            count = 0
+            rows = []
+            for offset, length, tweet in _iter_records(path):
+                user_id = tweet['user']['id'] if 'user' in tweet else None
+                rows.append((tweet['id'], file_id, offset, length, user_id, self._created_at_epoch(tweet)))
+                if len(rows) >= 10000:
+                    self._connection.executemany('INSERT OR REPLACE INTO tweets VALUES (?, ?, ?, ?, ?, ?)', rows)
+                    count += len(rows)
+                    rows = []
+            self._connection.executemany('INSERT OR REPLACE INTO tweets VALUES (?, ?, ?, ?, ?, ?)', rows)
+            count += len(rows)
+        self._logger.debug('Indexed {} tweets from {}.'.format(count, path))
+        return count
+
+
+    def add_path(self, path):
+        """ Indexes a file or, recursively, every .json, .jsonl, .json.gz and
+            .jsonl.gz file of a directory (except user.json files and the
+            numbered files out of expression directories, which hold users
+            instead of tweets). Returns the number of indexed tweets.
+        """
+        if os.path.isfile(path):
+            return self.add_file(path)
+        count = 0
+        for directory, _, filenames in os.walk(path):
+            expression_directory = _is_expression_directory(directory)
+            for filename in sorted(filenames):
+                if not re.search(r'\.jsonl?(\.gz)?$', filename) or filename == 'user.json' or filename.startswith('expression_ids'):
+                    continue
+                if _expression_filename.match(filename) and not expression_directory:
+                    self._logger.debug('Skipping {}: numbered file out of an expression directory (users) ...'.format(os.path.join(directory, filename)))
+                    continue
+                count += self.add_file(os.path.join(directory, filename))
+        return count
+
+
+    def _read(self, path, offset, length):
+        fd = self._open_files.get(path)
+        if fd is None:
+            fd = self._open_files[path] = _open_binary(path)
+        fd.seek(offset)
+        return json.loads(fd.read(length).decode('utf-8'))
+
+
+    def _fetch(self, query, params):
+        rows = self._connection.execute('''SELECT files.path, tweets.offset, tweets.length FROM tweets JOIN files USING (file_id) ''' + query, params).fetchall()
+        return [ self._read(*row) for row in rows ]
+
+
+    def get_tweet(self, tweet_id):
+        """ Returns the tweet with id 'tweet_id' or None if not indexed.
+        """
+        tweets = self._fetch('WHERE tweets.tweet_id = ? LIMIT 1', (int(tweet_id),))
+        return tweets[0] if tweets else None
+
+
+    def locate(self, tweet_id):
+        """ Returns the (file, offset, length) locations of 'tweet_id' (a tweet can
+            be in several files, e.g. matching several expressions).
+        """
+        return self._connection.execute('SELECT files.path, tweets.offset, tweets.length FROM tweets JOIN files USING (file_id) WHERE tweets.tweet_id = ?', (int(tweet_id),)).fetchall()
+
+
+    def tweets_by_user(self, user_id):
+        return self._fetch('WHERE tweets.user_id = ? GROUP BY tweets.tweet_id ORDER BY tweets.tweet_id', (int(user_id),))
+
+
+    def tweets_between(self, since, until):
+        """ Returns the tweets created between the datetimes 'since' (inclusive)
+            and 'until' (exclusive).
+        """
+        return self._fetch('WHERE tweets.created_at >= ? AND tweets.created_at < ? GROUP BY tweets.tweet_id ORDER BY tweets.tweet_id', (int(since.timestamp()), int(until.timestamp())))
+
+
+    def tweets_by_expression(self, expression_id):
+        return self._fetch('WHERE files.expression_id = ? GROUP BY tweets.tweet_id ORDER BY tweets.tweet_id', (int(expression_id),))
+
+
+    def close(self):
+        for fd in self._open_files.values():
+            fd.close()
+        self._open_files = {}
+        self._connection.close()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] - %(name)s - %(levelname)s - %(message)s')
+    if len(sys.argv) < 4 or sys.argv[2] not in ('index', 'tweet', 'user'):
+        print(__doc__)
+        sys.exit(1)
+    index = CorpusIndex(sys.argv[1])
+    if sys.argv[2] == 'index':
+        for path in sys.argv[3:]:
+            logging.info('Indexing {} ...'.format(path))
+            logging.info('{} tweets indexed.'.format(index.add_path(path)))
+    elif sys.argv[2] == 'tweet':
+        print(json.dumps(index.get_tweet(sys.argv[3]), indent=4, sort_keys=True))
+    else:
+        for tweet in index.tweets_by_user(sys.argv[3]):
+            print(json.dumps(tweet, sort_keys=True))
+    index.close()
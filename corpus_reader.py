@@ -0,0 +1,168 @@
+""" Parallel reader of JSON lines (one tweet per line) corpora.
+
+    Each uncompressed shard is memory-mapped and split into chunks on line
+    boundaries, and the chunks are scanned by a multiprocessing pool. Filters on
+    common fields (user id, language and creation time range) are pushed down to
+    the raw lines: a line is decoded only if a cheap scan of its bytes shows it
+    can match, so most of the non-matching lines are never decoded. Gzip
+    compressed shards can't be memory-mapped and are scanned as a single chunk.
+
+    The creation time filter uses the time encoded in the snowflake tweet ids
+    (see twitter.tweet_id_to_datetime()).
+
+    Example:
+        tweet_filter = TweetFilter(langs=['pt'], since=datetime.datetime(2019, 1, 1))
+        for tweet in scan(['corpus/0.jsonl', 'corpus/1.jsonl'], tweet_filter, processes=8):
+            ...
+"""
+
+
+import os
+import re
+import mmap
+import gzip
+import json
+import multiprocessing
+import twitter
+
+
+_id_values = re.compile(rb'"id"\s*:\s*(\d+)')
+_lang_values = re.compile(rb'"lang"\s*:\s*"([^"]*)"')
+
+
+def write_json_lines(fd, records):
+    """ Writes 'records' to the text file 'fd' in JSON lines format, the
+        format read by this module.
+    """
+    for record in records:
+        fd.write(json.dumps(record, sort_keys=True, ensure_ascii=True))
+        fd.write('\n')
+
+
+class TweetFilter:
+    """ Filter of tweets by user ids, languages and creation time ('since'
+        inclusive, 'until' exclusive). Absent criteria match any tweet. Must be
+        picklable, since it is sent to the pool processes.
+    """
+
+
+    def __init__(self, user_ids = None, langs = None, since = None, until = None):
+        self.user_ids = set(int(user_id) for user_id in user_ids) if user_ids else None
+        self.langs = set(langs) if langs else None
+        self.since_id, self.max_id = twitter.tweet_id_bounds(None, None, since, until)
+
+
+    def might_match(self, line):
+        """ Cheap check on the raw bytes of a line: False means the tweet surely
+            doesn't match, True that it must be decoded to be checked. Nested
+            objects (e.g. retweeted statuses) only make lines pass this check,
+            never fail it.
+        """
+        if self.user_ids is not None or self.since_id or self.max_id:
+            ids = [ int(value) for value in _id_values.findall(line) ]
+            if self.user_ids is not None and self.user_ids.isdisjoint(ids):
+                return False
+            if (self.since_id or self.max_id) and not any((not self.since_id or value > self.since_id) and (not self.max_id or value <= self.max_id) for value in ids):
+                return False
+        if self.langs is not None:
+            if self.langs.isdisjoint(value.decode('utf-8', 'replace') for value in _lang_values.findall(line)):
+                return False
+        return True
+
+
+    def matches(self, tweet):
+        if self.user_ids is not None and tweet.get('user', {}).get('id') not in self.user_ids:
+            return False
+        if self.langs is not None and tweet.get('lang') not in self.langs:
+            return False
+        if self.since_id and tweet['id'] <= self.since_id:
+            return False
+        if self.max_id and tweet['id'] > self.max_id:
+            return False
+        return True
+
+
+def _iter_chunk_lines(filename, start, end):
+    """ Yields the lines starting in the byte interval [start, end) of 'filename'.
+    """
+    if filename.endswith('.gz'):
+        with gzip.open(filename, mode='rb') as fd:
+            yield from fd
+        return
+    if os.path.getsize(filename) == 0:
+        return
+    with open(filename, mode='rb') as fd, mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        position = 0 if start == 0 else mapped.find(b'\n', start - 1) + 1    # first line starting at or after 'start'
+        if start > 0 and position == 0:     # no line starts in the chunk
+            return
+        while position < end and position < len(mapped):
+            line_end = mapped.find(b'\n', position)
+            line_end = len(mapped) if line_end == -1 else line_end
+            yield mapped[position:line_end]
+            position = line_end + 1
+
+
+def _scan_chunk(task):
+    filename, start, end, tweet_filter, function = task
+    results = []
+    decoded = 0
+    for line in _iter_chunk_lines(filename, start, end):
+        line = line.strip()
+        if not line or (tweet_filter and not tweet_filter.might_match(line)):
+            continue
+        tweet = json.loads(line)
+        decoded += 1
+        if tweet_filter and not tweet_filter.matches(tweet):
+            continue
+        results.append(function(tweet) if function else tweet)
+    return results, decoded
+
+
+def split_chunks(filenames, chunk_bytes = 64 * 1024 * 1024):
+    """ Returns (filename, start, end) byte intervals of about 'chunk_bytes' for
+        each shard. Compressed shards are a single chunk.
+    """
+    chunks = []
+    for filename in filenames:
+        size = os.path.getsize(filename)
+        if filename.endswith('.gz') or size <= chunk_bytes:
+            chunks.append((filename, 0, size))
+            continue
+        for start in range(0, size, chunk_bytes):
+            chunks.append((filename, start, min(start + chunk_bytes, size)))
+    return chunks
+
+
+def scan(filenames, tweet_filter = None, processes = None, function = None, chunk_bytes = 64 * 1024 * 1024):
+    """ Yields the tweets of the JSON lines shards 'filenames' matching
+    'tweet_filter' (a TweetFilter, None = all tweets), or function(tweet) if
+    'function' is given ('function' must be picklable, e.g. a module level
+    function). The shards are scanned in chunks of about 'chunk_bytes' by a pool
+    of 'processes' processes (default = number of CPUs; 1 = no pool). The order
+    of the results is not kept across chunks.
+    """
+    tasks = [ (filename, start, end, tweet_filter, function) for filename, start, end in split_chunks(filenames, chunk_bytes) ]
+    if processes == 1:
+        for task in tasks:
+            yield from _scan_chunk(task)[0]
+        return
+    with multiprocessing.Pool(processes) as pool:
+        for results, _ in pool.imap_unordered(_scan_chunk, tasks):
+            yield from results
+
+
+def count(filenames, tweet_filter = None, processes = None, chunk_bytes = 64 * 1024 * 1024):
+    """ Returns a tuple (number of matching tweets, number of decoded lines),
+        showing how many lines the pushed down filter avoided decoding.
+    """
+    tasks = [ (filename, start, end, tweet_filter, _one) for filename, start, end in split_chunks(filenames, chunk_bytes) ]
+    if processes == 1:
+        outcomes = [ _scan_chunk(task) for task in tasks ]
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            outcomes = pool.map(_scan_chunk, tasks)
+    return sum(len(results) for results, _ in outcomes), sum(decoded for _, decoded in outcomes)
+
+
+def _one(tweet):
+    return 1
@@ -0,0 +1,444 @@
+#!/usr/bin/env python3
+
+
+""" Long-running collector daemon. It keeps a warm TwitterReader (connection,
+    bearer token and rate limits knowledge) and accepts collecting jobs through a
+    local HTTP API, on a localhost TCP port or on a Unix socket. Jobs are run by
+    a scheduler.JobScheduler, so jobs of different resources run in parallel,
+    and their results are streamed to a sink file per job (JSON lines,
+    optionally gzip compressed) in the sink directory.
+
+    API (JSON bodies and responses):
+        POST /jobs          queues a job: {"type": <type>, "params": {...}, "group": <group>, "priority": <int>}
+                            and returns {"job_id": <id>}. Types and their params:
+                                timeline    user_id, since_id, since, until (ISO 8601 datetimes), extended
+                                search      expr, language, max_results, since_id, max_id, since, until
+                                hydrate     tweet_ids (list) or tweet_ids_filename (relative to the input directory), extended, concurrency
+                                graph       screen_name, direction ("friends" or "followers")
+        GET /jobs           lists the jobs
+        GET /jobs/<id>      job status and progress (number of records written)
+        GET /limits         current rate limits of the reader
+        GET /scheduler      queued jobs per resource and dispatched jobs per group
+        GET /profile        wall time per call and job split in phases (with --profile)
+
+    The API accepts only requests to localhost without a foreign Origin, and
+    POSTs with the application/json content type, so web pages open in a
+    browser can't queue jobs (a cross-origin JSON POST needs a CORS preflight,
+    which the API doesn't answer). With --token_filename, every request must
+    also carry the header 'Authorization: Bearer <token>'. Hydrate jobs read
+    id files only from the input directory (--input_dir).
+
+    Example:
+        ./daemon.py -c credentials.json -e /data/sinks -p 8765 &
+        curl -X POST -H 'Content-Type: application/json' -d '{"type": "timeline", "params": {"user_id": "783214"}}' localhost:8765/jobs
+"""
+
+
+import os
+import hmac
+import gzip
+import json
+import time
+import argparse
+import logging
+import pprint
+import datetime
+import threading
+import socketserver
+import http.server
+import twitter
+import scheduler
+import transport
+
+
+class CollectorDaemon:
+
+
+    _reader                         = None
+    _scheduler                      = None
+    _sink_dir                       = None
+    _compress                       = None
+    _input_dir                      = None                              # directory of the id files of hydrate jobs, None if disabled
+    _jobs                           = None
+    _jobs_lock                      = None
+    _next_job_id                    = 0
+    _logger                         = None
+
+
+    def __init__(self, reader, sink_dir, compress = False, group_weights = None, input_dir = None):
+        self._reader = reader
+        self._scheduler = scheduler.JobScheduler(reader, group_weights=group_weights)
+        self._sink_dir = sink_dir
+        self._compress = compress
+        self._input_dir = os.path.realpath(input_dir) if input_dir else None
+        self._jobs = {}
+        self._jobs_lock = threading.Lock()
+        self._logger = logging.getLogger(self.__class__.__name__)
+        os.makedirs(sink_dir, exist_ok=True)
+
+
+    def _update_job(self, job, **values):
+        """ Sets job values read by job_status() from the API threads.
+        """
+        with self._jobs_lock:
+            job.update(values)
+
+
+    def _input_filename(self, filename):
+        """ Returns the path of 'filename' inside the input directory, refusing
+            the paths out of it (absolute paths, '..', symbolic links).
+        """
+        if self._input_dir is None:
+            raise ValueError('tweet_ids_filename requires an input directory (--input_dir).')
+        path = os.path.realpath(os.path.join(self._input_dir, str(filename)))
+        if os.path.commonpath([path, self._input_dir]) != self._input_dir:
+            raise ValueError('tweet_ids_filename {} is out of the input directory.'.format(filename))
+        return path
+
+
+    def _open_sink(self, job):
+        filename = os.path.join(self._sink_dir, '{}.jsonl'.format(job['job_id']))
+        sink = filename + ('.gz' if self._compress else '')
+        self._update_job(job, sink=sink)
+        if self._compress:
+            return gzip.open(sink, mode='xt', encoding='ascii')
+        return open(sink, mode='xt', encoding='ascii')
+
+
+    def _write_pages(self, job, pages):
+        """ Writes the records of each page of 'pages' (an iterable of record
+            lists) as soon as it is retrieved, updating the job progress.
+        """
+        with self._open_sink(job) as fd:
+            for records in pages:
+                with self._reader.profile_phase('output'):
+                    for record in records:
+                        fd.write(json.dumps(record, sort_keys=True, ensure_ascii=True))
+                        fd.write('\n')
+                    fd.flush()
+                self._update_job(job, written=job['written'] + len(records))
+
+
+    @staticmethod
+    def _datetime(value):
+        return datetime.datetime.fromisoformat(value) if value else None
+
+
+    def _run_timeline(self, reader, job, params):
+        pages = reader.iter_user_timeline_pages(params['user_id'],
+                                                since_id=params.get('since_id'),
+                                                extended=params.get('extended', False),
+                                                since=self._datetime(params.get('since')),
+                                                until=self._datetime(params.get('until')),
+                                               )
+        self._write_pages(job, ( tweets for tweets, _, _ in pages ))
+
+
+    def _run_search(self, reader, job, params):
+        pages = reader.iter_search_expression_pages(params['expr'],
+                                                    language=params.get('language', 'en'),
+                                                    max_results=params.get('max_results', 0),
+                                                    since_id=params.get('since_id'),
+                                                    max_id=params.get('max_id'),
+                                                    since=self._datetime(params.get('since')),
+                                                    until=self._datetime(params.get('until')),
+                                                   )
+        self._write_pages(job, pages)
+
+
+    def _run_hydrate(self, reader, job, params):
+        with self._open_sink(job) as fd:
+            retrieved, missing = reader.hydrate_tweets_stream(params.get('tweet_ids') or params['tweet_ids_filename'],
+                                                              fd,
+                                                              extended=params.get('extended', False),
+                                                              concurrency=params.get('concurrency', 1),
+                                                             )
+        self._update_job(job, written=retrieved, missing=missing)
+
+
+    def _run_graph(self, reader, job, params):
+        direction = params.get('direction', 'friends')
+        if direction not in ('friends', 'followers'):
+            raise Exception('Invalid graph direction {}.'.format(direction))
+        self._write_pages(job, reader.iter_neighbour_pages(params['screen_name'], direction))
+
+
+    _job_types = {'timeline'    : ('/statuses/user_timeline', _run_timeline),
+                  'search'      : ('/search/tweets', _run_search),
+                  'hydrate'     : ('/statuses/lookup', _run_hydrate),
+                  'graph'       : (None, _run_graph),       # resource depends on the direction
+                 }
+
+
+    def submit(self, job_type, params, group = 'default', priority = 0):
+        if job_type not in self._job_types:
+            raise ValueError('Invalid job type {}. Valid types: {}.'.format(job_type, ', '.join(sorted(self._job_types))))
+        if not isinstance(params, dict):
+            raise ValueError('Invalid job params {!r}, expected an object.'.format(params))
+        if job_type == 'hydrate' and params.get('tweet_ids_filename'):
+            params = dict(params, tweet_ids_filename=self._input_filename(params['tweet_ids_filename']))
+        resource, function = self._job_types[job_type]
+        if job_type == 'graph':
+            resource = '/followers/list' if params.get('direction') == 'followers' else '/friends/list'
+        with self._jobs_lock:
+            self._next_job_id += 1
+            job = {'job_id'     : self._next_job_id,
+                   'type'       : job_type,
+                   'params'     : params,
+                   'group'      : group,
+                   'priority'   : priority,
+                   'submitted'  : time.time(),
+                   'written'    : 0,
+                  }
+
+        def run(reader):
+            self._update_job(job, started=time.time())
+            try:
+                with reader.profile_job('{}-{}'.format(job_type, job['job_id'])):
+                    function(self, reader, job, params)
+            finally:
+                self._update_job(job, finished=time.time())
+        job['future'] = self._scheduler.submit(scheduler.Job(resource, run, group=group, priority=priority, name='{}-{}'.format(job_type, job['job_id'])))
+        with self._jobs_lock:
+            self._jobs[job['job_id']] = job
+        self._logger.info('Job {} ({}) queued.'.format(job['job_id'], job_type))
+        return job['job_id']
+
+
+    def job_status(self, job_id):
+        with self._jobs_lock:       # the worker threads update the job
+            status = { key: value for key, value in self._jobs[job_id].items() if key != 'future' }
+            future = self._jobs[job_id]['future']
+        if future.cancelled():
+            status['status'] = 'cancelled'
+        elif not future.done():
+            status['status'] = 'running' if 'started' in status else 'queued'
+        elif future.exception():
+            status['status'] = 'failed'
+            status['error'] = str(future.exception())
+        else:
+            status['status'] = 'done'
+        return status
+
+
+    def jobs(self):
+        with self._jobs_lock:
+            job_ids = sorted(self._jobs)
+        return [ self.job_status(job_id) for job_id in job_ids ]
+
+
+    def limits(self):
+        return self._reader.get_rate_limits()
+
+
+    def scheduler_status(self):
+        return {'pending'       : self._scheduler.pending(),
+                'dispatched'    : self._scheduler.dispatched(),
+               }
+
+
+    def profile(self):
+        return self._reader.get_profile()
+
+
+    def shutdown(self):
+        self._scheduler.shutdown(cancel_pending=True)
+
+
+class _RequestHandler(http.server.BaseHTTPRequestHandler):
+
+
+    daemon = None       # set in the server subclass
+    token = None        # required bearer token, None if disabled
+    _local_hosts = ('localhost', '127.0.0.1', '[::1]')
+
+
+    def address_string(self):
+        return self.client_address[0] if self.client_address else 'unix-socket'
+
+
+    def log_message(self, format, *args):
+        logging.getLogger(self.__class__.__name__).debug(format % args)
+
+
+    def _send_json(self, obj, status = 200):
+        body = json.dumps(obj, sort_keys=True).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+    def _is_local(self, value):
+        """ Returns whether the host of a Host header or Origin URL is localhost
+            (with any port), refusing DNS rebinding and cross-origin requests.
+        """
+        host = value.split('://', 1)[-1].split('/', 1)[0]
+        if host.startswith('['):
+            host = host[:host.index(']') + 1] if ']' in host else host
+        else:
+            host = host.rsplit(':', 1)[0]
+        return host.lower() in self._local_hosts
+
+
+    def _authorized(self):
+        """ Checks the Host, Origin and (if a token is configured) Authorization
+            headers, sending an error response if the request is refused.
+        """
+        if not self._is_local(self.headers.get('Host', 'localhost')) or ('Origin' in self.headers and not self._is_local(self.headers['Origin'])):
+            self._send_json({'error': 'Forbidden.'}, 403)
+            return False
+        if self.token is not None and not hmac.compare_digest(self.headers.get('Authorization', '').encode('utf-8'), ('Bearer ' + self.token).encode('utf-8')):
+            self._send_json({'error': 'Unauthorized.'}, 401)
+            return False
+        return True
+
+
+    def do_GET(self):
+        if not self._authorized():
+            return
+        path = self.path.rstrip('/')
+        if path == '/jobs':
+            return self._send_json(self.daemon.jobs())
+        if path.startswith('/jobs/'):
+            try:
+                return self._send_json(self.daemon.job_status(int(path[len('/jobs/'):])))
+            except (KeyError, ValueError):
+                return self._send_json({'error': 'Job not found.'}, 404)
+        if path == '/limits':
+            return self._send_json(self.daemon.limits())
+        if path == '/scheduler':
+            return self._send_json(self.daemon.scheduler_status())
+        if path == '/profile':
+            return self._send_json(self.daemon.profile())
+        self._send_json({'error': 'Not found.'}, 404)
+
+
+    def do_POST(self):
+        if not self._authorized():
+            return
+        if self.path.rstrip('/') != '/jobs':
+            return self._send_json({'error': 'Not found.'}, 404)
+        if self.headers.get('Content-Type', '').split(';')[0].strip().lower() != 'application/json':
+            return self._send_json({'error': 'Content-Type must be application/json.'}, 415)
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8'))
+            if not isinstance(request, dict):
+                raise ValueError('expected a JSON object')
+            job_id = self.daemon.submit(request['type'], request.get('params', {}), request.get('group', 'default'), request.get('priority', 0))
+        except (ValueError, KeyError, TypeError) as e:
+            return self._send_json({'error': 'Invalid job: {}'.format(e)}, 400)
+        self._send_json({'job_id': job_id}, 201)
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(daemon, port = None, unix_socket = None, token = None):
+    """ Returns an HTTP server for the daemon API, listening on localhost:'port' or
+        on the Unix socket 'unix_socket'. If 'token' is given, the requests must
+        carry it as a bearer token.
+    """
+    handler = type('RequestHandler', (_RequestHandler,), {'daemon': daemon, 'token': token})
+    if unix_socket:
+        if os.path.exists(unix_socket):
+            os.remove(unix_socket)
+        return _UnixHTTPServer(unix_socket, handler)
+    return http.server.ThreadingHTTPServer(('127.0.0.1', port), handler)
+
+
+def command_line_parsing():
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--credentials_filename', '-c',
+                        required=True,
+                        help='Filename (in JSON format) with the Twitter credentials.')
+    parser.add_argument('--sink_dir', '-e',
+                        required=True,
+                        help='Directory where the job results are written (created if absent).')
+    parser.add_argument('--port', '-p',
+                        type=int,
+                        default=8765,
+                        help='Localhost TCP port of the API. Default = 8765.')
+    parser.add_argument('--unix_socket', '-u',
+                        default=None,
+                        help='Unix socket of the API, instead of the TCP port.')
+    parser.add_argument('--token_filename', '-k',
+                        default=None,
+                        help='File with the token required in the Authorization header of the API requests (Bearer <token>). Default = no token.')
+    parser.add_argument('--input_dir', '-i',
+                        default=None,
+                        help='Directory of the id files of hydrate jobs (tweet_ids_filename). Default = no id files, only id lists.')
+    parser.add_argument('--compress', '-z',
+                        action='store_true',
+                        default=False,
+                        help='Compress the job results with gzip.')
+    parser.add_argument('--prefetch', '-f',
+                        type=int,
+                        default=0,
+                        help='Number of pages requested ahead in paginated calls. Default = 0 (no prefetching).')
+    parser.add_argument('--transport', '-t',
+                        choices=['http1', 'pooled', 'http2'],
+                        default='http1',
+                        help='HTTP transport: http1 = a connection per thread (default); pooled = a shared pool of connections; http2 = concurrent requests multiplexed over one connection (requires httpx[http2]).')
+    parser.add_argument('--profile', '-P',
+                        action='store_true',
+                        default=False,
+                        help='Account the wall time of the jobs per phase (see profiler.py), reported at /profile and at the end.')
+    parser.add_argument('--debug', '-d',
+                        type=int,
+                        choices = [0, 1, 2],
+                        nargs='?',
+                        const=1,
+                        default=0,
+                        help='Print debug information. 0 = no debug (default); 1 = normal debug; 2 = deeper debug (HTTP debug).')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    # parsing arguments
+    args = command_line_parsing()
+
+    # logging configuration
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO, format='[%(asctime)s] - %(name)s - %(levelname)s - %(message)s')
+
+    logging.info('Starting collector daemon with the following parameters:\n{}'.format(pprint.pformat(vars(args))))
+
+    logging.info('Reading credentials data ...')
+    with open(args.credentials_filename, mode= 'rt', encoding='ascii') as fd:
+        credentials = json.load(fd)
+
+    logging.info('Connecting to Twitter ...')
+    if args.transport == 'http2':
+        http_transport = transport.HTTP2Transport(twitter.TwitterReader._endpoint)
+    elif args.transport == 'pooled':
+        http_transport = transport.PooledTransport(twitter.TwitterReader._endpoint, debug=(args.debug == 2))
+    else:
+        http_transport = None       # default transport
+    twitter_conn = twitter.TwitterReader(credentials['app_name'],
+                                         credentials['consumer_key'],
+                                         credentials['consumer_secret'],
+                                         debug_connection = (args.debug == 2),
+                                         prefetch = args.prefetch,
+                                         transport = http_transport,
+                                         profile = args.profile,
+                                        )
+    twitter_conn.connect()
+
+    token = None
+    if args.token_filename:
+        with open(args.token_filename, mode='rt', encoding='ascii') as fd:
+            token = fd.read().strip()
+
+    daemon = CollectorDaemon(twitter_conn, args.sink_dir, compress=args.compress, input_dir=args.input_dir)
+    server = make_server(daemon, port=args.port, unix_socket=args.unix_socket, token=token)
+    logging.info('Listening on {} ...'.format(args.unix_socket or 'localhost:{}'.format(args.port)))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logging.info('Interrupted. Shutting down ...')
+    server.server_close()
+    daemon.shutdown()
+    twitter_conn.cleanup()
+    logging.info('Finished.')
@@ -107,6 +107,10 @@ if __name__ == '__main__':
                 logging.warning(''.join(['\t', str(tsee), ' Sleeping for ', str(retry_sleep_sec), ' seconds and retrying ...']))
                 time.sleep(retry_sleep_sec)
                 continue
+            except twitter.CircuitOpenException as coe:
+                logging.warning(''.join(['\t', str(coe), ' Sleeping and retrying ...']))
+                time.sleep(coe.retry_in_sec)
+                continue
             except Exception as e:
                 logging.error(''.join(['Error trying to search tweets by expression ', expr, ' . Error: ', str(e), ' Aborting the search for the expression \'', expr , '\' ...']))
                 traceback.print_exc()
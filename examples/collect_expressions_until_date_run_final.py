@@ -3,9 +3,12 @@
 
 '''
 Code to search Twitter for tweets based on a list of expressions. The
-    recovered tweets are stored in a file per expression in JSON format with the
-    filename pattern <id>.json where <id> is the expression id indicated by the
-    file expression_ids.txt .
+    recovered tweets are stored in a gzip compressed file per expression in JSON
+    format with the filename pattern <id>.json.gz (or in JSON lines format,
+    one tweet per line, with the pattern <id>.jsonl.gz, see corpus_reader.py)
+    where <id> is the expression id indicated by the file expression_ids.txt .
+    With zstd compression the suffix is .zst instead of .gz (see
+    compression.py).
 '''
 
 
@@ -17,10 +20,12 @@ import pprint
 import traceback
 import os
 import twitter
+import corpus_reader
+import compression
 import time
 import json
 import shutil
-import gzip
+import datetime
 
 
 def command_line_parsing():
@@ -52,6 +57,25 @@ def command_line_parsing():
     parser.add_argument('--until_date', '-u',
                         default='',
                         help='Maximum date to receover. Format yyyy-mm-dd. Default = today.')
+    parser.add_argument('--output_format', '-o',
+                        choices=['json', 'jsonl'],
+                        default='json',
+                        help='Format of the output files: json = a JSON array per file (default); jsonl = JSON lines, one tweet per line.')
+    parser.add_argument('--compression', '-z',
+                        choices=['gzip', 'zstd'],
+                        default='gzip',
+                        help='Compression of the output files: gzip (default) or zstd (requires the zstandard package).')
+    parser.add_argument('--compression_level', '-L',
+                        type=int,
+                        default=None,
+                        help='Compression level. Default = 9 for gzip and 3 for zstd.')
+    parser.add_argument('--compression_threads', '-T',
+                        type=int,
+                        default=0,
+                        help='Number of zstd compression threads (-1 = number of CPUs). Default = 0 (no extra threads).')
+    parser.add_argument('--zstd_dictionary', '-D',
+                        default=None,
+                        help='Zstd dictionary trained from sample records (see compression.py), copied to the destination directory. Default = no dictionary.')
     parser.add_argument('--stop_on_error', '-s',
                         action='store_true',
                         default=False,
@@ -81,6 +105,8 @@ if __name__ == '__main__':
         sys.exit(1)
     os.mkdir(args.destination_dir)
 
+    dictionary = compression.install_dictionary(args.zstd_dictionary, args.destination_dir) if args.zstd_dictionary else None
+
     logging.info('Reading credentials data ...')
     with open(args.credentials_filename, mode= 'rt', encoding='ascii') as fd:
         credentials = json.load(fd)
@@ -108,32 +134,45 @@ if __name__ == '__main__':
                                         )
     twitter_conn.connect()
 
+    until = datetime.datetime.strptime(args.until_date, '%Y-%m-%d') if args.until_date else None     # tweets created until the end of the previous day, in UTC
+
     logging.info('Retrieving tweets ...')
     for expr in exprs:
         retry = True
         while retry:
             logging.debug(''.join(['\tSearching tweets by expression \'', expr, '\' , id = ', str(expr_ids[expr]), '...']))
-            filename = os.path.join(args.destination_dir, str(expr_ids[expr]) + '.json.gz')
+            filename = os.path.join(args.destination_dir, '{}.{}{}'.format(expr_ids[expr], args.output_format, compression.suffix(args.compression)))
             if os.path.exists(filename):
                 filename_backup = filename + '.backup'
                 logging.warning('File {} exists (maybe due to a previous error). Backing up to {} ...'.format(filename, filename_backup))
                 shutil.copy2(filename, filename_backup)
-            with gzip.open(filename, mode='wt', encoding='ascii') as fd:
+            with compression.open_sink(filename, mode='wt', encoding='ascii',
+                                       codec=args.compression,
+                                       level=args.compression_level,
+                                       threads=args.compression_threads,
+                                       dictionary=dictionary,
+                                      ) as fd:
                 try:
                     tweets = twitter_conn.search_expression(expr,
                                                             language=args.language,
                                                             max_results=args.max_results_per_expression,
-                                                            retweets=True,
                                                             since_id=args.since_id,
-                                                            until=args.until_date,
-                                                            fd=fd,
+                                                            until=until,
                                                            )
+                    if args.output_format == 'jsonl':
+                        corpus_reader.write_json_lines(fd, tweets)
+                    else:
+                        json.dump(tweets, fd, sort_keys=True, ensure_ascii=True)
                     retry = False
                 except twitter.TwitterServerErrorException as tsee:
                     retry_sleep_sec = 60
                     logging.warning(''.join(['\t', str(tsee), ' Sleeping for ', str(retry_sleep_sec), ' seconds and retrying ...']))
                     time.sleep(retry_sleep_sec)
                     continue
+                except twitter.CircuitOpenException as coe:
+                    logging.warning(''.join(['\t', str(coe), ' Sleeping and retrying ...']))
+                    time.sleep(coe.retry_in_sec)
+                    continue
                 except Exception as e:
                     logging.error(''.join(['Error trying to search tweets by expression ', expr, ' . Error: ', str(e), ' Aborting the search for the expression \'', expr , '\' ...']))
                     traceback.print_exc()
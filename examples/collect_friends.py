@@ -1,12 +1,34 @@
 #!/usr/bin/env python3
 
 
+""" Collects the ego network of a user: its tweets with their retweeters, its
+    friends and the friends and followers of each friend.
+
+    The results are written incrementally, so the memory use doesn't grow with
+    the number of friends and an interrupted collection can be resumed (with
+    --resume) skipping everything already on disk:
+
+        user.json                       the user id and screen name
+        tweets.jsonl                    one tweet (id, text and retweeters) per line
+        friends.json                    the friends kept after the high connection filter
+        friends_of_friends.jsonl        one friend (id, screen_name and neighbours) per line
+        followers_of_friends.jsonl      idem, with the followers of each friend
+        friends_of_friends/             CSR graph stores (see graph_store.py) built
+        followers_of_friends/           from the JSON lines files at the end
+
+    Friends whose lists can't be retrieved (not found, suspended or protected)
+    are written with no neighbours, so they are not requested again.
+"""
+
+
 import sys
 sys.path.append('..')
 import argparse
 import logging
 import os
 import twitter
+import graph_store
+import response_cache
 import time
 import json
 import traceback
@@ -27,6 +49,20 @@ def command_line_parsing():
                         type=int,
                         default=200,
                         help='Maximum threshold for number of followers and friends a friend must have not to be excluded from the analysis (since it is considered as a celebrity or a bot). For no limiting, use 0 for this value. Default = 200.')
+    parser.add_argument('--concurrency', '-n',
+                        dest='concurrency',
+                        type=int,
+                        default=4,
+                        help='Number of tweets whose retweeters are requested at once. Default = 4.')
+    parser.add_argument('--cache-db', '-b',
+                        dest='cache_db',
+                        default=None,
+                        help='SQLite database caching the Twitter responses (created if absent), so repeated runs answer the same requests from the disk without spending rate limits. Default = no cache.')
+    parser.add_argument('--resume', '-r',
+                        dest='resume',
+                        action='store_true',
+                        default=False,
+                        help='Resume an interrupted collection in an existing destination directory, skipping the tweets and friends already written.')
     parser.add_argument('--debug', '-d',
                         dest='debug',
                         type=int,
@@ -38,14 +74,27 @@ def command_line_parsing():
     return parser.parse_args()
 
 
-def add_twitter_screen_name(twitter_conn, tweets):
-    user_ids = set()
+def add_twitter_screen_name(twitter_conn, tweets, translation_table=None):
+    """ Replaces the retweeter ids of 'tweets' by {'id', 'screen_name'} dicts.
+        'translation_table' (id -> screen name) caches the screen names across
+        calls. The unknown ids are loaded together, so they are requested in
+        '/users/lookup' requests of up to 100 ids, and retweeters no longer
+        available get an empty screen name.
+    """
+    if translation_table is None:
+        translation_table = {}
+    futures = {}
     for tweet in tweets:
         for retweeter in tweet['retweeters']:
-            user_ids.add(retweeter)
-    translation_table = {}
-    for user_id in user_ids:
-        translation_table[user_id] = twitter_conn.get_user_info(str(user_id))['screen_name']
+            if retweeter not in translation_table and retweeter not in futures:
+                futures[retweeter] = twitter_conn.load_user_info(retweeter)
+    twitter_conn.flush_lookups()
+    for user_id, future in futures.items():
+        try:
+            translation_table[user_id] = future.result()['screen_name']
+        except (twitter.TwitterUserNotFoundException, twitter.TwitterUserSuspendedException):
+            logging.debug('\t\tRetweeter id = {} not available.'.format(user_id))
+            translation_table[user_id] = ''
     for tweet in tweets:
         new_retweeters = []
         for retweeter in tweet['retweeters']:
@@ -64,176 +113,167 @@ def filter_twitter_high_connected(users, threshold):
     return new_list
 
 
-def retrieve_twitter_data(twitter_userid, dest_dir, connectivity_threshold):
+def retrieve_with_retries(twitter_conn, description, function, *args):
+    """ Calls function(*args), retrying on server errors. Returns None if the
+        user is not found, suspended or protected and exits on other errors.
+    """
+    while True:
+        try:
+            return function(*args)
+        except (twitter.TwitterUserNotFoundException, twitter.TwitterUserSuspendedException, twitter.ProtectedTweetsException) as e:
+            logging.warning(''.join(['\t\t', str(e), ' Aborting ', description, ' ...']))
+            return None
+        except twitter.TwitterServerErrorException as tsee:
+            retry_sleep_sec = 60
+            logging.warning(''.join(['\t\t', str(tsee), ' Sleeping for ', str(retry_sleep_sec), ' seconds and retrying ...']))
+            time.sleep(retry_sleep_sec)
+            twitter_conn.reconnect()
+        except twitter.CircuitOpenException as coe:
+            logging.warning(''.join(['\t\t', str(coe), ' Sleeping and retrying ...']))
+            time.sleep(coe.retry_in_sec)
+        except Exception as e:
+            logging.error(''.join(['\t\tError retrieving ', description, '. Error message: ', str(e), ' Aborting ...']))
+            traceback.print_exc()
+            logging.error('Exiting on error ...')
+            twitter_conn.cleanup()
+            sys.exit(1)
+
+
+def write_json(filename, data):
+    """ Writes 'data' to 'filename' through a temporary file, so an interrupted
+        write never leaves a partial file behind.
+    """
+    with open(filename + '.tmp', mode='wt', encoding='ascii') as fd:
+        json.dump(data, fd, indent=4, sort_keys=True)
+    os.replace(filename + '.tmp', filename)
+
+
+def read_written_ids(filename):
+    """ Returns the set of ids of the records of a JSON lines file written by a
+        previous run, truncating a partially written last line.
+    """
+    ids = set()
+    if not os.path.exists(filename):
+        return ids
+    with open(filename, mode='r+b') as fd:
+        offset = 0
+        for line in fd:
+            try:
+                ids.add(json.loads(line.decode('ascii'))['id'])
+            except ValueError:
+                logging.warning('\t\tTruncating partially written line of {} ...'.format(filename))
+                fd.truncate(offset)
+                break
+            offset += len(line)
+    return ids
+
+
+def write_json_line(fd, record):
+    fd.write(json.dumps(record, sort_keys=True))
+    fd.write('\n')
+    fd.flush()      # each record is on disk as soon as it is collected
+
+
+def retrieve_tweets(twitter_conn, twitter_userid, filename, concurrency):
+    """ Writes a line to 'filename' with the retweeters of each tweet not yet
+        written. The retweeters are requested concurrently while the timeline
+        is paged, and tweets never retweeted cost no request.
+    """
+    written = read_written_ids(filename)
+    if written:
+        logging.info('\t\t{} tweets already written, skipping them ...'.format(len(written)))
+    translation_table = {}
+    with open(filename, mode='at', encoding='ascii') as fd:
+        for tweet, retweeters in twitter_conn.iter_retweet_network(twitter_userid, concurrency, skip_ids=written):
+            element = {'text'       : tweet['text'],
+                       'id'         : tweet['id'],
+                       'retweeters' : retweeters,
+                      }
+            add_twitter_screen_name(twitter_conn, [element], translation_table)
+            write_json_line(fd, element)
+
+
+def retrieve_neighbours(twitter_conn, friends, function, description, filename):
+    """ Writes a line to 'filename' with the neighbours returned by
+        function(screen_name) of each friend not yet written.
+    """
+    written = read_written_ids(filename)
+    if written:
+        logging.info('\t\t{} of {} friends already written, skipping them ...'.format(len(written), len(friends)))
+    with open(filename, mode='at', encoding='ascii') as fd:
+        for i, friend in enumerate(friends, 1):
+            if friend['id'] in written:
+                continue
+            logging.debug('{}/{}'.format(i, len(friends)))
+            neighbours = retrieve_with_retries(twitter_conn, ''.join([description, ' for user ', friend['screen_name']]), function, friend['screen_name']) or []
+            write_json_line(fd, {'id'           : friend['id'],
+                                 'screen_name'  : friend['screen_name'],
+                                 'neighbours'   : [ {'id': element['id'], 'screen_name': element['screen_name']} for element in neighbours ],
+                                })
+
+
+def retrieve_twitter_data(twitter_userid, dest_dir, connectivity_threshold, concurrency, cache_db=None):
     logging.info('\tConnecting to Twitter ...')
     app_name        = '<your application name>'
     consumer_key    = '<your application consumer key>'
     consumer_secret = '<your application consumer secret>'
+    cache = response_cache.ResponseCache(cache_db) if cache_db else None
     twitter_conn = twitter.TwitterReader(app_name,
                                          consumer_key,
                                          consumer_secret,
-                                         debug_connection = (args.debug == 2)
+                                         debug_connection = (args.debug == 2),
+                                         cache = cache,
                                         )
     twitter_conn.connect()
 
     logging.info('\tRetrieving user information and retweeters ...')
-    retry = True
-    while retry:
+    user_filename = os.sep.join([dest_dir, 'user.json'])
+    if os.path.exists(user_filename):
+        with open(user_filename, mode='rt', encoding='ascii') as fd:
+            user = json.load(fd)
+    else:
         logging.debug(''.join(['\t\tRetrieving user information and timeline from user ', twitter_userid, ' ...']))
-        try:
-            user_info = twitter_conn.get_user_info(twitter_userid)
-            user = {'id'            :user_info['id'],
-                    'screen_name'   :user_info['screen_name'],
-                   }
-            with open(os.sep.join([dest_dir, 'user.json']), mode='wt', encoding='ascii') as fd:
-                json.dump(user, fd, indent=4, sort_keys=True)
-            tweets = twitter_conn.get_user_timeline(twitter_userid)
-            tweets_retweets = []
-            for tweet in tweets:
-                element = {}
-                element['text'] = tweet['text']
-                element['id'] = tweet['id']
-                element['retweeters'] = twitter_conn.get_retweeters(tweet['id'])
-                tweets_retweets.append(element)
-            logging.debug('\t\tRecovering screen_name attributes ...')
-            tweets_retweets = add_twitter_screen_name(twitter_conn, tweets_retweets)
-            with open(os.sep.join([dest_dir, 'tweets.json']), mode='wt', encoding='ascii') as fd:
-                json.dump(tweets_retweets, fd, indent=4, sort_keys=True)
-        except twitter.TwitterUserNotFoundException as tunfe:
-            logging.warning(''.join(['\t\t', str(tunfe), ' Aborting user timeline ...']))
-        except twitter.TwitterUserSuspendedException as tuse:
-            logging.warning(''.join(['\t\t', str(tuse), ' Aborting user timeline ...']))
-        except twitter.ProtectedTweetsException as pte:
-            logging.warning(''.join(['\t\t', str(pte), ' Aborting user timeline ...']))
-        except twitter.TwitterServerErrorException as tsee:
-            retry_sleep_sec = 60
-            logging.warning(''.join(['\t\t', str(tsee), ' Sleeping for ', str(retry_sleep_sec), ' seconds and retrying ...']))
-            time.sleep(retry_sleep_sec)
-            twitter_conn.reconnect()
-            continue
-        except Exception as e:
-            logging.error(''.join(['\t\tError retrieving data for user ', twitter_userid, '. Error message: ', str(e), ' Aborting user timeline ...']))
-            traceback.print_exc()
+        user_info = retrieve_with_retries(twitter_conn, ''.join(['information of user ', twitter_userid]), twitter_conn.get_user_info, twitter_userid)
+        if user_info is None:
             logging.error('Exiting on error ...')
             twitter_conn.cleanup()
             sys.exit(1)
-        retry = False
+        user = {'id'            :user_info['id'],
+                'screen_name'   :user_info['screen_name'],
+               }
+        write_json(user_filename, user)
+    retrieve_with_retries(twitter_conn, ''.join(['timeline and retweeters of user ', twitter_userid]), retrieve_tweets, twitter_conn, twitter_userid, os.sep.join([dest_dir, 'tweets.jsonl']), concurrency)
 
     logging.info('\tRetriving friends ...')
-    retry = True
-    while retry:
-        try:
-            temp = twitter_conn.get_friends(user['screen_name'])
-        except twitter.TwitterUserNotFoundException as tunfe:
-            logging.warning(''.join(['\t\t', str(tunfe), ' Aborting friends list ...']))
-        except twitter.TwitterUserSuspendedException as tuse:
-            logging.warning(''.join(['\t\t', str(tuse), ' Aborting friends list ...']))
-        except twitter.ProtectedTweetsException as pte:
-            logging.warning(''.join(['\t\t', str(pte), ' Aborting friends list ...']))
-        except twitter.TwitterServerErrorException as tsee:
-            retry_sleep_sec = 60
-            logging.warning(''.join(['\t\t', str(tsee), ' Sleeping for ', str(retry_sleep_sec), ' seconds and retrying ...']))
-            time.sleep(retry_sleep_sec)
-            twitter_conn.reconnect()
-            continue
-        except Exception as e:
-            logging.error(''.join(['\t\tError retrieving data for user ', twitter_userid, '. Error message: ', str(e), ' Aborting friends list ...']))
-            traceback.print_exc()
-            logging.error('Exiting on error ...')
-            twitter_conn.cleanup()
-            sys.exit(1)
-        retry = False
-    temp = filter_twitter_high_connected(temp, connectivity_threshold)
-    friends = []
-    for friend in temp:
-        friends.append({
-                        'id'            : friend['id'],
-                        'screen_name'   : friend['screen_name'], 
-                       })
-    with open(os.sep.join([dest_dir, 'friends.json']), mode='wt', encoding='ascii') as fd:
-        json.dump(friends, fd, indent=4, sort_keys=True)
-
-    logging.info('\tRetriving friends of friends ...')
-    fof = {}    # friends of friends
-    i = 0
-    for friend in friends:
-        i += 1
-        logging.debug('{}/{}'.format(i, len(friends)))
-        retry = True
-        while retry:
-            try:
-                temp = twitter_conn.get_friends(friend['screen_name'])
-            except twitter.TwitterUserNotFoundException as tunfe:
-                logging.warning(''.join(['\t\t', str(tunfe), ' Aborting friends list for user ', friend['screen_name'], ' ...']))
-            except twitter.TwitterUserSuspendedException as tuse:
-                logging.warning(''.join(['\t\t', str(tuse), ' Aborting friends list for user ', friend['screen_name'], ' ...']))
-            except twitter.ProtectedTweetsException as pte:
-                logging.warning(''.join(['\t\t', str(pte), ' Aborting friends list for user ', friend['screen_name'], ' ...']))
-            except twitter.TwitterServerErrorException as tsee:
-                retry_sleep_sec = 60
-                logging.warning(''.join(['\t\t', str(tsee), ' Sleeping for ', str(retry_sleep_sec), ' seconds and retrying ...']))
-                time.sleep(retry_sleep_sec)
-                twitter_conn.reconnect()
-                continue
-            except Exception as e:
-                logging.error(''.join(['\t\tError retrieving data for user ', friend['screen_name'], '. Error message: ', str(e), ' Aborting friends list for user ', friend['screen_name'], ' ...']))
-                traceback.print_exc()
-                logging.error('Exiting on error ...')
-                twitter_conn.cleanup()
-                sys.exit(1)
-            fof[friend['screen_name']] = []
-            for element in temp:
-                fof[friend['screen_name']].append({
-                                                   'id'            : element['id'],
-                                                   'screen_name'   : element['screen_name'],
-                                                  })
-            retry = False
-    with open(os.sep.join([dest_dir, 'friends_of_friends.json']), mode='wt', encoding='ascii') as fd:
-        json.dump(fof, fd, indent=4, sort_keys=True)
-
-    logging.info('\tRetriving followers of friends ...')
-    fwof = {}  # followers of friends
-    i = 0
-    for friend in friends:
-        i += 1
-        logging.debug('{}/{}'.format(i, len(friends)))
-        retry = True
-        while retry:
-            try:
-                temp = twitter_conn.get_followers(friend['screen_name'])
-            except twitter.TwitterUserNotFoundException as tunfe:
-                logging.warning(''.join(['\t\t', str(tunfe), ' Aborting followers list for user ', friend['screen_name'], ' ...']))
-            except twitter.TwitterUserSuspendedException as tuse:
-                logging.warning(''.join(['\t\t', str(tuse), ' Aborting followers list for user ', friend['screen_name'], ' ...']))
-            except twitter.ProtectedTweetsException as pte:
-                logging.warning(''.join(['\t\t', str(pte), ' Aborting followers list for user ', friend['screen_name'], ' ...']))
-            except twitter.TwitterServerErrorException as tsee:
-                retry_sleep_sec = 60
-                logging.warning(''.join(['\t\t', str(tsee), ' Sleeping for ', str(retry_sleep_sec), ' seconds and retrying ...']))
-                time.sleep(retry_sleep_sec)
-                twitter_conn.reconnect()
-                continue
-            except Exception as e:
-                logging.error(''.join(['\t\tError retrieving data for user ', friend['screen_name'], '. Error message: ', str(e), ' Aborting friends list for user ', friend['screen_name'], ' ...']))
-                traceback.print_exc()
-                logging.error('Exiting on error ...')
-                twitter_conn.cleanup()
-                sys.exit(1)
-            fwof[friend['screen_name']] = []
-            for element in temp:
-                fwof[friend['screen_name']].append({
-                                                    'id'            : element['id'],
-                                                    'screen_name'   : element['screen_name'],
-                                                   })
-            retry = False
-    with open(os.sep.join([dest_dir, 'followers_of_friends.json']), mode='wt', encoding='ascii') as fd:
-        json.dump(fwof, fd, indent=4, sort_keys=True)
-
-    return {'user'                  : user,
-            'tweets'                : tweets_retweets,
-            'friends'               : friends,
-            'friends_of_friends'    : fof,
-            'followers_of_friends'  : fwof,
+    friends_filename = os.sep.join([dest_dir, 'friends.json'])
+    if os.path.exists(friends_filename):
+        with open(friends_filename, mode='rt', encoding='ascii') as fd:
+            friends = json.load(fd)
+    else:
+        temp = retrieve_with_retries(twitter_conn, 'friends list', twitter_conn.get_friends, user['screen_name']) or []
+        temp = filter_twitter_high_connected(temp, connectivity_threshold) if connectivity_threshold else temp
+        friends = []
+        for friend in temp:
+            friends.append({
+                            'id'            : friend['id'],
+                            'screen_name'   : friend['screen_name'],
+                           })
+        del temp
+        write_json(friends_filename, friends)
+
+    for name, function, description in (('friends_of_friends', twitter_conn.get_friends, 'friends list'),
+                                         ('followers_of_friends', twitter_conn.get_followers, 'followers list'),
+                                        ):
+        logging.info('\tRetriving {} ...'.format(name.replace('_', ' ')))
+        filename = os.sep.join([dest_dir, name + '.jsonl'])
+        retrieve_neighbours(twitter_conn, friends, function, description, filename)
+        graph_store.write_graph(os.sep.join([dest_dir, name]), *graph_store.from_json_lines(filename))
+
+    twitter_conn.cleanup()
+    if cache:
+        cache.close()
+    return {'user'      : user,
+            'friends'   : friends,
            }
 
 
@@ -248,16 +288,22 @@ if __name__ == '__main__':
                           '\n\tUser id = ', args.user_id,
                           '\n\tDestination directory = ', args.dest_dir,
                           '\n\tHigh connection threshold = ', str(args.high_connection_threshold),
+                          '\n\tConcurrency = ', str(args.concurrency),
+                          '\n\tCache database = ', str(args.cache_db),
+                          '\n\tResume = ', str(args.resume),
                           '\n\tDebug = ', str(args.debug),
                          ]))
 
     logging.info('Creating output directory ...')
     if os.path.exists(args.dest_dir):
-        logging.error(''.join(['Destination directory ', args.dest_dir, ' already exists. Quitting ...']))
-        sys.exit(1)
-    os.makedirs(args.dest_dir)
+        if not args.resume:
+            logging.error(''.join(['Destination directory ', args.dest_dir, ' already exists (use --resume to continue a collection). Quitting ...']))
+            sys.exit(1)
+        logging.info(''.join(['Resuming the collection in ', args.dest_dir, ' ...']))
+    else:
+        os.makedirs(args.dest_dir)
 
     logging.info('Collecting Twitter data ...')
-    twitter_data = retrieve_twitter_data(args.user_id, args.dest_dir, args.high_connection_threshold)
+    twitter_data = retrieve_twitter_data(args.user_id, args.dest_dir, args.high_connection_threshold, args.concurrency, args.cache_db)
 
     logging.info('Finished.')
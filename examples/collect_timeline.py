@@ -2,7 +2,8 @@
 
 
 # Code to download the timeline of a list of Twitter users. All the tweets and
-#   metadata is saved in JSON format in a directory for each user.
+#   metadata is saved in JSON format in a directory for each user (tweets
+#   optionally in JSON lines format, see corpus_reader.py).
 #
 # Pseudo-code:
 #   Read file with list of Twitter users to have their timeline downloaded
@@ -20,6 +21,9 @@ import argparse
 import logging
 import os
 import twitter
+import corpus_reader
+import timeline_coverage
+import negative_cache
 import traceback
 import json
 import time
@@ -45,11 +49,32 @@ def command_line_parsing():
                         type=int,
                         default=0,
                         help='Maximum number of tweets to be collected. Default = 0 (no maximum).')
+    parser.add_argument('--output-format', '-o',
+                        dest='output_format',
+                        choices=['json', 'jsonl'],
+                        default='json',
+                        help='Format of the tweets file: json = tweets.json with a JSON array (default); jsonl = tweets.jsonl with a tweet per line.')
+    parser.add_argument('--coverage-db', '-c',
+                        dest='coverage_db',
+                        default=None,
+                        help='SQLite database with the tweet id intervals already collected of each timeline (created if absent). A failed page is retried without requesting again the pages before it, and later runs with the same database collect only the tweets newer than the previous run. Default = no coverage database.')
+    parser.add_argument('--negative-cache-db', '-g',
+                        dest='negative_cache_db',
+                        default=None,
+                        help='SQLite database with the users found not found, suspended or protected (created if absent). Later runs with the same database skip these users without requests until their entries expire. Default = no negative cache.')
     parser.add_argument('--stop-on-error', '-s',
                         dest='stop_on_error',
                         action='store_true',
                         default=False,
                         help='Stop the collecting if an HTTP error occurs. Default = no stop.')
+    parser.add_argument('--profile', '-p',
+                        dest='profile',
+                        type=int,
+                        choices = [0, 1, 2],
+                        nargs='?',
+                        const=1,
+                        default=0,
+                        help='Report where the collecting time goes at the end. 0 = no profiling (default); 1 = wall time per phase; 2 = wall time and memory (tracemalloc).')
     parser.add_argument('--debug', '-d',
                         dest='debug',
                         type=int,
@@ -73,7 +98,11 @@ if __name__ == '__main__':
                             '\n\tdestination directory = ', args.destination_dir,
                             '\n\tmaximum number of users = ', str(args.max_number_users),
                             '\n\tmaximum number of tweets = ', str(args.max_number_tweets),
+                            '\n\toutput format = ', args.output_format,
+                            '\n\tcoverage database = ', str(args.coverage_db),
+                            '\n\tnegative cache database = ', str(args.negative_cache_db),
                             '\n\tstop on error = ', str(args.stop_on_error),
+                            '\n\tprofile = ', str(args.profile),
                             '\n\tdebug = ', str(args.debug),
                          ]))
 
@@ -91,21 +120,29 @@ if __name__ == '__main__':
     app_name        = '<your application name>'
     consumer_key    = '<your application consumer key>'
     consumer_secret = '<your application consumer secret>'
-    twitter_conn = twitter.TwitterReader(app_name, consumer_key, consumer_secret, debug_connection = (args.debug == 2) )
+    negative = negative_cache.NegativeCache(args.negative_cache_db) if args.negative_cache_db else None
+    twitter_conn = twitter.TwitterReader(app_name, consumer_key, consumer_secret, debug_connection = (args.debug == 2), profile = (args.profile > 0), trace_memory = (args.profile == 2), negative_cache = negative)
     twitter_conn.connect()
+    coverage = timeline_coverage.TimelineCoverage(args.coverage_db) if args.coverage_db else None
 
     logging.info('Retrieving Tweets ...')
     acc_users = 0
     acc_tweets = 0
     for user in users:
         user_id, user_screen_name = user.split()
+        tweets = []
         retry = True
         while retry:
             logging.debug(''.join(['\tRetrieving user information and timeline from user ', user_screen_name, ' , id = ', user_id, ' ...']))
-            user_info = tweets = None
+            user_info = None
+            if coverage is None:
+                tweets = []     # the whole timeline is requested again
             try:
                 user_info = twitter_conn.get_user_info(user_id)
-                tweets = twitter_conn.get_user_timeline(user_id, extended=True)
+                for page, covered_since_id, covered_max_id in twitter_conn.iter_user_timeline_pages(user_id, extended=True, coverage=coverage):
+                    tweets += page
+                    if coverage is not None:
+                        coverage.add(user_id, covered_since_id, covered_max_id)    # a retry requests only the intervals left
             except twitter.TwitterUserNotFoundException as tunfe:
                 logging.warning(''.join(['\t', str(tunfe), ' Aborting user timeline ...']))
             except twitter.TwitterUserSuspendedException as tuse:
@@ -119,6 +156,11 @@ if __name__ == '__main__':
                 twitter_conn.reconnect()
                 retry = True
                 continue
+            except twitter.CircuitOpenException as coe:
+                logging.warning(''.join(['\t', str(coe), ' Sleeping and retrying ...']))
+                time.sleep(coe.retry_in_sec)
+                retry = True
+                continue
             except Exception as e:
                 logging.error(''.join(['\tError retrieving data for user ', user_screen_name, ' , id = ', user_id, '. Error message: ', str(e)]))
                 traceback.print_exc()
@@ -134,17 +176,28 @@ if __name__ == '__main__':
                 continue
             retry = False
 
-        if (not user_info) or (not tweets):     # error getting user data, abort
+        if (not user_info) or (not tweets):     # error getting user data (or no new tweets), abort
+            if coverage is not None:
+                if user_info:
+                    coverage.commit()   # no new tweets: the intervals were covered without tweets to save
+                else:
+                    coverage.rollback() # the tweets of the pages covered before the error are discarded
             continue
 
         logging.debug('\tSaving retrieved data ...')
-        tweets.reverse()    # put older tweets first
+        tweets.sort(key=lambda tweet: tweet['id'])      # put older tweets first
         user_dir = os.sep.join([args.destination_dir, user_id])
-        os.mkdir(user_dir)
-        with open(os.sep.join([user_dir, 'user.json']), mode='w', encoding='ascii') as fd:
-            json.dump(user_info, fd, sort_keys=True, ensure_ascii=True)
-        with open(os.sep.join([user_dir, 'tweets.json']), mode='w', encoding='ascii') as fd:
-            json.dump(tweets, fd, sort_keys=True, ensure_ascii=True)
+        with twitter_conn.profile_phase('output'):
+            os.mkdir(user_dir)
+            with open(os.sep.join([user_dir, 'user.json']), mode='w', encoding='ascii') as fd:
+                json.dump(user_info, fd, sort_keys=True, ensure_ascii=True)
+            with open(os.sep.join([user_dir, 'tweets.' + args.output_format]), mode='w', encoding='ascii') as fd:
+                if args.output_format == 'jsonl':
+                    corpus_reader.write_json_lines(fd, tweets)
+                else:
+                    json.dump(tweets, fd, sort_keys=True, ensure_ascii=True)
+        if coverage is not None:
+            coverage.commit()   # only once the tweets are saved
         acc_users += 1
         acc_tweets += len(tweets)
         logging.debug(''.join(['\t', str(acc_tweets), ' tweets from ', str(acc_users), ' users retrieved so far.']))
@@ -154,5 +207,10 @@ if __name__ == '__main__':
             break
 
     logging.info(''.join([str(acc_tweets), ' tweets from ', str(acc_users), ' users retrieved.']))
+    if coverage is not None:
+        coverage.close()
+    if negative is not None:
+        logging.info(''.join(['Negative cache entries: ', str(negative.counts()), '.']))
+        negative.close()
     twitter_conn.cleanup()
     logging.info('Finishing ...')
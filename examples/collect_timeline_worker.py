@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+
+
+'''
+Worker to download the timeline of a list of Twitter users in parallel with
+    other workers (processes, possibly on different hosts sharing a
+    filesystem). The users are split into work units stored in a shared lease
+    database, and each worker, with its own credential, leases units until all
+    of them are done. The output has the same layout as collect_timeline.py (a
+    directory per user with the files user.json and tweets.json). Run once with
+    --users-file-name to add the units (idempotent) and start as many workers
+    as needed. Units of workers that die are taken over by the others.
+'''
+
+
+import os
+import sys
+sys.path.append(os.sep.join([os.path.dirname(os.path.abspath(__file__)), '..']))
+
+import argparse
+import logging
+import pprint
+import shutil
+import json
+import twitter
+import leases
+
+
+def command_line_parsing():
+    parser = argparse.ArgumentParser(description = __doc__)
+    parser.add_argument('--lease-db', '-l',
+                        dest='lease_db',
+                        required=True,
+                        help='Shared SQLite database with the work units.')
+    parser.add_argument('--destination-dir', '-e',
+                        dest='destination_dir',
+                        required=True,
+                        help='Shared directory where the collected data will be stored (created if absent).')
+    parser.add_argument('--credentials-filename', '-c',
+                        dest='credentials_filename',
+                        required=True,
+                        help='Filename (in JSON format) with the Twitter credentials of this worker.')
+    parser.add_argument('--users-file-name', '-f',
+                        dest='users_file_name',
+                        default=None,
+                        help='File name with information about the users that will have their timeline collected, added as work units to the lease database.')
+    parser.add_argument('--users-per-unit', '-u',
+                        dest='users_per_unit',
+                        type=int,
+                        default=100,
+                        help='Number of users per work unit. Default = 100.')
+    parser.add_argument('--lease-sec', '-t',
+                        dest='lease_sec',
+                        type=int,
+                        default=900,
+                        help='Seconds a lease lasts without heartbeats before the unit is handed over. Default = 900.')
+    parser.add_argument('--debug', '-d',
+                        dest='debug',
+                        type=int,
+                        choices = [0, 1, 2],
+                        nargs='?',
+                        const=1,
+                        default=0,
+                        help='Print debug information. 0 = no debug (default); 1 = normal debug; 2 = deeper debug (HTTP debug).')
+    return parser.parse_args()
+
+
+def collect_unit(twitter_conn, destination_dir, unit):
+    for user in unit.payload:
+        user_id, user_screen_name = user.split()
+        user_dir = os.sep.join([destination_dir, user_id])
+        if os.path.exists(user_dir):     # collected by a previous lease of this unit
+            continue
+        logging.debug(''.join(['\tRetrieving user information and timeline from user ', user_screen_name, ' , id = ', user_id, ' ...']))
+        try:
+            user_info = twitter_conn.get_user_info(user_id)
+            tweets = twitter_conn.get_user_timeline(user_id, extended=True)
+        except (twitter.TwitterUserNotFoundException, twitter.TwitterUserSuspendedException, twitter.ProtectedTweetsException) as e:
+            logging.warning(''.join(['\t', str(e), ' Aborting user timeline ...']))
+            continue
+        if not tweets:
+            continue
+        tweets.reverse()    # put older tweets first
+        temp_dir = '{}.{}.tmp'.format(user_dir, leases.default_worker_id().replace(':', '_'))   # written aside and renamed, so a dying worker never leaves partial user directories
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        os.mkdir(temp_dir)
+        with open(os.sep.join([temp_dir, 'user.json']), mode='w', encoding='ascii') as fd:
+            json.dump(user_info, fd, sort_keys=True, ensure_ascii=True)
+        with open(os.sep.join([temp_dir, 'tweets.json']), mode='w', encoding='ascii') as fd:
+            json.dump(tweets, fd, sort_keys=True, ensure_ascii=True)
+        try:
+            os.rename(temp_dir, user_dir)
+        except OSError:     # another worker finished this user meanwhile
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    # parsing arguments
+    args = command_line_parsing()
+
+    # logging configuration
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO, format='[%(asctime)s] - %(name)s - %(levelname)s - %(message)s')
+
+    logging.info('Starting timelines collecting worker with the following parameters:\n{}'.format(pprint.pformat(vars(args))))
+
+    database = leases.LeaseDatabase(args.lease_db, lease_sec=args.lease_sec)
+    if args.users_file_name:
+        logging.info('Adding work units ...')
+        with open(args.users_file_name, encoding='utf-8') as fd:
+            users = [ line.strip() for line in fd if line.strip() ]
+        units = ( (idx, users[idx:idx+args.users_per_unit]) for idx in range(0, len(users), args.users_per_unit) )
+        logging.info('{} work units added.'.format(database.add_units('timelines', units)))
+    os.makedirs(args.destination_dir, exist_ok=True)
+
+    logging.info('Reading credentials data ...')
+    with open(args.credentials_filename, mode= 'rt', encoding='ascii') as fd:
+        credentials = json.load(fd)
+
+    logging.info('Connecting to Twitter ...')
+    twitter_conn = twitter.TwitterReader(credentials['app_name'],
+                                         credentials['consumer_key'],
+                                         credentials['consumer_secret'],
+                                         debug_connection = (args.debug == 2),
+                                        )
+    twitter_conn.connect()
+
+    logging.info('Retrieving Tweets ...')
+    processed = leases.run_worker(database, lambda unit: collect_unit(twitter_conn, args.destination_dir, unit), kinds=['timelines'])
+
+    logging.info('{} work units processed by this worker. Progress: {}.'.format(processed, database.progress()))
+    database.close()
+    twitter_conn.cleanup()
+    logging.info('Finishing ...')
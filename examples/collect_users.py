@@ -2,6 +2,12 @@
 
 
 '''
+Code to collect the user objects of a list of user ids. The users are stored in
+    compressed JSON files, one per step of ids, and their locations in the
+    user_location_map.pkl file. With --snapshot_db, the users are stored
+    instead as a new snapshot in a profile snapshot database, which keeps only
+    the fields changed since the previous run (see snapshot_store.py; the
+    locations are available with ProfileSnapshotStore.field_values('location')).
 '''
 
 
@@ -16,7 +22,8 @@ import math
 import twitter
 import traceback
 import time
-import gzip
+import compression
+import snapshot_store
 import json
 import pickle
 
@@ -27,11 +34,29 @@ def command_line_parsing():
                         required=True,
                         help='Filename with the user ids to be collected.')
     parser.add_argument('--destination_directory', '-e',
-                        required=True,
+                        default=None,
                         help='Directory to be created where the collected data will be stored.')
+    parser.add_argument('--snapshot_db', '-b',
+                        default=None,
+                        help='Profile snapshot database (created if absent) where the users are stored as a new snapshot, instead of the destination directory.')
     parser.add_argument('--credentials_filename', '-c',
                         required=True,
                         help='Filename (in JSON format) with the Twitter credentials.')
+    parser.add_argument('--compression', '-z',
+                        choices=['gzip', 'zstd'],
+                        default='gzip',
+                        help='Compression of the output files: gzip (default) or zstd (requires the zstandard package).')
+    parser.add_argument('--compression_level', '-L',
+                        type=int,
+                        default=None,
+                        help='Compression level. Default = 9 for gzip and 3 for zstd.')
+    parser.add_argument('--compression_threads', '-T',
+                        type=int,
+                        default=0,
+                        help='Number of zstd compression threads (-1 = number of CPUs). Default = 0 (no extra threads).')
+    parser.add_argument('--zstd_dictionary', '-D',
+                        default=None,
+                        help='Zstd dictionary trained from sample records (see compression.py), copied to the destination directory. Default = no dictionary.')
     parser.add_argument('--stop_on_error', '-s',
                         dest='stop_on_error',
                         action='store_true',
@@ -45,7 +70,10 @@ def command_line_parsing():
                         const=1,
                         default=0,
                         help='Print debug information. 0 = no debug (default); 1 = normal debug; 2 = deeper debug (HTTP debug).')
-    return parser.parse_args()
+    args = parser.parse_args()
+    if not args.destination_directory and not args.snapshot_db:
+        parser.error('one of the arguments --destination_directory/-e or --snapshot_db/-b is required')
+    return args
 
 
 if __name__ == '__main__':
@@ -57,10 +85,15 @@ if __name__ == '__main__':
 
     logging.info('Starting collecting Twitter data with the following parameters:\n{}'.format(pprint.pformat(vars(args))))
 
-    if os.path.exists(args.destination_directory):
-        logging.error(''.join(['Destination directory ', args.destination_directory, ' already exists. Quitting ...']))
-        sys.exit(1)
-    os.makedirs(args.destination_directory)
+    if args.snapshot_db:
+        store = snapshot_store.ProfileSnapshotStore(args.snapshot_db)
+        snapshot_id = store.begin_snapshot()
+    else:
+        if os.path.exists(args.destination_directory):
+            logging.error(''.join(['Destination directory ', args.destination_directory, ' already exists. Quitting ...']))
+            sys.exit(1)
+        os.makedirs(args.destination_directory)
+        dictionary = compression.install_dictionary(args.zstd_dictionary, args.destination_directory) if args.zstd_dictionary else None
 
     logging.info('Reading credentials data ...')
     with open(args.credentials_filename, mode= 'rt', encoding='ascii') as fd:
@@ -70,9 +103,6 @@ if __name__ == '__main__':
     twitter_conn = twitter.TwitterReader(credentials['app_name'],
                                          credentials['consumer_key'],
                                          credentials['consumer_secret'],
-                                         user_auth=True,
-                                         access_token=credentials['access_token'],
-                                         access_token_secret=credentials['access_token_secret'],
                                          debug_connection = (args.debug == 2),
                                         )
     twitter_conn.connect()
@@ -81,7 +111,8 @@ if __name__ == '__main__':
     user_ids = []
     with open(args.user_ids_filename, mode='rt', encoding='ascii') as fd:
         for line in fd:
-            user_ids.append(line.strip())
+            if line.strip():
+                user_ids.append(line.strip())
 
     logging.info('Retrieving Twitter data ...')
     user_location_map = {}
@@ -96,6 +127,10 @@ if __name__ == '__main__':
             logging.debug('\tRetrieving users (step {}/{}) ...'.format(step_count+1, num_steps))
             try:
                 users = twitter_conn.get_users_info(user_ids[idx:idx+step_size])
+            except twitter.CircuitOpenException as coe:
+                logging.warning('{} Sleeping and retrying ...'.format(coe))
+                time.sleep(coe.retry_in_sec)
+                continue
             except Exception as e:
                 logging.error('Error trying to retrieve tweets. Error: {}'.format(e))
                 traceback.print_exc()
@@ -110,19 +145,32 @@ if __name__ == '__main__':
                 continue
             retry = False
 
-            for user in users:
-                if 'location' in user:
-                    user_location_map[user['id']] = user['location']
-
-            logging.debug('\tSaving data (step {}/{}) ...'.format(step_count+1, num_steps))
-            destination_filename = os.path.join(args.destination_directory, str(step_count) + '.json.gz')
-            with gzip.open(destination_filename, mode='xt', encoding='utf-8') as fd:
-                json.dump(users, fd, sort_keys=True, ensure_ascii=True)
-            with open(os.path.join(args.destination_directory, 'user_location_map.pkl'), mode='wb') as fd:
-                pickle.dump(user_location_map, fd)
+            if args.snapshot_db:
+                logging.debug('\tSaving snapshot (step {}/{}) ...'.format(step_count+1, num_steps))
+                changed = store.add_users(snapshot_id, users)
+                removed = store.remove_users(snapshot_id, set(user_ids[idx:idx+step_size]) - set(user['id_str'] for user in users))
+                logging.debug('\t{} users changed and {} users removed since the last snapshot.'.format(changed, removed))
+            else:
+                for user in users:
+                    if 'location' in user:
+                        user_location_map[user['id']] = user['location']
+
+                logging.debug('\tSaving data (step {}/{}) ...'.format(step_count+1, num_steps))
+                destination_filename = os.path.join(args.destination_directory, str(step_count) + '.json' + compression.suffix(args.compression))
+                with compression.open_sink(destination_filename, mode='xt', encoding='utf-8',
+                                           codec=args.compression,
+                                           level=args.compression_level,
+                                           threads=args.compression_threads,
+                                           dictionary=dictionary,
+                                          ) as fd:
+                    json.dump(users, fd, sort_keys=True, ensure_ascii=True)
+                with open(os.path.join(args.destination_directory, 'user_location_map.pkl'), mode='wb') as fd:
+                    pickle.dump(user_location_map, fd)
             del users
             step_count += 1
 
+    if args.snapshot_db:
+        store.close()
     twitter_conn.cleanup()
 
     logging.info('Finished.')
@@ -3,19 +3,23 @@
 
 '''
 Code to retrieve tweets from tweet ids. The tweet ids are stored in a file (one
-    id per line), and the recovered tweets are stored in a file in JSON format.
+    id per line), and the recovered tweets are stored in a file in JSON lines
+    format (one tweet per line). The ids of tweets not returned by Twitter
+    (deleted or protected) are stored in a file (one id per line). The ids are
+    read and the tweets are written incrementally, and an interrupted collecting
+    is resumed from the last completed batch when run again.
 '''
 
 
 import argparse
 import logging
 import pprint
+import os
 import sys
 sys.path.append('..')
 import twitter
 import traceback
 import time
-import json
 
 
 def command_line_parsing():
@@ -25,7 +29,17 @@ def command_line_parsing():
                         help='File name with the tweet ids to be collected.')
     parser.add_argument('--destination_filename', '-e',
                         required=True,
-                        help='JSON filename to be created where the collected data will be stored.')
+                        help='JSON lines filename where the collected data will be stored.')
+    parser.add_argument('--missing_filename', '-m',
+                        default=None,
+                        help='Filename where the ids of tweets not returned by Twitter will be stored. Default = <destination_filename>.missing .')
+    parser.add_argument('--checkpoint_filename', '-k',
+                        default=None,
+                        help='Filename where the collecting progress is stored, for resuming. Default = <destination_filename>.checkpoint .')
+    parser.add_argument('--concurrency', '-n',
+                        type=int,
+                        default=1,
+                        help='Number of 100-ids batches requested at once. Default = 1.')
     parser.add_argument('--stop_on_error', '-s',
                         dest='stop_on_error',
                         default=False,
@@ -50,9 +64,11 @@ if __name__ == '__main__':
 
     logging.info('Starting collecting Twitter data with the following parameters:\n{}'.format(pprint.pformat(vars(args))))
 
-    logging.info('Reading tweet ids file name ...')
-    with open(args.tweet_ids_filename, encoding='ascii') as fd:
-        tweet_ids = [ line.strip() for line in fd ]
+    missing_filename = args.missing_filename or args.destination_filename + '.missing'
+    checkpoint_filename = args.checkpoint_filename or args.destination_filename + '.checkpoint'
+    if os.path.exists(args.destination_filename) and not os.path.exists(checkpoint_filename):
+        logging.error('Destination file {} exists without a checkpoint file {} to resume from. Quitting ...'.format(args.destination_filename, checkpoint_filename))
+        sys.exit(1)
 
     logging.info('Connecting to Twitter ...')
     app_name        = '<your application name>'
@@ -65,7 +81,20 @@ if __name__ == '__main__':
     retry = True
     while retry:
         try:
-            tweets = twitter_conn.hydrate_tweets(tweet_ids, extended=True)
+            with open(args.tweet_ids_filename, encoding='ascii') as ids_fd, \
+                 open(args.destination_filename, mode='at', encoding='ascii') as fd, \
+                 open(missing_filename, mode='at', encoding='ascii') as missing_fd:
+                retrieved, missing = twitter_conn.hydrate_tweets_stream(ids_fd,
+                                                                        fd,
+                                                                        extended=True,
+                                                                        concurrency=args.concurrency,
+                                                                        missing_fd=missing_fd,
+                                                                        checkpoint_filename=checkpoint_filename,
+                                                                       )
+        except twitter.CircuitOpenException as coe:
+            logging.warning('{} Sleeping and resuming ...'.format(coe))
+            time.sleep(coe.retry_in_sec)
+            continue
         except Exception as e:
             logging.error('Error trying to retrieve tweets. Error: {}'.format(e))
             traceback.print_exc()
@@ -74,14 +103,12 @@ if __name__ == '__main__':
                 twitter_conn.cleanup()
                 sys.exit(1)
             retry_sleep_sec = 60
-            logging.warning('Sleeping for {} seconds and retrying ...'.format(retry_sleep_sec))
+            logging.warning('Sleeping for {} seconds and resuming ...'.format(retry_sleep_sec))
             time.sleep(retry_sleep_sec)
             twitter_conn.reconnect()
             continue
         retry = False
     twitter_conn.cleanup()
 
-    with open(args.destination_filename, mode='xt', encoding='ascii') as fd:
-        json.dump(tweets, fd, sort_keys=True, ensure_ascii=True)
-
+    logging.info('{} tweets retrieved, {} missing.'.format(retrieved, missing))
     logging.info('Finished.')
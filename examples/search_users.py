@@ -5,6 +5,9 @@
 #   words). The recovered users are stored in a file containing a line per user
 #   in the format "id screen_name". All the remaining user information is
 #   stored in a directory named 'full_info' with a file per user in JSON format.
+#   With a seen users database, the users found in previous runs are skipped
+#   (only the new users are stored), and the search of a word stops early when
+#   its tweets bring few new users.
 #
 # It is recommended not to use too small function words (less than 3 characters)
 #   since they can match undesired languages.
@@ -12,8 +15,8 @@
 # Pseudo-code:
 #   read list of words
 #   for each 'word':
-#       get a list of recent users that used this word
-#       save user information if not already seen
+#       get a list of recent users that used this word and were not already seen
+#       save user information
 #
 # References:
 #   [1] https://developer.twitter.com/en/docs/tweets/data-dictionary/overview/intro-to-tweet-json
@@ -28,7 +31,9 @@ import logging
 import traceback
 import os
 import twitter
+import seen_users
 import json
+import time
 
 
 def command_line_parsing():
@@ -50,6 +55,15 @@ def command_line_parsing():
                         type=int,
                         default=1000,
                         help='Maximum number of results in a search for a word. Default = 1000.')
+    parser.add_argument('--seen-users-db', '-u',
+                        dest='seen_users_db',
+                        default=None,
+                        help='Database (created if absent) with the users found in previous runs, which are skipped. Default = no database (only the users found in this run are skipped).')
+    parser.add_argument('--min-new-ratio', '-r',
+                        dest='min_new_ratio',
+                        type=float,
+                        default=0,
+                        help='Stop the search of a word when the ratio of new users per tweet of a page falls below this value. Default = 0 (search up to the maximum number of results).')
     parser.add_argument('--stop-on-error', '-s',
                         dest='stop_on_error',
                         action='store_true',
@@ -78,6 +92,8 @@ if __name__ == '__main__':
                             '\n\tdestination directory = ',                 args.destination_dir,
                             '\n\tlanguage = ',                              args.language,
                             '\n\tmaximum number of results per word = ',    str(args.max_results_per_word),
+                            '\n\tseen users database = ',                   str(args.seen_users_db),
+                            '\n\tminimum ratio of new users = ',            str(args.min_new_ratio),
                             '\n\tstop on error = ',                         str(args.stop_on_error),
                             '\n\tdebug = ',                                 str(args.debug),
                          ]))
@@ -101,6 +117,7 @@ if __name__ == '__main__':
     twitter_conn = twitter.TwitterReader(app_name, consumer_key, consumer_secret, debug_connection = (args.debug == 2) )
     twitter_conn.connect()
 
+    seen = seen_users.SeenUsersSet(args.seen_users_db) if args.seen_users_db else set()
     logging.info('Retrieving Twitter\'s users ...')
     final_users = {}
     for word in words:
@@ -108,13 +125,18 @@ if __name__ == '__main__':
         while retry:
             logging.debug(''.join(['\tSearching users by word \'', word, '\' ...']))
             try:
-                users = twitter_conn.search_users(word, args.language, args.max_results_per_word)
+                users = twitter_conn.search_users(word, args.language, args.max_results_per_word, seen=seen, min_new_ratio=args.min_new_ratio)
             except twitter.TwitterServerErrorException as tsee:
                 retry_sleep_sec = 60
                 logging.warning(''.join(['\t', str(tsee), ' Sleeping for ', str(retry_sleep_sec), ' seconds and retrying ...']))
                 time.sleep(retry_sleep_sec)
                 retry = True
                 continue
+            except twitter.CircuitOpenException as coe:
+                logging.warning(''.join(['\t', str(coe), ' Sleeping and retrying ...']))
+                time.sleep(coe.retry_in_sec)
+                retry = True
+                continue
             except Exception as e:
                 logging.error(''.join(['Error trying to search users by word ', word, ' . Error: ', str(e), ' Aborting the search for the word \'', word , '\' ...']))
                 traceback.print_exc()
@@ -124,11 +146,12 @@ if __name__ == '__main__':
                     sys.exit(1)
                 twitter_conn.reconnect()
             retry = False
-        for user_id in users.keys():
-            if user_id not in final_users:
-                final_users[user_id] = users[user_id]['screen_name']
-                with open(''.join([full_info_dir, os.sep, user_id, '.json']), mode='w', encoding='ascii') as fd:
-                    json.dump(users[user_id], fd, sort_keys=True, ensure_ascii=True)
+        for user_id in users.keys():     # users already seen are not returned
+            final_users[user_id] = users[user_id]['screen_name']
+            with open(''.join([full_info_dir, os.sep, user_id, '.json']), mode='w', encoding='ascii') as fd:
+                json.dump(users[user_id], fd, sort_keys=True, ensure_ascii=True)
+        if args.seen_users_db:
+            seen.commit()       # after the users are stored, so an interrupted run doesn't lose them
         logging.debug(''.join(['\tCurrent number of users found = ', str(len(final_users.keys())), '.']))
 
     logging.debug(''.join(['Total number of users found = ', str(len(final_users.keys())), '.']))
@@ -139,5 +162,7 @@ if __name__ == '__main__':
     with open(os.sep.join([args.destination_dir, 'users.txt']), mode='w', encoding='utf-8') as fd:
         fd.write('\n'.join(final_users_list))
 
+    if args.seen_users_db:
+        seen.close()
     twitter_conn.cleanup()
     logging.info('Finishing ...')
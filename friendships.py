@@ -0,0 +1,214 @@
+""" Friendship (following) relationships among a set of users, computed locally
+    from their friend or follower id lists instead of one '/friendships/show'
+    request [1] per pair of users.
+
+    A matrix among N users costs N get_friend_ids() (or get_follower_ids())
+    calls, one request per 5000 ids [2], instead of N * (N - 1) / 2
+    get_friendship() requests, and no request at all if the lists were already
+    collected (see from_graph_store()). The bulk '/friendships/lookup'
+    resource [3] is not used: it only returns the relationships between the
+    authenticating user and others, so it requires user context authentication
+    while TwitterReader authenticates as an application.
+
+    Each user has a row of bits ('user i follows user j') kept in a Python
+    integer, so a community of a few thousand users takes a few MB and mutual
+    follows are found with bitwise ANDs.
+
+    Example:
+        matrix = FriendshipMatrix.collect(twitter_conn, user_ids)
+        matrix.relationship(783214, 6253282)    # {'following': True, 'followed_by': False}
+        pairs = matrix.mutual_pairs()
+
+References:
+    [1] https://developer.twitter.com/en/docs/accounts-and-users/follow-search-get-users/api-reference/get-friendships-show
+    [2] https://developer.twitter.com/en/docs/accounts-and-users/follow-search-get-users/api-reference/get-friends-ids
+    [3] https://developer.twitter.com/en/docs/accounts-and-users/follow-search-get-users/api-reference/get-friendships-lookup
+"""
+
+
+import bisect
+import logging
+import twitter
+
+
+def _bits(value):
+    """ Yields the positions of the set bits of 'value'.
+    """
+    while value:
+        low = value & -value
+        yield low.bit_length() - 1
+        value ^= low
+
+
+def _intersect_sorted(small, large):
+    """ Yields the values of the sorted sequence 'small' also in the sorted
+        sequence 'large', with a binary search per value of 'small'.
+    """
+    start = 0
+    for value in small:
+        start = bisect.bisect_left(large, value, start)
+        if start == len(large):
+            return
+        if large[start] == value:
+            yield value
+
+
+class FriendshipMatrix:
+    """ Following relationships among 'user_ids'. Relationships are unknown
+        (None) between users whose lists were not added, e.g. protected users.
+    """
+
+
+    _users                          = None          # sorted user ids, the index of a user is its bit position
+    _index                          = None
+    _following                      = None          # row bits: users followed by each user
+    _followed_by                    = None          # column bits: followers of each user
+    _known_friends                  = 0             # bits of the users whose friends were added
+    _known_followers                = 0             # bits of the users whose followers were added
+    _logger                         = None
+
+
+    def __init__(self, user_ids):
+        self._users = sorted(set(int(user_id) for user_id in user_ids))
+        self._index = { user_id: idx for idx, user_id in enumerate(self._users) }
+        self._following = [0] * len(self._users)
+        self._followed_by = [0] * len(self._users)
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+
+    def _ids(self, ids, is_sorted):
+        """ Yields the community members among 'ids' in increasing order.
+        """
+        if not is_sorted:
+            ids = sorted(int(user_id) for user_id in ids)
+        if len(ids) < len(self._users):
+            return _intersect_sorted(ids, self._users)
+        return _intersect_sorted(self._users, ids)
+
+
+    def add_friend_ids(self, user_id, friend_ids, is_sorted = False):
+        """ Adds the ids of the users followed by 'user_id' (e.g. from
+            get_friend_ids() or a friends graph store row, whose ids are
+            already sorted). Ids out of the community are ignored.
+        """
+        source = self._index[int(user_id)]
+        for friend_id in self._ids(friend_ids, is_sorted):
+            target = self._index[int(friend_id)]
+            self._following[source] |= 1 << target
+            self._followed_by[target] |= 1 << source
+        self._known_friends |= 1 << source
+
+
+    def add_follower_ids(self, user_id, follower_ids, is_sorted = False):
+        """ Adds the ids of the followers of 'user_id' (as in add_friend_ids()).
+        """
+        target = self._index[int(user_id)]
+        for follower_id in self._ids(follower_ids, is_sorted):
+            source = self._index[int(follower_id)]
+            self._following[source] |= 1 << target
+            self._followed_by[target] |= 1 << source
+        self._known_followers |= 1 << target
+
+
+    @classmethod
+    def collect(cls, twitter_conn, user_ids, direction = 'friends'):
+        """ Builds the matrix of 'user_ids' with one get_friend_ids() call per user
+            ('direction' = 'friends') or one get_follower_ids() call per user
+            ('direction' = 'followers'). Users whose lists can't be retrieved
+            (not found, suspended or protected) are skipped.
+        """
+        matrix = cls(user_ids)
+        get_ids, add_ids = (twitter_conn.get_friend_ids, matrix.add_friend_ids) if direction == 'friends' else (twitter_conn.get_follower_ids, matrix.add_follower_ids)
+        for user_id in matrix._users:
+            try:
+                ids = get_ids(str(user_id))
+            except (twitter.TwitterUserNotFoundException, twitter.TwitterUserSuspendedException, twitter.ProtectedTweetsException) as e:
+                matrix._logger.warning('Skipping the {} of user {}: {}'.format(direction, user_id, e))
+                continue
+            add_ids(user_id, ids)
+        return matrix
+
+
+    @classmethod
+    def from_graph_store(cls, user_ids, friends = None, followers = None):
+        """ Builds the matrix of 'user_ids' from graph stores already collected
+            (graph_store.GraphReader objects): 'friends' maps each user to the
+            users it follows and 'followers' to its followers. The rows are
+            sorted, so they are intersected with the community without sorting.
+        """
+        matrix = cls(user_ids)
+        for graph, add_ids in ((friends, matrix.add_friend_ids), (followers, matrix.add_follower_ids)):
+            if graph is None:
+                continue
+            for user_id in matrix._users:
+                if user_id in graph:
+                    add_ids(user_id, graph.neighbours(user_id), is_sorted=True)
+        return matrix
+
+
+    def __len__(self):
+        return len(self._users)
+
+
+    def users(self):
+        return list(self._users)
+
+
+    def follows(self, source_id, target_id):
+        """ Returns whether 'source_id' follows 'target_id', or None if unknown.
+        """
+        source, target = self._index[int(source_id)], self._index[int(target_id)]
+        if self._following[source] >> target & 1:
+            return True
+        if (self._known_friends >> source & 1) or (self._known_followers >> target & 1):
+            return False
+        return None
+
+
+    def relationship(self, source_id, target_id):
+        """ Returns the relationship of the pair in the form of get_friendship()
+            ('following' and 'followed_by', None if unknown).
+        """
+        return {'following'     : self.follows(source_id, target_id),
+                'followed_by'   : self.follows(target_id, source_id),
+               }
+
+
+    def following(self, user_id):
+        """ Returns the community members followed by 'user_id'.
+        """
+        return [ self._users[idx] for idx in _bits(self._following[self._index[int(user_id)]]) ]
+
+
+    def followers(self, user_id):
+        """ Returns the community members following 'user_id'.
+        """
+        return [ self._users[idx] for idx in _bits(self._followed_by[self._index[int(user_id)]]) ]
+
+
+    def mutual(self, user_id):
+        """ Returns the community members following and followed by 'user_id'.
+        """
+        idx = self._index[int(user_id)]
+        return [ self._users[other] for other in _bits(self._following[idx] & self._followed_by[idx]) ]
+
+
+    def mutual_pairs(self):
+        """ Returns the pairs (lower id, higher id) of users following each other.
+        """
+        pairs = []
+        for idx, user_id in enumerate(self._users):
+            higher = (self._following[idx] & self._followed_by[idx]) >> (idx + 1)     # each pair once
+            pairs += [ (user_id, self._users[idx + 1 + other]) for other in _bits(higher) ]
+        return pairs
+
+
+    def number_of_edges(self):
+        return sum(bin(row).count('1') for row in self._following)
+
+
+    def reciprocity(self):
+        """ Returns the fraction of the following relationships that are mutual.
+        """
+        edges = self.number_of_edges()
+        return 2 * len(self.mutual_pairs()) / edges if edges else 0.0
@@ -0,0 +1,270 @@
+""" Overlap analytics of collected friend/follower lists: common neighbours,
+    union sizes, Jaccard and overlap similarities, top-k most similar accounts
+    and degree statistics.
+
+    The lists are kept as sorted int64 NumPy arrays in CSR layout (the layout
+    of graph_store.py), together with the inverted lists (the accounts having
+    each neighbour) built once with a vectorised sort. The common neighbours of
+    an account and every other account are then counted in one vectorised
+    pass: the inverted lists of its neighbours are concatenated and the
+    occurrences of each account counted, instead of building Python sets per
+    pair. The top-k search of many accounts can be split over a process pool.
+
+    NumPy [1] is required by this module.
+
+    Example:
+        lists = NeighbourLists.from_graph_store(graph_store.GraphReader('friends_of_friends'))
+        lists.top_k(783214, k=10)                   # [(user id, jaccard, common neighbours), ...]
+        similar = lists.top_k_all(k=10, processes=4)
+        lists.degree_stats()
+
+References:
+    [1] https://numpy.org/
+    [2] https://en.wikipedia.org/wiki/Jaccard_index
+"""
+
+
+import json
+import concurrent.futures
+
+try:
+    import numpy
+except ImportError:     # numpy is optional for the package, but required by this module
+    numpy = None
+
+
+METRICS = ('jaccard', 'overlap', 'common')
+
+
+class NeighbourLists:
+    """ Sorted neighbour id lists of a set of accounts ('keys'), in CSR layout:
+        the neighbours of keys[i] are values[offsets[i]:offsets[i+1]].
+    """
+
+
+    keys                            = None
+    offsets                         = None
+    values                          = None
+    _dense                          = None          # dense index of each value, in [0, number of distinct values)
+    _universe                       = 0
+    _degrees                        = None
+    _inverted                       = None          # list index of each value, grouped by dense index
+    _inverted_offsets               = None
+
+
+    def __init__(self, keys, offsets, values):
+        if numpy is None:
+            raise Exception('graph_analytics requires the numpy package (pip install numpy).')
+        self.keys = numpy.asarray(keys, dtype=numpy.int64)
+        self.offsets = numpy.asarray(offsets, dtype=numpy.int64)
+        self.values = numpy.asarray(values, dtype=numpy.int64)
+        self._degrees = numpy.diff(self.offsets)
+        uniques, self._dense = numpy.unique(self.values, return_inverse=True)
+        self._universe = len(uniques)
+        rows = numpy.repeat(numpy.arange(len(self.keys), dtype=numpy.int64), self._degrees)
+        self._inverted = rows[numpy.argsort(self._dense, kind='stable')]
+        self._inverted_offsets = numpy.zeros(self._universe + 1, dtype=numpy.int64)
+        numpy.cumsum(numpy.bincount(self._dense, minlength=self._universe), out=self._inverted_offsets[1:])
+
+
+    @classmethod
+    def from_lists(cls, lists):
+        """ Builds the lists from a dictionary mapping account ids to iterables of
+            neighbour ids or user objects (e.g. the results of get_friends(),
+            get_followers() or get_friend_ids()).
+        """
+        keys = sorted(int(key) for key in lists)
+        rows = []
+        for key in keys:
+            neighbours = lists[key] if key in lists else lists[str(key)]
+            row = numpy.fromiter(( int(neighbour['id']) if isinstance(neighbour, dict) else int(neighbour) for neighbour in neighbours ), dtype=numpy.int64)
+            rows.append(numpy.unique(row))
+        offsets = numpy.zeros(len(keys) + 1, dtype=numpy.int64)
+        numpy.cumsum([ len(row) for row in rows ], out=offsets[1:])
+        return cls(keys, offsets, numpy.concatenate(rows) if rows else numpy.zeros(0, dtype=numpy.int64))
+
+
+    @classmethod
+    def from_graph_store(cls, reader, sources_only = True):
+        """ Builds the lists from a graph_store.GraphReader, without copying its
+            arrays unless 'sources_only' drops the nodes without out-edges
+            (the neighbours that were not collected themselves).
+        """
+        nodes, offsets, values = ( numpy.asarray(array) for array in reader.arrays() )
+        if not sources_only:
+            return cls(nodes, offsets, values)
+        degrees = numpy.diff(offsets)
+        keep = degrees > 0
+        new_offsets = numpy.zeros(int(keep.sum()) + 1, dtype=numpy.int64)
+        numpy.cumsum(degrees[keep], out=new_offsets[1:])
+        return cls(nodes[keep], new_offsets, values[_segments(offsets[:-1][keep], degrees[keep])])
+
+
+    @classmethod
+    def from_json_lines(cls, filename):
+        """ Builds the lists from a per-friend JSON lines file written by
+            examples/collect_friends.py.
+        """
+        lists = {}
+        with open(filename, mode='rt', encoding='ascii') as fd:
+            for line in fd:
+                if line.strip():
+                    record = json.loads(line)
+                    lists[int(record['id'])] = [ neighbour['id'] for neighbour in record['neighbours'] ]
+        return cls.from_lists(lists)
+
+
+    def __len__(self):
+        return len(self.keys)
+
+
+    def _index(self, user_id):
+        idx = int(numpy.searchsorted(self.keys, int(user_id)))
+        if idx == len(self.keys) or self.keys[idx] != int(user_id):
+            raise KeyError(user_id)
+        return idx
+
+
+    def neighbours(self, user_id):
+        idx = self._index(user_id)
+        return self.values[self.offsets[idx]:self.offsets[idx+1]]
+
+
+    def degrees(self):
+        return self._degrees
+
+
+    def degree_stats(self):
+        """ Returns the number of lists, total and distinct neighbours, and the
+            minimum, maximum, mean and percentiles of the list sizes.
+        """
+        degrees = self._degrees
+        if not len(degrees):
+            return {'lists': 0, 'neighbours': 0, 'distinct_neighbours': 0}
+        percentiles = numpy.percentile(degrees, [50, 90, 99])
+        return {'lists'                 : len(degrees),
+                'neighbours'            : int(degrees.sum()),
+                'distinct_neighbours'   : self._universe,
+                'empty'                 : int((degrees == 0).sum()),
+                'min'                   : int(degrees.min()),
+                'max'                   : int(degrees.max()),
+                'mean'                  : float(degrees.mean()),
+                'median'                : float(percentiles[0]),
+                'p90'                   : float(percentiles[1]),
+                'p99'                   : float(percentiles[2]),
+               }
+
+
+    def _common_counts(self, idx, targets = None):
+        """ Returns the number of neighbours in common between the list 'idx' and
+            every list (or the lists of the indices 'targets').
+        """
+        dense = self._dense[self.offsets[idx]:self.offsets[idx+1]]
+        starts = self._inverted_offsets[dense]
+        counts = numpy.bincount(self._inverted[_segments(starts, self._inverted_offsets[dense + 1] - starts)], minlength=len(self.keys))
+        return counts if targets is None else counts[numpy.asarray(targets, dtype=numpy.int64)]
+
+
+    def _scores(self, idx, common, targets = None, metric = 'jaccard'):
+        degrees = self._degrees if targets is None else self._degrees[targets]
+        if metric == 'common':
+            return common.astype(numpy.float64)
+        if metric == 'jaccard':
+            denominators = self._degrees[idx] + degrees - common
+        elif metric == 'overlap':
+            denominators = numpy.minimum(self._degrees[idx], degrees)
+        else:
+            raise ValueError('Unknown metric {}, expected one of {}.'.format(metric, METRICS))
+        return numpy.divide(common, denominators, out=numpy.zeros(len(common), dtype=numpy.float64), where=denominators > 0)
+
+
+    def pair_counts(self, pairs):
+        """ Returns the arrays (common neighbours, union sizes) of the pairs of
+            account ids 'pairs'. The pairs are grouped by their first account,
+            so the neighbours of each account are counted once.
+        """
+        pairs = numpy.asarray(pairs, dtype=numpy.int64).reshape(-1, 2)
+        sources = numpy.searchsorted(self.keys, pairs[:, 0])
+        targets = numpy.searchsorted(self.keys, pairs[:, 1])
+        for column, indices in ((0, sources), (1, targets)):
+            bad = (indices >= len(self.keys)) | (self.keys[numpy.minimum(indices, len(self.keys) - 1)] != pairs[:, column])
+            if bad.any():
+                raise KeyError(int(pairs[bad.argmax(), column]))
+        common = numpy.zeros(len(pairs), dtype=numpy.int64)
+        order = numpy.argsort(sources, kind='stable')
+        groups = numpy.flatnonzero(numpy.diff(sources[order])) + 1
+        for group in numpy.split(order, groups):
+            if len(group):
+                common[group] = self._common_counts(int(sources[group[0]]), targets[group])
+        return common, self._degrees[sources] + self._degrees[targets] - common
+
+
+    def jaccard(self, user_id, other_id):
+        """ Jaccard similarity [2] of the neighbours of two accounts.
+        """
+        common, union = self.pair_counts([(user_id, other_id)])
+        return float(common[0] / union[0]) if union[0] else 0.0
+
+
+    def top_k(self, user_id, k = 10, metric = 'jaccard', min_common = 1):
+        """ Returns the 'k' accounts most similar to 'user_id' as a list of
+            (account id, score, common neighbours), from the highest score.
+            'metric' is 'jaccard', 'overlap' (common neighbours over the smaller
+            list) or 'common'.
+        """
+        return _top_k(self, self._index(user_id), k, metric, min_common)
+
+
+    def top_k_all(self, k = 10, metric = 'jaccard', min_common = 1, user_ids = None, processes = 0, chunk_size = 64):
+        """ Returns a dictionary mapping each account id (or the ids 'user_ids')
+            to its top_k() list. With 'processes' > 0 the accounts are split in
+            chunks of 'chunk_size' over a pool of processes, each one receiving
+            a copy of the arrays once.
+        """
+        indices = [ self._index(user_id) for user_id in user_ids ] if user_ids is not None else list(range(len(self.keys)))
+        if not processes:
+            return { int(self.keys[idx]): _top_k(self, idx, k, metric, min_common) for idx in indices }
+        results = {}
+        chunks = [ indices[start:start+chunk_size] for start in range(0, len(indices), chunk_size) ]
+        with concurrent.futures.ProcessPoolExecutor(max_workers=processes, initializer=_init_worker, initargs=(self.keys, self.offsets, self.values)) as executor:
+            for chunk_results in executor.map(_top_k_chunk, chunks, [k] * len(chunks), [metric] * len(chunks), [min_common] * len(chunks)):
+                results.update(chunk_results)
+        return results
+
+
+def _segments(starts, lengths):
+    """ Returns the indices of the concatenated segments [start, start + length).
+    """
+    lengths = numpy.asarray(lengths, dtype=numpy.int64)
+    total = int(lengths.sum())
+    if not total:
+        return numpy.zeros(0, dtype=numpy.int64)
+    ends = numpy.cumsum(lengths)
+    shifts = numpy.repeat(numpy.asarray(starts, dtype=numpy.int64) - (ends - lengths), lengths)
+    return numpy.arange(total, dtype=numpy.int64) + shifts
+
+
+def _top_k(lists, idx, k, metric, min_common):
+    if k <= 0:
+        return []
+    common = lists._common_counts(idx)
+    common[idx] = 0     # the account itself
+    candidates = numpy.flatnonzero(common >= max(min_common, 1))
+    scores = lists._scores(idx, common[candidates], candidates, metric)
+    if len(candidates) > k:
+        best = numpy.argpartition(-scores, k - 1)[:k]
+        candidates, scores = candidates[best], scores[best]
+    order = numpy.lexsort((lists.keys[candidates], -scores))    # highest score first, ties by id
+    return [ (int(lists.keys[candidates[position]]), float(scores[position]), int(common[candidates[position]])) for position in order ]
+
+
+_worker_lists = None
+
+
+def _init_worker(keys, offsets, values):
+    global _worker_lists
+    _worker_lists = NeighbourLists(keys, offsets, values)
+
+
+def _top_k_chunk(indices, k, metric, min_common):
+    return { int(_worker_lists.keys[idx]): _top_k(_worker_lists, idx, k, metric, min_common) for idx in indices }
@@ -0,0 +1,276 @@
+""" Compact storage for friend/follower graphs in CSR (compressed sparse row)
+    layout. A graph is stored in a directory with the following files:
+
+        nodes.i64       sorted node (user) ids, little-endian int64
+        offsets.i64     row offsets into neighbours.i64, len(nodes) + 1 entries
+        neighbours.i64  neighbour ids of every node, sorted inside each row
+        names.txt       screen name of each node, one per line, in nodes.i64 order
+        meta.json       number of nodes and edges and the layout version
+
+    The .i64 files are raw arrays, so they can be opened with numpy.memmap (if
+    numpy is installed) or with mmap, and adjacency lookups need no parsing.
+
+References:
+    [1] https://en.wikipedia.org/wiki/Sparse_matrix#Compressed_sparse_row_(CSR,_CRS_or_Yale_format)
+"""
+
+
+import os
+import sys
+import mmap
+import json
+import array
+import bisect
+import logging
+
+try:
+    import numpy
+except ImportError:     # numpy is optional, mmap + memoryview is used instead
+    numpy = None
+
+
+_layout_version = 1
+_nodes_filename = 'nodes.i64'
+_offsets_filename = 'offsets.i64'
+_neighbours_filename = 'neighbours.i64'
+_names_filename = 'names.txt'
+_meta_filename = 'meta.json'
+
+
+def _write_int64(filename, values):
+    values = array.array('q', values)
+    if sys.byteorder != 'little':       # files are always little-endian
+        values.byteswap()
+    with open(filename, mode='wb') as fd:
+        values.tofile(fd)
+
+
+def from_collected(friends, adjacency):
+    """ Converts the structures written by examples/collect_friends.py
+        (a list of {'id', 'screen_name'} dicts and a dict mapping screen names
+        to lists of {'id', 'screen_name'} dicts) into the arguments expected by
+        write_graph().
+    """
+    names = {}
+    for friend in friends:
+        names[int(friend['id'])] = friend['screen_name']
+    ids = {screen_name: user_id for user_id, screen_name in names.items()}
+    edges = {}
+    for screen_name, neighbours in adjacency.items():
+        if screen_name not in ids:
+            logging.getLogger(__name__).warning('Unknown id for screen name {}. Ignoring its edges ...'.format(screen_name))
+            continue
+        row = []
+        for neighbour in neighbours:
+            row.append(int(neighbour['id']))
+            names.setdefault(int(neighbour['id']), neighbour['screen_name'])
+        edges[ids[screen_name]] = row
+    return edges, names
+
+
+def from_json_lines(filename):
+    """ Converts a per-friend JSON lines file written by
+        examples/collect_friends.py (one {'id', 'screen_name', 'neighbours'}
+        object per line, 'neighbours' being a list of {'id', 'screen_name'}
+        dicts) into the arguments expected by write_graph(). The file is read a
+        line at a time and the rows are kept as int64 arrays.
+    """
+    names = {}
+    edges = {}
+    with open(filename, mode='rt', encoding='ascii') as fd:
+        for line in fd:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                logging.getLogger(__name__).warning('Ignoring truncated line in {} ...'.format(filename))
+                continue
+            source = int(record['id'])
+            names[source] = record['screen_name']
+            row = array.array('q')
+            for neighbour in record['neighbours']:
+                row.append(int(neighbour['id']))
+                names.setdefault(int(neighbour['id']), neighbour['screen_name'])
+            edges[source] = row
+    return edges, names
+
+
+def write_graph(directory, edges, names=None):
+    """ Writes a graph in CSR layout to 'directory' (created if absent).
+
+        'edges' maps a source user id to an iterable of neighbour user ids and
+        'names' optionally maps user ids to screen names. Every id appearing as
+        source or neighbour becomes a node; nodes without out-edges get empty
+        rows.
+    """
+    names = names or {}
+    rows = {}
+    for source, neighbours in edges.items():
+        rows[int(source)] = array.array('q', sorted(set(int(neighbour) for neighbour in neighbours)))
+    node_set = set(rows)
+    for row in rows.values():
+        node_set.update(row)
+    nodes = sorted(node_set)
+    del node_set
+
+    os.makedirs(directory, exist_ok=True)
+    _write_int64(os.path.join(directory, _nodes_filename), nodes)
+    offsets = array.array('q', [0])
+    with open(os.path.join(directory, _neighbours_filename), mode='wb') as fd:
+        for node in nodes:
+            row = rows.get(node, array.array('q'))
+            if sys.byteorder != 'little':
+                row.byteswap()
+            row.tofile(fd)
+            offsets.append(offsets[-1] + len(row))
+    _write_int64(os.path.join(directory, _offsets_filename), offsets)
+    with open(os.path.join(directory, _names_filename), mode='wt', encoding='utf-8') as fd:
+        for node in nodes:
+            fd.write(names.get(node, ''))
+            fd.write('\n')
+    with open(os.path.join(directory, _meta_filename), mode='wt', encoding='ascii') as fd:
+        json.dump({'version'    : _layout_version,
+                   'nodes'      : len(nodes),
+                   'edges'      : offsets[-1],
+                  }, fd, sort_keys=True)
+    return len(nodes), offsets[-1]
+
+
+class GraphReader:
+    """ Memory-mapped read access to a graph written by write_graph().
+
+        Neighbour lists are returned as numpy arrays (views over the mapped file)
+        when numpy is available, otherwise as memoryview slices. Screen names are
+        loaded lazily on the first name lookup.
+    """
+
+
+    _directory                      = None
+    _meta                           = None
+    _files                          = None
+    _maps                           = None
+    _nodes                          = None
+    _offsets                        = None
+    _neighbours                     = None
+    _names                          = None
+    _ids_by_name                    = None
+
+
+    def __init__(self, directory):
+        self._directory = directory
+        with open(os.path.join(directory, _meta_filename), mode='rt', encoding='ascii') as fd:
+            self._meta = json.load(fd)
+        if self._meta['version'] != _layout_version:
+            raise Exception('Unsupported graph layout version {} in {}.'.format(self._meta['version'], directory))
+        self._files = []
+        self._maps = []
+        self._nodes = self._map(_nodes_filename)
+        self._offsets = self._map(_offsets_filename)
+        self._neighbours = self._map(_neighbours_filename)
+
+
+    def _map(self, filename):
+        filename = os.path.join(self._directory, filename)
+        if numpy is not None:
+            if os.path.getsize(filename) == 0:
+                return numpy.zeros(0, dtype='<i8')
+            return numpy.memmap(filename, dtype='<i8', mode='r')
+        if sys.byteorder != 'little':
+            raise Exception('Reading graphs without numpy requires a little-endian platform.')
+        fd = open(filename, mode='rb')
+        self._files.append(fd)
+        if os.path.getsize(filename) == 0:
+            return memoryview(b'').cast('q')
+        mapped = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps.append(mapped)
+        return memoryview(mapped).cast('q')
+
+
+    def _index(self, user_id):
+        user_id = int(user_id)
+        if numpy is not None:
+            idx = int(numpy.searchsorted(self._nodes, user_id))
+        else:
+            idx = bisect.bisect_left(self._nodes, user_id)
+        if idx == len(self._nodes) or self._nodes[idx] != user_id:
+            raise KeyError(user_id)
+        return idx
+
+
+    def _load_names(self):
+        with open(os.path.join(self._directory, _names_filename), mode='rt', encoding='utf-8') as fd:
+            self._names = [ line.rstrip('\n') for line in fd ]
+        self._ids_by_name = {}
+        for idx, name in enumerate(self._names):
+            if name:
+                self._ids_by_name[name] = int(self._nodes[idx])
+
+
+    def __len__(self):
+        return self._meta['nodes']
+
+
+    def __contains__(self, user_id):
+        try:
+            self._index(user_id)
+        except KeyError:
+            return False
+        return True
+
+
+    def number_of_edges(self):
+        return self._meta['edges']
+
+
+    def nodes(self):
+        return self._nodes
+
+
+    def arrays(self):
+        """ Returns the (nodes, offsets, neighbours) arrays of the CSR layout.
+        """
+        return self._nodes, self._offsets, self._neighbours
+
+
+    def neighbours(self, user_id):
+        """ Returns the sorted neighbour ids of 'user_id' (empty if it has no out-edges).
+        """
+        idx = self._index(user_id)
+        return self._neighbours[self._offsets[idx]:self._offsets[idx+1]]
+
+
+    def degree(self, user_id):
+        idx = self._index(user_id)
+        return int(self._offsets[idx+1] - self._offsets[idx])
+
+
+    def screen_name(self, user_id):
+        if self._names is None:
+            self._load_names()
+        return self._names[self._index(user_id)]
+
+
+    def user_id(self, screen_name):
+        if self._ids_by_name is None:
+            self._load_names()
+        return self._ids_by_name[screen_name]
+
+
+    def close(self):
+        # numpy arrays and memoryviews must be released before the maps are closed
+        self._nodes = self._offsets = self._neighbours = None
+        for mapped in self._maps:
+            mapped.close()
+        for fd in self._files:
+            fd.close()
+        self._maps = []
+        self._files = []
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
@@ -0,0 +1,238 @@
+""" Coordination of several collecting workers (processes, possibly on different
+    hosts sharing a filesystem) through a shared SQLite database of work units.
+
+    Work units (e.g. user id ranges, expressions or tweet id chunks) are added
+    once to the database. Each worker, holding its own TwitterReader and
+    credential, leases a unit, renews the lease with heartbeats while working on
+    it and marks it as done at the end. Leases not renewed in time (e.g. the
+    worker died) expire and the unit is leased again by another worker.
+
+    SQLite locking relies on the filesystem locks, which are reliable on local
+    filesystems and on most (but not all) network filesystems [1].
+
+References:
+    [1] https://www.sqlite.org/lockingv3.html#how_to_corrupt
+"""
+
+
+import os
+import json
+import time
+import socket
+import sqlite3
+import logging
+import threading
+
+
+class LeaseLostException(Exception):
+    pass
+
+
+class WorkUnit:
+
+
+    def __init__(self, unit_id, key, kind, payload, attempts):
+        self.unit_id = unit_id
+        self.key = key
+        self.kind = kind
+        self.payload = payload
+        self.attempts = attempts
+
+
+    def __repr__(self):
+        return '<WorkUnit {} ({}) attempt {}>'.format(self.key, self.kind, self.attempts)
+
+
+class LeaseDatabase:
+
+
+    _filename                       = None
+    _lease_sec                      = None
+    _max_attempts                   = None
+    _connection                     = None
+    _lock                           = None
+    _logger                         = None
+
+
+    def __init__(self, filename, lease_sec = 600, max_attempts = 5):
+        """ Opens (creating if absent) the database 'filename'. Leases last
+            'lease_sec' seconds unless renewed, and units failing 'max_attempts'
+            times are not leased anymore.
+        """
+        self._filename = filename
+        self._lease_sec = lease_sec
+        self._max_attempts = max_attempts
+        self._lock = threading.Lock()       # the connection is shared by the worker and its heartbeat thread
+        self._connection = sqlite3.connect(filename, timeout=60, isolation_level=None, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=DELETE')     # WAL needs shared memory, not available across hosts
+        self._connection.execute('''CREATE TABLE IF NOT EXISTS units (
+                                        unit_id         INTEGER PRIMARY KEY,
+                                        key             TEXT UNIQUE NOT NULL,
+                                        kind            TEXT NOT NULL,
+                                        payload         TEXT NOT NULL,
+                                        status          TEXT NOT NULL DEFAULT 'pending',
+                                        worker          TEXT,
+                                        lease_expires   REAL,
+                                        attempts        INTEGER NOT NULL DEFAULT 0,
+                                        error           TEXT
+                                    )''')
+        self._connection.execute('CREATE INDEX IF NOT EXISTS units_status ON units (status, lease_expires)')
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+
+    def _transaction(self, function, *args):
+        """ Runs 'function(cursor, *args)' in an immediate (write-locked) transaction.
+        """
+        with self._lock:
+            cursor = self._connection.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                result = function(cursor, *args)
+            except BaseException:
+                cursor.execute('ROLLBACK')
+                raise
+            cursor.execute('COMMIT')
+            return result
+
+
+    def add_units(self, kind, units):
+        """ Adds work units of 'kind' from an iterable of (key, payload) pairs,
+            where 'payload' is any JSON serializable object. Units with keys
+            already in the database are ignored, so adding is idempotent. Returns
+            the number of units added.
+        """
+        def add(cursor):
+            before = cursor.execute('SELECT COUNT(*) FROM units').fetchone()[0]
+            cursor.executemany('INSERT OR IGNORE INTO units (key, kind, payload) VALUES (?, ?, ?)',
+                               ((str(key), kind, json.dumps(payload)) for key, payload in units))
+            return cursor.execute('SELECT COUNT(*) FROM units').fetchone()[0] - before
+        return self._transaction(add)
+
+
+    def acquire(self, worker_id, kinds = None):
+        """ Leases a pending unit (or a unit whose lease expired) to 'worker_id'.
+            Returns a WorkUnit or None if no unit is available now. Expired
+            leases of units without attempts left are marked as failed.
+        """
+        def acquire(cursor):
+            now = time.time()
+            cursor.execute('''UPDATE units SET status = 'failed', lease_expires = NULL, error = COALESCE(error, 'Lease expired with no attempts left.')
+                              WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?''', (now, self._max_attempts))
+            query = '''SELECT unit_id, key, kind, payload, attempts FROM units
+                       WHERE (status = 'pending' OR (status = 'leased' AND lease_expires < ?)) AND attempts < ?'''
+            params = [now, self._max_attempts]
+            if kinds:
+                query += ' AND kind IN ({})'.format(','.join('?' * len(kinds)))
+                params += list(kinds)
+            row = cursor.execute(query + ' ORDER BY unit_id LIMIT 1', params).fetchone()
+            if row is None:
+                return None
+            cursor.execute('''UPDATE units SET status = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1
+                              WHERE unit_id = ?''', (worker_id, now + self._lease_sec, row[0]))
+            return WorkUnit(row[0], row[1], row[2], json.loads(row[3]), row[4] + 1)
+        unit = self._transaction(acquire)
+        if unit:
+            self._logger.debug('Worker {} leased {}.'.format(worker_id, unit))
+        return unit
+
+
+    def heartbeat(self, unit, worker_id):
+        """ Renews the lease of 'unit'. Raises LeaseLostException if the lease
+            expired and the unit was leased by another worker meanwhile.
+        """
+        def renew(cursor):
+            cursor.execute('''UPDATE units SET lease_expires = ?
+                              WHERE unit_id = ? AND worker = ? AND status = 'leased' ''', (time.time() + self._lease_sec, unit.unit_id, worker_id))
+            return cursor.rowcount
+        if not self._transaction(renew):
+            raise LeaseLostException('Lease of {} lost by worker {}.'.format(unit, worker_id))
+
+
+    def complete(self, unit, worker_id):
+        def complete(cursor):
+            cursor.execute('''UPDATE units SET status = 'done', lease_expires = NULL, error = NULL
+                              WHERE unit_id = ? AND worker = ?''', (unit.unit_id, worker_id))
+            return cursor.rowcount
+        if not self._transaction(complete):
+            raise LeaseLostException('Lease of {} lost by worker {}.'.format(unit, worker_id))
+
+
+    def release(self, unit, worker_id, error = None):
+        """ Gives 'unit' back to the pending ones (e.g. after an error), to be
+            leased again while it has attempts left.
+        """
+        def release(cursor):
+            status = 'pending' if unit.attempts < self._max_attempts else 'failed'
+            cursor.execute('''UPDATE units SET status = ?, lease_expires = NULL, error = ?
+                              WHERE unit_id = ? AND worker = ? AND status = 'leased' ''', (status, error, unit.unit_id, worker_id))
+        self._transaction(release)
+
+
+    def progress(self):
+        """ Returns the number of units per status ('pending', 'leased', 'done', 'failed').
+        """
+        with self._lock:
+            return dict(self._connection.execute('SELECT status, COUNT(*) FROM units GROUP BY status').fetchall())
+
+
+    def has_active_leases(self):
+        """ Returns whether units are leased by workers that may still finish them
+            or hand them over (expired leases with attempts left).
+        """
+        with self._lock:
+            return bool(self._connection.execute('''SELECT COUNT(*) FROM units
+                                                    WHERE status = 'leased' AND (lease_expires >= ? OR attempts < ?)''', (time.time(), self._max_attempts)).fetchone()[0])
+
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+def default_worker_id():
+    return '{}:{}'.format(socket.gethostname(), os.getpid())
+
+
+def run_worker(database, handler, worker_id = None, kinds = None, heartbeat_sec = None, idle_sleep_sec = 30):
+    """ Leases units from 'database' and calls 'handler(unit)' for each one until
+    no unit is left, renewing the lease every 'heartbeat_sec' seconds (default =
+    a third of the lease time) in a background thread. Units whose handler raises
+    are released with the error message. While other workers hold leases, it
+    waits 'idle_sleep_sec' seconds between attempts, taking over the units of
+    workers that die. Returns the number of units processed by this worker.
+    """
+    logger = logging.getLogger(__name__)
+    worker_id = worker_id or default_worker_id()
+    heartbeat_sec = heartbeat_sec or database._lease_sec / 3
+    processed = 0
+    while True:
+        unit = database.acquire(worker_id, kinds)
+        if unit is None:
+            if not database.has_active_leases():
+                return processed
+            time.sleep(idle_sleep_sec)
+            continue
+
+        stop_heartbeat = threading.Event()
+        def beat():
+            while not stop_heartbeat.wait(heartbeat_sec):
+                try:
+                    database.heartbeat(unit, worker_id)
+                except Exception as e:
+                    logger.warning('Heartbeat of {} failed. Error: {}'.format(unit, e))
+        heartbeat = threading.Thread(target=beat, daemon=True)
+        heartbeat.start()
+        try:
+            handler(unit)
+        except Exception as e:
+            logger.error('Error processing {}. Error: {} Releasing it ...'.format(unit, e))
+            database.release(unit, worker_id, str(e))
+        else:
+            try:
+                database.complete(unit, worker_id)
+            except LeaseLostException as e:       # the unit was handed over, handlers must write their output idempotently
+                logger.warning(str(e))
+            processed += 1
+        finally:
+            stop_heartbeat.set()
+            heartbeat.join()
@@ -0,0 +1,135 @@
+""" Persistent negative cache of the users whose requests failed because they
+    were not found, suspended or protected, kept in a SQLite database.
+    TwitterReader checks it before requesting the data of a user (raising the
+    same exception the request would raise) and records the failures, so later
+    runs don't spend requests on these users again until the entry of the
+    failure reason expires (see DEFAULT_TTLS).
+
+    Users are identified by id or by screen name ('kind' = 'user_id' or
+    'screen_name'), as the resources requested with each of them.
+
+    Example:
+        negative = NegativeCache('negative.db')
+        twitter_conn = twitter.TwitterReader(app_name, consumer_key, consumer_secret, negative_cache=negative)
+        user_ids = list(negative.filter(user_ids))     # pre-filtering an input list
+"""
+
+
+import time
+import sqlite3
+import logging
+import threading
+
+
+# seconds an entry of each reason is valid
+DEFAULT_TTLS = {'not_found'     : 30 * 24 * 3600,   # deleted accounts rarely come back
+                'suspended'     : 7 * 24 * 3600,
+                'protected'     : 24 * 3600,        # users switch their tweets between protected and public
+                'missing'       : 7 * 24 * 3600,    # absent from a bulk lookup (not found or suspended)
+               }
+
+REASONS = tuple(DEFAULT_TTLS)
+
+
+class NegativeCache:
+
+
+    _filename                       = None
+    _connection                     = None
+    _lock                           = None
+    _ttls                           = None
+    _logger                         = None
+
+
+    def __init__(self, filename, ttls = None):
+        """ Opens (creating if absent) the database 'filename'. 'ttls' overrides
+            the TTLs of DEFAULT_TTLS (0 disables the entries of a reason).
+        """
+        self._filename = filename
+        self._ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(filename, check_same_thread=False)     # shared by the reader threads, serialised by the lock
+        self._connection.execute('''CREATE TABLE IF NOT EXISTS users (
+                                        kind            TEXT NOT NULL,
+                                        user            TEXT NOT NULL,
+                                        reason          TEXT NOT NULL,
+                                        recorded_at     REAL NOT NULL,
+                                        expires_at      REAL NOT NULL,
+                                        message         TEXT,
+                                        PRIMARY KEY (kind, user)
+                                    ) WITHOUT ROWID''')
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+
+    @staticmethod
+    def _user(user, kind):
+        return str(user).strip().lower() if kind == 'screen_name' else str(int(user))
+
+
+    def get(self, user, kind = 'user_id'):
+        """ Returns the reason of the unexpired entry of 'user', or None.
+        """
+        with self._lock:
+            row = self._connection.execute('SELECT reason FROM users WHERE kind = ? AND user = ? AND expires_at >= ?',
+                                           (kind, self._user(user, kind), time.time())).fetchone()
+        return row[0] if row else None
+
+
+    def add(self, user, reason, message = None, kind = 'user_id'):
+        if reason not in self._ttls:
+            raise ValueError('Unknown reason {}, expected one of {}.'.format(reason, REASONS))
+        if not self._ttls[reason]:
+            return
+        now = time.time()
+        with self._lock:
+            self._connection.execute('INSERT OR REPLACE INTO users VALUES (?, ?, ?, ?, ?, ?)',
+                                     (kind, self._user(user, kind), reason, now, now + self._ttls[reason], message))
+            self._connection.commit()
+        self._logger.debug('User {} = {} added to the negative cache ({}).'.format(kind, user, reason))
+
+
+    def add_many(self, users, reason, kind = 'user_id'):
+        if not self._ttls.get(reason):
+            return
+        now = time.time()
+        with self._lock:
+            self._connection.executemany('INSERT OR REPLACE INTO users VALUES (?, ?, ?, ?, ?, NULL)',
+                                         [ (kind, self._user(user, kind), reason, now, now + self._ttls[reason]) for user in users ])
+            self._connection.commit()
+
+
+    def remove(self, user, kind = 'user_id'):
+        with self._lock:
+            self._connection.execute('DELETE FROM users WHERE kind = ? AND user = ?', (kind, self._user(user, kind)))
+            self._connection.commit()
+
+
+    def filter(self, users, kind = 'user_id', reasons = REASONS):
+        """ Yields the users of the iterable 'users' without an unexpired entry
+            of one of 'reasons', e.g. to pre-filter the input of a bulk lookup.
+        """
+        for user in users:
+            if self.get(user, kind) not in reasons:
+                yield user
+
+
+    def purge(self):
+        """ Deletes the expired entries and returns their number.
+        """
+        with self._lock:
+            deleted = self._connection.execute('DELETE FROM users WHERE expires_at < ?', (time.time(),)).rowcount
+            self._connection.commit()
+        return deleted
+
+
+    def counts(self):
+        """ Returns the number of unexpired entries of each reason.
+        """
+        with self._lock:
+            return dict(self._connection.execute('SELECT reason, COUNT(*) FROM users WHERE expires_at >= ? GROUP BY reason', (time.time(),)).fetchall())
+
+
+    def close(self):
+        with self._lock:
+            self._connection.commit()
+            self._connection.close()
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+
+
+""" Cost planner of collecting jobs. It estimates, before running a job, the
+    number of requests of each resource and the wall time needed with one or
+    more credentials, from the page sizes of the resources, their rate limit
+    windows [1] and, when available, the profile counts of the users
+    ('statuses_count', 'friends_count' and 'followers_count' [2]).
+
+    Each resource family has its own rate limit window, so with jobs running in
+    parallel (e.g. with scheduler.JobScheduler) the wall time is the time of
+    the slowest resource, the bottleneck. Estimates are upper bounds for
+    timelines (most users have less than the maximum of 3200 retrievable
+    tweets [3]) and rough for searches, whose results depend on the activity of
+    the expressions.
+
+    Usage:
+        ./planner.py --timelines users.txt --profiles users.jsonl --credentials 1 2 4
+
+References:
+    [1] https://developer.twitter.com/en/docs/basics/rate-limits
+    [2] https://developer.twitter.com/en/docs/tweets/data-dictionary/overview/user-object
+    [3] https://developer.twitter.com/en/docs/tweets/timelines/api-reference/get-statuses-user_timeline
+"""
+
+
+import math
+import json
+import argparse
+import collections
+
+
+WINDOW_SEC = 15 * 60
+
+# requests per window with application-only authentication [1]
+WINDOW_LIMITS = {'/users/show'              : 900,
+                 '/users/lookup'            : 300,
+                 '/statuses/user_timeline'  : 1500,
+                 '/search/tweets'           : 450,
+                 '/statuses/retweeters'     : 300,
+                 '/statuses/lookup'         : 300,
+                 '/friends/list'            : 30,
+                 '/followers/list'          : 30,
+                 '/friends/ids'             : 15,
+                 '/followers/ids'           : 15,
+                 '/friendships/show'        : 15,
+                }
+
+# results per request
+PAGE_SIZES = {'/users/lookup'               : 100,
+              '/statuses/user_timeline'     : 200,
+              '/search/tweets'              : 100,
+              '/statuses/retweeters'        : 100,
+              '/statuses/lookup'            : 100,
+              '/friends/list'               : 200,
+              '/followers/list'             : 200,
+              '/friends/ids'                : 5000,
+              '/followers/ids'              : 5000,
+             }
+
+MAX_TIMELINE_TWEETS = 3200
+
+
+class JobPlan:
+    """ Estimated requests per resource of one or more jobs (plans are added
+        with +).
+    """
+
+
+    def __init__(self, requests = None, notes = None):
+        self.requests = collections.Counter(requests or {})
+        self.notes = list(notes or [])
+
+
+    def __add__(self, other):
+        return JobPlan(self.requests + other.requests, self.notes + other.notes)
+
+
+    def resource_time_sec(self, resource, credentials = 1, request_sec = 0.5):
+        """ Estimated seconds to send the requests of 'resource' with
+            'credentials' credentials: the full windows waited for plus the time
+            of the requests of the last window, each one taking 'request_sec'
+            seconds (credentials used in parallel).
+        """
+        requests = self.requests[resource]
+        if not requests:
+            return 0
+        capacity = WINDOW_LIMITS[resource] * credentials
+        full_windows = (requests - 1) // capacity
+        return full_windows * WINDOW_SEC + math.ceil((requests - full_windows * capacity) / credentials) * request_sec
+
+
+    def wall_time_sec(self, credentials = 1, parallel = True, request_sec = 0.5):
+        """ Estimated wall time: the time of the slowest resource if the resources
+            are used in parallel, otherwise the sum of the times.
+        """
+        times = [ self.resource_time_sec(resource, credentials, request_sec) for resource in self.requests ]
+        if not times:
+            return 0
+        return max(times) if parallel else sum(times)
+
+
+    def bottleneck(self, credentials = 1, request_sec = 0.5):
+        """ Returns (resource, family, seconds) of the slowest resource, or None
+            for an empty plan.
+        """
+        if not self.requests:
+            return None
+        resource = max(self.requests, key=lambda resource: self.resource_time_sec(resource, credentials, request_sec))
+        return resource, resource.split('/')[1], self.resource_time_sec(resource, credentials, request_sec)
+
+
+    def report(self, credentials = (1,), request_sec = 0.5):
+        lines = ['{:<26} {:>12} {:>10}'.format('Resource', 'Requests', 'Windows')]
+        for resource in sorted(self.requests):
+            lines.append('{:<26} {:>12} {:>10}'.format(resource, self.requests[resource], math.ceil(self.requests[resource] / WINDOW_LIMITS[resource])))
+        for count in credentials:
+            resource, family, _ = self.bottleneck(count, request_sec)
+            lines.append('With {} credential(s): {} in parallel ({} sequentially). Bottleneck: {} (family \'{}\').'.format(
+                         count, _format_duration(self.wall_time_sec(count, True, request_sec)), _format_duration(self.wall_time_sec(count, False, request_sec)), resource, family))
+        lines += [ 'Note: ' + note for note in self.notes ]
+        return '\n'.join(lines)
+
+
+def _format_duration(seconds):
+    days, seconds = divmod(int(seconds), 86400)
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    return '{}d {:02d}h {:02d}m {:02d}s'.format(days, hours, minutes, seconds) if days else '{:02d}h {:02d}m {:02d}s'.format(hours, minutes, seconds)
+
+
+def _pages(results, resource):
+    return math.ceil(results / PAGE_SIZES[resource])
+
+
+def _profile(user, profiles):
+    """ Returns the user object of 'user' (a user object, id or screen name) in
+        'profiles' (a dictionary by id and screen name), or None.
+    """
+    if isinstance(user, dict):
+        return user
+    return profiles.get(str(user)) if profiles else None
+
+
+def plan_timelines(users, profiles = None, with_user_info = True, default_statuses_count = MAX_TIMELINE_TWEETS):
+    """ Plans get_user_timeline() (and get_user_info() if 'with_user_info') for
+        'users' (user objects, ids or screen names). Users without a known
+        'statuses_count' are assumed to have 'default_statuses_count' tweets.
+    """
+    plan = JobPlan()
+    unknown = 0
+    for user in users:
+        profile = _profile(user, profiles)
+        if profile is None or 'statuses_count' not in profile:
+            unknown += 1
+            statuses = default_statuses_count
+        else:
+            statuses = profile['statuses_count']
+        statuses = min(statuses, MAX_TIMELINE_TWEETS)
+        plan.requests['/statuses/user_timeline'] += _pages(statuses, '/statuses/user_timeline') + (2 if statuses else 1)    # an empty last page and the request of the newer tweets
+        if with_user_info:
+            plan.requests['/users/show'] += 1
+    if unknown:
+        plan.notes.append('{} users without a known statuses_count, assumed to have {} tweets.'.format(unknown, default_statuses_count))
+    return plan
+
+
+def plan_search(expressions, max_results = 1000, default_results = 1000):
+    """ Plans search_expression() of each expression. Searches without limit
+        ('max_results' = 0) are assumed to find 'default_results' tweets.
+    """
+    plan = JobPlan()
+    results = max_results or default_results
+    for _ in expressions:
+        plan.requests['/search/tweets'] += max(1, _pages(results, '/search/tweets'))
+    if not max_results:
+        plan.notes.append('Searches without limit assumed to find {} tweets per expression.'.format(default_results))
+    return plan
+
+
+def plan_hydration(tweet_ids):
+    """ Plans hydrate_tweets() of 'tweet_ids' (an iterable of ids, the name of a
+        file with one id per line or the number of ids).
+    """
+    return JobPlan({'/statuses/lookup': _pages(_count_ids(tweet_ids), '/statuses/lookup')})
+
+
+def plan_users_info(user_ids):
+    """ Plans get_users_info() of 'user_ids' (as in plan_hydration()).
+    """
+    return JobPlan({'/users/lookup': _pages(_count_ids(user_ids), '/users/lookup')})
+
+
+def plan_graph(users, direction = 'friends', profiles = None, default_count = 1000, ids = False):
+    """ Plans get_friends() or get_followers() ('direction' = 'friends' or
+        'followers') of 'users', or get_friend_ids() or get_follower_ids() if
+        'ids'. Users without a known 'friends_count' or 'followers_count' are
+        assumed to have 'default_count' of them.
+    """
+    resource = '/{}/{}'.format(direction, 'ids' if ids else 'list')
+    count_key = '{}_count'.format(direction)
+    plan = JobPlan()
+    unknown = 0
+    for user in users:
+        profile = _profile(user, profiles)
+        if profile is None or count_key not in profile:
+            unknown += 1
+            count = default_count
+        else:
+            count = profile[count_key]
+        plan.requests[resource] += max(1, _pages(count, resource))
+    if unknown:
+        plan.notes.append('{} users without a known {}, assumed to have {}.'.format(unknown, count_key, default_count))
+    return plan
+
+
+def _count_ids(ids):
+    if isinstance(ids, int):
+        return ids
+    if isinstance(ids, str):
+        with open(ids, mode='rt', encoding='ascii') as fd:
+            return sum(1 for line in fd if line.strip())
+    return sum(1 for _ in ids)
+
+
+def load_profiles(filename):
+    """ Reads user objects (a JSON array or JSON lines, e.g. the output of
+        collect_users.py or get_users_info()) into a dictionary by id and screen
+        name, as used by the planning functions.
+    """
+    with open(filename, mode='rt', encoding='utf-8') as fd:
+        data = fd.read()
+    users = json.loads(data) if data.lstrip().startswith('[') else [ json.loads(line) for line in data.splitlines() if line.strip() ]
+    profiles = {}
+    for user in users:
+        profiles[user['id_str']] = user
+        profiles[user['screen_name']] = user
+    return profiles
+
+
+def _read_first_column(filename):
+    """ Reads the first column of each line (e.g. the ids of the "id screen_name"
+        users files).
+    """
+    with open(filename, mode='rt', encoding='utf-8') as fd:
+        return [ line.split()[0] for line in fd if line.strip() ]
+
+
+def command_line_parsing():
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--timelines', '-t',
+                        default=None,
+                        help='File with the users (one id per line, optionally followed by the screen name) to have their timelines collected.')
+    parser.add_argument('--expressions', '-x',
+                        default=None,
+                        help='File with the expressions to be searched, one per line.')
+    parser.add_argument('--max_results', '-m',
+                        type=int,
+                        default=1000,
+                        help='Maximum number of results per expression. Default = 1000 (0 = no limit).')
+    parser.add_argument('--hydrate', '-y',
+                        default=None,
+                        help='File with the tweet ids to be hydrated, one per line.')
+    parser.add_argument('--users_info', '-u',
+                        default=None,
+                        help='File with the user ids to have their profiles collected, one per line.')
+    parser.add_argument('--friends', '-f',
+                        default=None,
+                        help='File with the seed users (ids or screen names) to have their friends collected.')
+    parser.add_argument('--followers', '-w',
+                        default=None,
+                        help='File with the seed users (ids or screen names) to have their followers collected.')
+    parser.add_argument('--ids', '-i',
+                        action='store_true',
+                        default=False,
+                        help='Plan the friends and followers as ids only (get_friend_ids() and get_follower_ids()).')
+    parser.add_argument('--profiles', '-p',
+                        default=None,
+                        help='File with user objects (JSON array or JSON lines) with the profile counts of the users.')
+    parser.add_argument('--credentials', '-c',
+                        type=int,
+                        nargs='+',
+                        default=[1],
+                        help='Numbers of credentials to estimate the wall time with. Default = 1.')
+    parser.add_argument('--request_sec', '-r',
+                        type=float,
+                        default=0.5,
+                        help='Average duration of a request in seconds. Default = 0.5.')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = command_line_parsing()
+    profiles = load_profiles(args.profiles) if args.profiles else None
+    plan = JobPlan()
+    if args.timelines:
+        plan += plan_timelines(_read_first_column(args.timelines), profiles)
+    if args.expressions:
+        with open(args.expressions, mode='rt', encoding='utf-8') as fd:
+            plan += plan_search(set(line.strip().lower() for line in fd if line.strip()), args.max_results)
+    if args.hydrate:
+        plan += plan_hydration(args.hydrate)
+    if args.users_info:
+        plan += plan_users_info(args.users_info)
+    if args.friends:
+        plan += plan_graph(_read_first_column(args.friends), 'friends', profiles, ids=args.ids)
+    if args.followers:
+        plan += plan_graph(_read_first_column(args.followers), 'followers', profiles, ids=args.ids)
+    if not plan.requests:
+        print('Nothing to plan. See --help.')
+    else:
+        print(plan.report(args.credentials, args.request_sec))
@@ -0,0 +1,242 @@
+""" Wall time accounting of TwitterReader calls, enabled with its 'profile'
+    parameter. The time of each public call (and of each job, see
+    TwitterReader.profile_job()) is split into phases:
+
+        connect             TCP and TLS connections and reconnections
+        rate_limit_wait     sleeps waiting for a new rate limit window
+        first_byte          from sending a request until the response headers
+        body                transfer of the response body
+        decode              JSON decoding
+        caller              processing of the caller between pages
+        output              writing the results (see TwitterReader.profile_phase())
+        other               the remaining time of the call
+
+    Phases are exclusive (a nested phase is not accounted in the enclosing one)
+    and are summed over the threads, so with prefetching or concurrent lookups
+    the phases of a call can add up to more than its wall time.
+
+    Optionally, the memory allocated by Python is traced with tracemalloc [1]
+    at each page boundary, and the report includes the peak memory of each call
+    and the lines whose allocations grew the most during the profiling.
+
+References:
+    [1] https://docs.python.org/3/library/tracemalloc.html
+"""
+
+
+import time
+import threading
+import contextlib
+import collections
+import tracemalloc
+
+
+PHASES = ('connect', 'rate_limit_wait', 'first_byte', 'body', 'decode', 'caller', 'output')
+
+
+class NullProfiler:
+    """ Profiler that records nothing, used when profiling is disabled.
+    """
+
+
+    _null_context = contextlib.nullcontext()
+
+
+    def phase(self, name):
+        return self._null_context
+
+
+    def call(self, name):
+        return self._null_context
+
+
+    def job(self, name):
+        return self._null_context
+
+
+    def wrap(self, function):
+        return function
+
+
+    def add(self, name, seconds):
+        pass
+
+
+    def page_boundary(self):
+        pass
+
+
+    def summary(self):
+        return {}
+
+
+    def report(self):
+        return ''
+
+
+    def close(self):
+        pass
+
+
+class WallTimeProfiler(NullProfiler):
+
+
+    _lock                           = None
+    _local                          = None
+    _totals                         = None          # (kind, name) -> phase -> seconds
+    _counts                         = None          # (kind, name) -> number of calls or jobs
+    _peaks                          = None          # (kind, name) -> peak traced memory in bytes
+    _trace_memory                   = None
+    _started_tracemalloc            = False         # whether tracemalloc was started here (and must be stopped in close())
+    _first_snapshot                 = None
+    _last_snapshot                  = None
+
+
+    def __init__(self, trace_memory = False):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._totals = collections.defaultdict(lambda: collections.defaultdict(float))
+        self._counts = collections.Counter()
+        self._peaks = {}
+        self._trace_memory = trace_memory
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+
+
+    def _labels(self):
+        local = self._local
+        return [ label for label in (getattr(local, 'call', None), getattr(local, 'job', None)) if label ]
+
+
+    def _stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+
+    def add(self, name, seconds):
+        """ Accounts 'seconds' to the phase 'name' of the current call and job of
+            the calling thread.
+        """
+        labels = self._labels() or [('call', '(outside calls)')]
+        with self._lock:
+            for label in labels:
+                self._totals[label][name] += seconds
+
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """ Accounts the time spent in the block to the phase 'name'. The phase
+            is removed from the stack by identity, not position, as a generator
+            suspended inside a phase (e.g. 'caller' around a yield) can be
+            abandoned and closed after phases opened later.
+        """
+        stack = self._stack()
+        entry = [time.perf_counter(), 0.0]     # start, time of the nested phases
+        stack.append(entry)
+        try:
+            yield
+        finally:
+            idx = next((idx for idx, other in enumerate(stack) if other is entry), None)
+            elapsed = time.perf_counter() - entry[0]
+            if idx is not None:
+                del stack[idx]
+                if idx:
+                    stack[idx - 1][1] += elapsed
+            self.add(name, elapsed - entry[1])
+
+
+    @contextlib.contextmanager
+    def _labelled(self, kind, name):
+        """ Sets the call or job ('kind') of the calling thread. Nested calls are
+            accounted in the outermost one.
+        """
+        if getattr(self._local, kind, None) is not None:
+            yield
+            return
+        label = (kind, name)
+        setattr(self._local, kind, label)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            setattr(self._local, kind, None)
+            with self._lock:
+                self._totals[label]['total'] += time.perf_counter() - start
+                self._counts[label] += 1
+
+
+    def call(self, name):
+        return self._labelled('call', name)
+
+
+    def job(self, name):
+        return self._labelled('job', name)
+
+
+    def wrap(self, function):
+        """ Returns 'function' accounted in the current call and job when called
+            from another thread (e.g. a prefetching thread).
+        """
+        call = getattr(self._local, 'call', None)
+        job = getattr(self._local, 'job', None)
+        def wrapper(*args, **kwargs):
+            self._local.call, self._local.job = call, job
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self._local.call = self._local.job = None
+        return wrapper
+
+
+    def page_boundary(self):
+        if not self._trace_memory:
+            return
+        _, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot()
+        with self._lock:
+            for label in self._labels():
+                self._peaks[label] = max(self._peaks.get(label, 0), peak)
+            if self._first_snapshot is None:
+                self._first_snapshot = snapshot
+            self._last_snapshot = snapshot
+        tracemalloc.reset_peak()
+
+
+    def summary(self):
+        """ Returns a dictionary mapping 'call <name>' and 'job <name>' to their
+            number of calls, total wall time, time per phase, 'other' time and,
+            with memory tracing, peak traced memory.
+        """
+        summary = {}
+        with self._lock:
+            for (kind, name), phases in self._totals.items():
+                entry = { phase: phases.get(phase, 0.0) for phase in PHASES }
+                entry['count'] = self._counts[(kind, name)]
+                entry['total'] = phases.get('total', 0.0)
+                entry['other'] = max(0.0, entry['total'] - sum(entry[phase] for phase in PHASES))
+                if (kind, name) in self._peaks:
+                    entry['peak_memory'] = self._peaks[(kind, name)]
+                summary['{} {}'.format(kind, name)] = entry
+        return summary
+
+
+    def report(self):
+        columns = ('count', 'total') + PHASES + ('other',)
+        lines = ['Wall time profile (seconds, phases summed over threads):',
+                 '{:<36}'.format('') + ''.join('{:>16}'.format(column) for column in columns)]
+        for label, entry in sorted(self.summary().items()):
+            lines.append('{:<36}'.format(label[:36]) + '{:>16}'.format(entry['count']) + ''.join('{:>16.3f}'.format(entry[column]) for column in columns[1:]))
+            if 'peak_memory' in entry:
+                lines.append('{:<36}peak traced memory = {:.1f} MB'.format('', entry['peak_memory'] / 2**20))
+        if self._first_snapshot is not None:
+            lines.append('Top allocation growth since the first page:')
+            lines += [ '    ' + str(stat) for stat in self._last_snapshot.compare_to(self._first_snapshot, 'lineno')[:10] ]
+        return '\n'.join(lines)
+
+
+    def close(self):
+        if self._started_tracemalloc and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self._started_tracemalloc = False
@@ -0,0 +1,199 @@
+""" Disk-backed cache of Twitter API responses, kept in a SQLite database, so
+    repeated requests (e.g. re-runs of an analysis during its development or
+    backfills over already collected users) are answered from the disk without
+    spending rate limits.
+
+    Responses are keyed by the method, the path and the sorted parameters of
+    the request, and stored zlib-compressed [1] with some of their headers.
+    Each resource has its own time to live (TTL, see DEFAULT_TTLS; resources
+    without TTL are not cached) and the least recently used responses are
+    evicted when the cache grows over its maximum size. Only successful
+    responses of read-only requests are cached: GETs and the '/users/lookup'
+    and '/statuses/lookup' POSTs (sent as POST only to fit long id lists).
+    Timeline and search requests without 'max_id' are not cached: their
+    results grow with every new tweet, and a stale head page would hide the
+    tweets published since it was cached (e.g. from timeline_coverage.py).
+
+    Example:
+        cache = ResponseCache('responses.db', max_bytes=2 * 2**30)
+        twitter_conn = twitter.TwitterReader(app_name, consumer_key, consumer_secret, cache=cache)
+
+References:
+    [1] https://docs.python.org/3/library/zlib.html
+"""
+
+
+import json
+import time
+import zlib
+import sqlite3
+import hashlib
+import logging
+import threading
+import urllib.parse
+
+
+# seconds a response of each resource is valid
+DEFAULT_TTLS = {'/users/show'               : 24 * 3600,
+                '/users/lookup'             : 24 * 3600,
+                '/statuses/user_timeline'   : 3600,
+                '/statuses/lookup'          : 7 * 24 * 3600,
+                '/statuses/retweeters'      : 3600,
+                '/search/tweets'            : 15 * 60,
+                '/friends/list'             : 24 * 3600,
+                '/followers/list'           : 24 * 3600,
+                '/friends/ids'              : 24 * 3600,
+                '/followers/ids'            : 24 * 3600,
+                '/friendships/show'         : 24 * 3600,
+               }
+
+_cacheable_posts = ('/users/lookup', '/statuses/lookup')
+_open_ended_resources = ('/statuses/user_timeline', '/search/tweets')     # cached only when bounded by 'max_id'
+_cached_headers = ('content-type', 'date', 'last-modified')
+
+
+class ResponseCache:
+
+
+    _filename                       = None
+    _connection                     = None
+    _lock                           = None
+    _ttls                           = None
+    _max_bytes                      = None
+    _level                          = None
+    _size                           = 0
+    _hits                           = 0
+    _misses                         = 0
+    _logger                         = None
+
+
+    def __init__(self, filename, max_bytes = 2**30, ttls = None, level = 6):
+        """ Opens (creating if absent) the cache database 'filename', holding at
+            most 'max_bytes' of compressed responses. 'ttls' overrides the TTLs
+            of DEFAULT_TTLS (None or 0 disables the cache of a resource) and
+            'level' is the zlib compression level.
+        """
+        self._filename = filename
+        self._ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self._max_bytes = max_bytes
+        self._level = level
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(filename, check_same_thread=False)     # shared by the reader threads, serialised by the lock
+        self._connection.executescript('''
+            CREATE TABLE IF NOT EXISTS responses (
+                key             TEXT PRIMARY KEY,
+                resource        TEXT NOT NULL,
+                expires_at      REAL NOT NULL,
+                last_used       REAL NOT NULL,
+                size            INTEGER NOT NULL,
+                headers         TEXT NOT NULL,
+                body            BLOB NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used);
+        ''')
+        self._size = self._connection.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+
+    def is_cacheable(self, method, resource, params = None):
+        if resource in _open_ended_resources and not (params or {}).get('max_id'):
+            return False
+        return bool(self._ttls.get(resource)) and (method == 'GET' or resource in _cacheable_posts)
+
+
+    @staticmethod
+    def key(method, url, params = None):
+        """ Returns the key of a request: a hash of its method, path and sorted
+            parameters.
+        """
+        normalised = '{} {}?{}'.format(method.upper(), url, urllib.parse.urlencode(sorted((str(name), str(value)) for name, value in (params or {}).items())))
+        return hashlib.blake2b(normalised.encode('utf-8'), digest_size=16).hexdigest()
+
+
+    def get(self, method, url, resource, params = None):
+        """ Returns the cached body (str) of the request, or None if absent or
+            expired.
+        """
+        if not self.is_cacheable(method, resource, params):
+            return None
+        key = self.key(method, url, params)
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute('SELECT body, expires_at FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None or row[1] < now:
+                self._misses += 1
+                return None
+            self._connection.execute('UPDATE responses SET last_used = ? WHERE key = ?', (now, key))
+            self._connection.commit()
+            self._hits += 1
+        return zlib.decompress(row[0]).decode('utf-8')
+
+
+    def put(self, method, url, resource, params, data, headers = None):
+        """ Stores the body 'data' (str) of a successful response, with the
+            relevant 'headers' (a dictionary), evicting the least recently used
+            responses if the cache grows over its maximum size.
+        """
+        if not self.is_cacheable(method, resource, params):
+            return
+        body = zlib.compress(data.encode('utf-8'), self._level)
+        headers = json.dumps({ name: value for name, value in (headers or {}).items() if name.lower() in _cached_headers and value is not None }, sort_keys=True)
+        size = len(body) + len(headers)
+        if size > self._max_bytes:
+            return
+        key = self.key(method, url, params)
+        now = time.time()
+        with self._lock:
+            old = self._connection.execute('SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+            self._connection.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                     (key, resource, now + self._ttls[resource], now, size, headers, body))
+            self._size += size - (old[0] if old else 0)
+            if self._size > self._max_bytes:
+                self._evict(self._max_bytes * 0.9)     # some room, so the next puts don't evict again
+            self._connection.commit()
+
+
+    def _evict(self, target_bytes):
+        """ Deletes the expired responses and then the least recently used ones
+            until the cache size is at most 'target_bytes'. Called with the lock held.
+        """
+        self._connection.execute('DELETE FROM responses WHERE expires_at < ?', (time.time(),))
+        self._size = self._connection.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        evicted = 0
+        while self._size > target_bytes:
+            rows = self._connection.execute('SELECT key, size FROM responses ORDER BY last_used LIMIT 100').fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                if self._size <= target_bytes:
+                    break
+                self._connection.execute('DELETE FROM responses WHERE key = ?', (key,))
+                self._size -= size
+                evicted += 1
+        self._logger.debug('{} responses evicted. Cache size = {} bytes.'.format(evicted, self._size))
+
+
+    def stats(self):
+        """ Returns the number of hits, misses, responses and bytes of the cache.
+        """
+        with self._lock:
+            responses = self._connection.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+            return {'hits': self._hits, 'misses': self._misses, 'responses': responses, 'bytes': self._size}
+
+
+    def clear(self, resource = None):
+        """ Deletes all the responses (or those of 'resource').
+        """
+        with self._lock:
+            if resource is None:
+                self._connection.execute('DELETE FROM responses')
+            else:
+                self._connection.execute('DELETE FROM responses WHERE resource = ?', (resource,))
+            self._size = self._connection.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+            self._connection.commit()
+
+
+    def close(self):
+        with self._lock:
+            self._connection.commit()
+            self._connection.close()
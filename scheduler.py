@@ -0,0 +1,210 @@
+""" Job scheduler on top of a TwitterReader. Twitter rate limits are independent
+    for each resource family (e.g. '/statuses/user_timeline' and '/friends/list'
+    have their own 15-minutes windows [1]), so running mixed jobs in parallel
+    makes the requests per window rise to the sum of the limits of all the
+    families used, instead of the limit of a single family.
+
+    Each resource has its own queue and worker threads. A worker dispatches the
+    next job of its resource only when the resource has budget left, choosing
+    the job group with the lowest share of dispatched jobs (weighted fair-share)
+    and, inside the group, the job with the highest priority (FIFO among equal
+    priorities).
+
+    Example:
+        scheduler = JobScheduler(twitter_conn)
+        timeline = scheduler.submit_call('get_user_timeline', '783214', group='timelines')
+        friends = scheduler.submit_call('get_friends', 'twitter', group='graph', priority=1)
+        scheduler.join()
+        print(len(timeline.result()), len(friends.result()))
+
+References:
+    [1] https://developer.twitter.com/en/docs/basics/rate-limits
+"""
+
+
+import logging
+import heapq
+import itertools
+import threading
+import concurrent.futures
+
+
+# resource accounted for each TwitterReader public method
+_method_resources = {'search_users'                     : '/search/tweets',
+                     'search_expression'                : '/search/tweets',
+                     'search_expression_partitioned'    : '/search/tweets',
+                     'get_user_info'                    : '/users/show',
+                     'get_users_info'                   : '/users/lookup',
+                     'get_user_timeline'                : '/statuses/user_timeline',
+                     'hydrate_tweets'                   : '/statuses/lookup',
+                     'hydrate_tweets_stream'            : '/statuses/lookup',
+                     'get_tweet'                        : '/statuses/lookup',
+                     'get_retweeters'                   : '/statuses/retweeters',
+                     'get_friends'                      : '/friends/list',
+                     'get_followers'                    : '/followers/list',
+                     'get_friend_ids'                   : '/friends/ids',
+                     'get_follower_ids'                 : '/followers/ids',
+                     'get_friendship'                   : '/friendships/show',
+                    }
+
+
+class Job:
+    """ A unit of work: 'function' is called as function(reader, *args, **kwargs)
+        and mainly consumes requests of 'resource'. The outcome is available
+        through 'future' (a concurrent.futures.Future).
+    """
+
+
+    def __init__(self, resource, function, *args, group = 'default', priority = 0, name = None, **kwargs):
+        self.resource = resource
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.group = group
+        self.priority = priority
+        self.name = name or getattr(function, '__name__', str(function))
+        self.future = concurrent.futures.Future()
+
+
+    def __repr__(self):
+        return '<Job {} group={} priority={} resource={}>'.format(self.name, self.group, self.priority, self.resource)
+
+
+class JobScheduler:
+
+
+    _reader                         = None
+    _group_weights                  = None
+    _workers_per_resource           = None
+    _budget_poll_sec                = 1
+    _condition                      = None
+    _queues                         = None          # resource -> group -> heap of (-priority, sequence, job)
+    _dispatched                     = None          # group -> number of dispatched jobs
+    _running                        = 0
+    _sequence                       = None
+    _workers                        = None
+    _stopped                        = False
+    _logger                         = None
+
+
+    def __init__(self, reader, group_weights = None, workers_per_resource = 1):
+        """ 'reader' is a connected TwitterReader, 'group_weights' optionally maps
+            job groups to their fair-share weights (default 1) and
+            'workers_per_resource' is the number of jobs of the same resource run
+            at once.
+        """
+        self._reader = reader
+        self._group_weights = dict(group_weights or {})
+        self._workers_per_resource = workers_per_resource
+        self._condition = threading.Condition()
+        self._queues = {}
+        self._dispatched = {}
+        self._sequence = itertools.count()
+        self._workers = {}
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+
+    def _next_job(self, resource):
+        """ Blocks until a job of 'resource' can be dispatched and returns it, or
+            returns None when the scheduler is stopped.
+        """
+        with self._condition:
+            while True:
+                if self._stopped:
+                    return None
+                groups = [ group for group, heap in self._queues[resource].items() if heap ]
+                if groups and self._reader.has_budget(resource):
+                    group = min(groups, key=lambda group: self._dispatched.get(group, 0) / self._group_weights.get(group, 1))
+                    job = heapq.heappop(self._queues[resource][group])[2]
+                    self._dispatched[group] = self._dispatched.get(group, 0) + 1
+                    self._running += 1
+                    return job
+                self._condition.wait(self._budget_poll_sec if groups else None)     # without budget, poll until the window renews
+
+
+    def _work(self, resource):
+        while True:
+            job = self._next_job(resource)
+            if job is None:
+                return
+            try:
+                if job.future.set_running_or_notify_cancel():
+                    self._logger.debug('Dispatching {} ...'.format(job))
+                    try:
+                        job.future.set_result(job.function(self._reader, *job.args, **job.kwargs))
+                    except Exception as e:
+                        self._logger.warning('Job {} failed. Error: {}'.format(job, e))
+                        job.future.set_exception(e)
+            finally:
+                if not job.future.done():   # interrupted by a BaseException
+                    job.future.set_exception(Exception('Job {} interrupted.'.format(job)))
+                with self._condition:
+                    self._running -= 1
+                    self._condition.notify_all()
+
+
+    def submit(self, job):
+        """ Queues 'job' and returns its future.
+        """
+        with self._condition:
+            if self._stopped:
+                raise Exception('Scheduler already shut down.')
+            if job.resource not in self._queues:
+                self._queues[job.resource] = {}
+                self._workers[job.resource] = []
+                for idx in range(self._workers_per_resource):
+                    worker = threading.Thread(target=self._work, args=(job.resource,), name='{}{}-{}'.format(self.__class__.__name__, job.resource, idx), daemon=True)
+                    worker.start()
+                    self._workers[job.resource].append(worker)
+            heapq.heappush(self._queues[job.resource].setdefault(job.group, []), (-job.priority, next(self._sequence), job))
+            self._condition.notify_all()
+        return job.future
+
+
+    def submit_call(self, method_name, *args, group = 'default', priority = 0, **kwargs):
+        """ Queues a call to the TwitterReader public method 'method_name' and
+            returns its future.
+        """
+        function = lambda reader, *args, **kwargs: getattr(reader, method_name)(*args, **kwargs)
+        return self.submit(Job(_method_resources[method_name], function, *args, group=group, priority=priority, name=method_name, **kwargs))
+
+
+    def pending(self):
+        """ Returns the number of queued jobs per resource.
+        """
+        with self._condition:
+            return { resource: sum(len(heap) for heap in groups.values()) for resource, groups in self._queues.items() }
+
+
+    def dispatched(self):
+        """ Returns the number of dispatched jobs per group.
+        """
+        with self._condition:
+            return dict(self._dispatched)
+
+
+    def join(self):
+        """ Blocks until every submitted job is finished.
+        """
+        with self._condition:
+            while self._running or any(heap for groups in self._queues.values() for heap in groups.values()):
+                self._condition.wait()
+
+
+    def shutdown(self, cancel_pending = False):
+        """ Stops the workers after their current jobs. Queued jobs are run first
+            unless 'cancel_pending' is set, in which case they are cancelled.
+        """
+        if not cancel_pending:
+            self.join()
+        with self._condition:
+            self._stopped = True
+            for groups in self._queues.values():
+                for heap in groups.values():
+                    for entry in heap:
+                        entry[2].future.cancel()
+                    heap.clear()
+            self._condition.notify_all()
+        for workers in self._workers.values():
+            for worker in workers:
+                worker.join()
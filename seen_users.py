@@ -0,0 +1,59 @@
+""" Persistent set of user ids already discovered, kept in a SQLite database so
+    the users' search (TwitterReader.search_users()) skips users found in
+    previous runs and spends its budget on words that still find new users.
+
+    Example:
+        seen = SeenUsersSet('seen_users.db')
+        for word in words:
+            users = twitter_conn.search_users(word, seen=seen, min_new_ratio=0.05)
+            seen.commit()
+        seen.close()
+"""
+
+
+import sqlite3
+
+
+class SeenUsersSet:
+    """ Set-like container of user ids (supports 'in', add(), len() and
+        iteration). Additions are saved by commit() and close().
+    """
+
+
+    _filename                       = None
+    _connection                     = None
+
+
+    def __init__(self, filename):
+        self._filename = filename
+        self._connection = sqlite3.connect(filename)
+        self._connection.execute('CREATE TABLE IF NOT EXISTS users (user_id INTEGER PRIMARY KEY)')
+
+
+    def __contains__(self, user_id):
+        return self._connection.execute('SELECT 1 FROM users WHERE user_id = ?', (int(user_id),)).fetchone() is not None
+
+
+    def add(self, user_id):
+        self._connection.execute('INSERT OR IGNORE INTO users VALUES (?)', (int(user_id),))
+
+
+    def update(self, user_ids):
+        self._connection.executemany('INSERT OR IGNORE INTO users VALUES (?)', ((int(user_id),) for user_id in user_ids))
+
+
+    def __len__(self):
+        return self._connection.execute('SELECT COUNT(*) FROM users').fetchone()[0]
+
+
+    def __iter__(self):
+        return ( row[0] for row in self._connection.execute('SELECT user_id FROM users ORDER BY user_id') )
+
+
+    def commit(self):
+        self._connection.commit()
+
+
+    def close(self):
+        self._connection.commit()
+        self._connection.close()
@@ -0,0 +1,194 @@
+""" Delta storage of repeated snapshots of user profiles (user objects [1]) in a
+    SQLite database.
+
+    Each snapshot only stores the fields that changed since the previous
+    snapshot of the same user. A hash of each profile and of each of its fields
+    is kept for the latest snapshot, so unchanged profiles (most of them in
+    periodic snapshots) are detected with a single lookup per batch and cost no
+    writes. Any user can be rebuilt as it was at any snapshot time.
+
+    Example:
+        store = ProfileSnapshotStore('profiles.db')
+        snapshot_id = store.begin_snapshot()
+        store.add_users(snapshot_id, twitter_conn.get_users_info(user_ids))
+        user = store.get_user(783214, at=datetime.datetime(2019, 6, 1))
+        locations = store.field_values('location')
+
+References:
+    [1] https://developer.twitter.com/en/docs/tweets/data-dictionary/overview/user-object
+"""
+
+
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import datetime
+
+
+def _hash(value, digest_size = 8):
+    return hashlib.blake2b(json.dumps(value, sort_keys=True, ensure_ascii=True).encode('ascii'), digest_size=digest_size).hexdigest()
+
+
+class ProfileSnapshotStore:
+
+
+    _filename                       = None
+    _ignored_fields                 = None
+    _connection                     = None
+    _logger                         = None
+
+
+    def __init__(self, filename, ignored_fields = ()):
+        """ Opens (creating if absent) the database 'filename'. The fields in
+            'ignored_fields' (e.g. 'status', the last tweet of the user) are not
+            stored nor compared.
+        """
+        self._filename = filename
+        self._ignored_fields = set(ignored_fields)
+        self._connection = sqlite3.connect(filename)
+        self._connection.executescript('''
+            CREATE TABLE IF NOT EXISTS snapshots (
+                snapshot_id     INTEGER PRIMARY KEY,
+                taken_at        REAL NOT NULL,
+                label           TEXT
+            );
+            CREATE TABLE IF NOT EXISTS profiles (
+                user_id         INTEGER PRIMARY KEY,
+                profile_hash    TEXT NOT NULL,
+                field_hashes    TEXT NOT NULL,
+                snapshot_id     INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS changes (
+                user_id         INTEGER NOT NULL,
+                field           TEXT NOT NULL,
+                snapshot_id     INTEGER NOT NULL REFERENCES snapshots (snapshot_id),
+                value           TEXT,
+                PRIMARY KEY (user_id, field, snapshot_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS changes_snapshot ON changes (snapshot_id);
+        ''')
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+
+    def begin_snapshot(self, taken_at = None, label = None):
+        """ Starts a snapshot taken at the datetime 'taken_at' (default = now) and
+            returns its id. Snapshots must be taken in chronological order.
+        """
+        epoch = taken_at.timestamp() if taken_at else time.time()
+        with self._connection:
+            last = self._connection.execute('SELECT MAX(taken_at) FROM snapshots').fetchone()[0]
+            if last is not None and epoch < last:
+                raise ValueError('Snapshot time {} is older than the last snapshot.'.format(datetime.datetime.fromtimestamp(epoch)))
+            return self._connection.execute('INSERT INTO snapshots (taken_at, label) VALUES (?, ?)', (epoch, label)).lastrowid
+
+
+    def snapshots(self):
+        """ Returns a list of (snapshot id, datetime, label) tuples.
+        """
+        return [ (snapshot_id, datetime.datetime.fromtimestamp(taken_at), label) for snapshot_id, taken_at, label in
+                 self._connection.execute('SELECT snapshot_id, taken_at, label FROM snapshots ORDER BY snapshot_id') ]
+
+
+    def _stored_profiles(self, user_ids):
+        stored = {}
+        user_ids = list(user_ids)
+        for idx in range(0, len(user_ids), 900):     # SQLite limit of variables per statement
+            batch = user_ids[idx:idx+900]
+            stored.update((row[0], row[1:]) for row in self._connection.execute(
+                'SELECT user_id, profile_hash, field_hashes FROM profiles WHERE user_id IN ({})'.format(','.join('?' * len(batch))), batch))
+        return stored
+
+
+    def add_users(self, snapshot_id, users):
+        """ Adds the user objects 'users' to the snapshot 'snapshot_id' (the latest
+            one), storing only the fields changed since the previous snapshot of
+            each user. Returns the number of users with changes (0 for an
+            unchanged batch, which costs no writes).
+        """
+        users = { int(user['id']): { field: value for field, value in user.items() if field not in self._ignored_fields } for user in users }
+        profile_hashes = { user_id: _hash(user, 16) for user_id, user in users.items() }
+        stored = self._stored_profiles(users)
+        changed = [ user_id for user_id in users if user_id not in stored or stored[user_id][0] != profile_hashes[user_id] ]
+        if not changed:
+            return 0
+        with self._connection:
+            for user_id in changed:
+                old_hashes = json.loads(stored[user_id][1]) if user_id in stored else {}
+                new_hashes = { field: _hash(value) for field, value in users[user_id].items() }
+                rows = [ (user_id, field, snapshot_id, json.dumps(users[user_id][field], sort_keys=True, ensure_ascii=True))
+                         for field, field_hash in new_hashes.items() if old_hashes.get(field) != field_hash ]
+                rows += [ (user_id, field, snapshot_id, None) for field in old_hashes if field not in new_hashes ]
+                self._connection.executemany('INSERT OR REPLACE INTO changes VALUES (?, ?, ?, ?)', rows)
+                self._connection.execute('INSERT OR REPLACE INTO profiles VALUES (?, ?, ?, ?)',
+                                         (user_id, profile_hashes[user_id], json.dumps(new_hashes, sort_keys=True), snapshot_id))
+        self._logger.debug('{} of {} users changed in snapshot {}.'.format(len(changed), len(users), snapshot_id))
+        return len(changed)
+
+
+    def remove_users(self, snapshot_id, user_ids):
+        """ Records that 'user_ids' are absent (e.g. suspended or deleted) in the
+            snapshot 'snapshot_id'. Returns the number of users removed.
+        """
+        stored = self._stored_profiles(int(user_id) for user_id in user_ids)
+        with self._connection:
+            for user_id, (_, field_hashes) in stored.items():
+                self._connection.executemany('INSERT OR REPLACE INTO changes VALUES (?, ?, ?, ?)',
+                                             [ (user_id, field, snapshot_id, None) for field in json.loads(field_hashes) ])
+                self._connection.execute('DELETE FROM profiles WHERE user_id = ?', (user_id,))
+        return len(stored)
+
+
+    def _snapshot_at(self, at):
+        if at is None:
+            return self._connection.execute('SELECT MAX(snapshot_id) FROM snapshots').fetchone()[0]
+        return self._connection.execute('SELECT MAX(snapshot_id) FROM snapshots WHERE taken_at <= ?', (at.timestamp(),)).fetchone()[0]
+
+
+    def get_user(self, user_id, at = None):
+        """ Returns the user object of 'user_id' as of the latest snapshot taken
+            until the datetime 'at' (default = latest snapshot), or None if the
+            user was absent.
+        """
+        snapshot_id = self._snapshot_at(at)
+        if snapshot_id is None:
+            return None
+        user = {}
+        for field, value in self._connection.execute('''SELECT field, value FROM changes WHERE user_id = ? AND snapshot_id <= ?
+                                                        ORDER BY snapshot_id''', (int(user_id), snapshot_id)):
+            if value is None:
+                user.pop(field, None)
+            else:
+                user[field] = json.loads(value)
+        return user or None
+
+
+    def history(self, user_id):
+        """ Returns the changes of 'user_id' as a list of (datetime, dictionary of
+            changed fields) tuples in chronological order. Removed fields have
+            None values.
+        """
+        changes = {}
+        for taken_at, field, value in self._connection.execute('''SELECT snapshots.taken_at, changes.field, changes.value
+                                                                  FROM changes JOIN snapshots USING (snapshot_id)
+                                                                  WHERE changes.user_id = ? ORDER BY changes.snapshot_id''', (int(user_id),)):
+            changes.setdefault(taken_at, {})[field] = json.loads(value) if value is not None else None
+        return [ (datetime.datetime.fromtimestamp(taken_at), fields) for taken_at, fields in changes.items() ]
+
+
+    def field_values(self, field, at = None):
+        """ Returns a dictionary mapping each user id to its value of 'field' (e.g.
+            'location') as of the datetime 'at' (default = latest snapshot).
+        """
+        snapshot_id = self._snapshot_at(at)
+        if snapshot_id is None:
+            return {}
+        rows = self._connection.execute('''SELECT user_id, value FROM changes AS c
+                                           WHERE field = ? AND snapshot_id = (SELECT MAX(snapshot_id) FROM changes
+                                                                              WHERE user_id = c.user_id AND field = c.field AND snapshot_id <= ?)''', (field, snapshot_id))
+        return { user_id: json.loads(value) for user_id, value in rows if value is not None }
+
+
+    def close(self):
+        self._connection.close()
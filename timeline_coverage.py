@@ -0,0 +1,109 @@
+""" Persistent record of the tweet id intervals of each user timeline already
+    retrieved, kept in a SQLite database, so interrupted or incremental
+    timeline collections request only the missing intervals (the gaps).
+
+    Intervals follow the bounds of the Twitter API [1]: (since_id, max_id] with
+    since_id exclusive and max_id inclusive. An interval is covered when all the
+    retrievable tweets with ids inside it were retrieved. Adjacent and
+    overlapping intervals are merged, so a fully collected timeline is a single
+    interval from 0 to the tweet id of its collection time [2].
+
+    Example:
+        coverage = TimelineCoverage('coverage.db')
+        for tweets, since_id, max_id in twitter_conn.iter_user_timeline_pages(user_id, coverage=coverage):
+            save(tweets)
+            coverage.add(user_id, since_id, max_id)
+        coverage.commit()
+
+References:
+    [1] https://developer.twitter.com/en/docs/tweets/timelines/guides/working-with-timelines
+    [2] https://developer.twitter.com/en/docs/basics/twitter-ids
+"""
+
+
+import sqlite3
+
+
+class TimelineCoverage:
+    """ Covered intervals per user. Additions are saved by commit() and close()
+        and discarded by rollback().
+    """
+
+
+    _filename                       = None
+    _connection                     = None
+
+
+    def __init__(self, filename):
+        self._filename = filename
+        self._connection = sqlite3.connect(filename)
+        self._connection.execute('''CREATE TABLE IF NOT EXISTS intervals (
+                                        user_id     INTEGER NOT NULL,
+                                        since_id    INTEGER NOT NULL,
+                                        max_id      INTEGER NOT NULL,
+                                        PRIMARY KEY (user_id, since_id)
+                                    ) WITHOUT ROWID''')
+
+
+    def intervals(self, user_id):
+        """ Returns the covered (since_id, max_id) intervals of 'user_id', from the
+            oldest to the newest.
+        """
+        return [ tuple(row) for row in self._connection.execute('SELECT since_id, max_id FROM intervals WHERE user_id = ? ORDER BY since_id', (int(user_id),)) ]
+
+
+    def add(self, user_id, since_id, max_id):
+        """ Records that the interval (since_id, max_id] of 'user_id' is covered,
+            merging it with the overlapping and adjacent intervals.
+        """
+        user_id, since_id, max_id = int(user_id), int(since_id or 0), int(max_id)
+        if max_id <= since_id:
+            return
+        merged = self._connection.execute('SELECT since_id, max_id FROM intervals WHERE user_id = ? AND since_id <= ? AND max_id >= ?', (user_id, max_id, since_id)).fetchall()
+        for old_since_id, old_max_id in merged:
+            since_id, max_id = min(since_id, old_since_id), max(max_id, old_max_id)
+        self._connection.executemany('DELETE FROM intervals WHERE user_id = ? AND since_id = ?', [ (user_id, old_since_id) for old_since_id, _ in merged ])
+        self._connection.execute('INSERT INTO intervals VALUES (?, ?, ?)', (user_id, since_id, max_id))
+
+
+    def gaps(self, user_id, since_id, max_id):
+        """ Returns the intervals of (since_id, max_id] not covered for 'user_id',
+            from the newest to the oldest (the order the timeline is paged).
+        """
+        since_id, max_id = int(since_id or 0), int(max_id)
+        gaps = []
+        upper_id = max_id
+        for covered_since_id, covered_max_id in reversed(self.intervals(user_id)):
+            if covered_max_id <= since_id:
+                break
+            if covered_since_id >= upper_id:
+                continue
+            if covered_max_id < upper_id:
+                gaps.append((covered_max_id, upper_id))
+            upper_id = covered_since_id
+            if upper_id <= since_id:
+                break
+        if upper_id > since_id:
+            gaps.append((since_id, upper_id))
+        return gaps
+
+
+    def is_covered(self, user_id, since_id, max_id):
+        return not self.gaps(user_id, since_id, max_id)
+
+
+    def remove_user(self, user_id):
+        self._connection.execute('DELETE FROM intervals WHERE user_id = ?', (int(user_id),))
+
+
+    def commit(self):
+        self._connection.commit()
+
+
+    def rollback(self):
+        self._connection.rollback()
+
+
+    def close(self):
+        self._connection.commit()
+        self._connection.close()
@@ -0,0 +1,413 @@
+""" HTTP transports used by TwitterReader to send its requests.
+
+    A transport sends a request and returns a response with the interface of
+    http.client.HTTPResponse used by the reader: 'status', 'reason',
+    getheader(name, default) and read([amt]) (the body can be streamed). Every
+    transport is safe to be used by several threads at once. Backends:
+
+        HTTPClientTransport     one http.client connection per thread (the
+                                default, one request in flight per thread)
+        PooledTransport         bounded pool of http.client connections shared
+                                by the threads
+        HTTP2Transport          HTTP/2 through the httpx package [1] (with the
+                                http2 extra), multiplexing concurrent requests
+                                over a single TLS connection
+
+    Every backend accepts a host, port and 'secure' flag, so it can be pointed
+    to a local stand-in server. HTTP2Transport talks HTTP/2 to a plain text
+    stand-in with prior knowledge (h2c) when 'secure' is False.
+
+References:
+    [1] https://www.python-httpx.org/http2/
+"""
+
+
+import threading
+import contextlib
+import http.client
+try:
+    import httpx
+except ImportError:     # httpx is optional, only used by the HTTP/2 transport
+    httpx = None
+
+
+class Transport:
+    """ Interface of the transports.
+    """
+
+
+    profiler                        = None                              # set by TwitterReader when profiling, to account the connection times
+
+
+    def _phase(self, name):
+        return self.profiler.phase(name) if self.profiler else contextlib.nullcontext()
+
+
+    def request(self, method, path, headers, body = None):
+        """ Sends a request and returns its response, whose body must be read (or
+            the response closed) by the caller.
+        """
+        raise NotImplementedError
+
+
+    def reset(self):
+        """ Drops the current connections, new ones are opened by the next requests.
+        """
+        raise NotImplementedError
+
+
+    def close(self):
+        raise NotImplementedError
+
+
+class HTTPClientTransport(Transport):
+
+
+    _host                           = None
+    _port                           = None
+    _secure                         = None
+    _debug                          = None
+    _local                          = None                              # thread local storage: each thread has its own connection since http.client allows one request in flight per connection
+    _generation                     = 0                                 # incremented at each reset, so threads replace their stale connections
+    _open_connections               = None
+    _lock                           = None
+
+
+    def __init__(self, host, port = None, secure = True, debug = False):
+        self._host = host
+        self._port = port
+        self._secure = secure
+        self._debug = debug
+        self._local = threading.local()
+        self._open_connections = []
+        self._lock = threading.Lock()
+
+
+    def _new_connection(self):
+        connection_class = http.client.HTTPSConnection if self._secure else http.client.HTTPConnection
+        connection = connection_class(self._host, self._port)
+        connection.set_debuglevel(1 if self._debug else 0)
+        return connection
+
+
+    def _get_connection(self):
+        """ Returns the connection of the calling thread, (re)creating it if absent
+            or older than the last reset.
+        """
+        local = self._local
+        if getattr(local, 'generation', None) != self._generation:
+            with self._lock:
+                if getattr(local, 'connection', None) is not None:
+                    local.connection.close()
+                    self._open_connections.remove(local.connection)
+                local.connection = self._new_connection()
+                local.generation = self._generation
+                self._open_connections.append(local.connection)
+        return local.connection
+
+
+    def request(self, method, path, headers, body = None):
+        connection = self._get_connection()
+        try:
+            if connection.sock is None:
+                with self._phase('connect'):
+                    connection.connect()
+            connection.request(method, path, headers=headers, body=body)
+            return _HTTPClientResponse(connection.getresponse(), connection)
+        except Exception:
+            connection.close()      # the connection state is unknown, it is reopened in the next request
+            raise
+
+
+    def reset(self):
+        with self._lock:
+            self._generation += 1
+
+
+    def close(self):
+        with self._lock:
+            for connection in self._open_connections:
+                connection.close()
+
+
+class _HTTPClientResponse:
+    """ http.client response that closes its connection when the body can't be
+        fully read, so the connection is reopened in the next request.
+    """
+
+
+    def __init__(self, response, connection):
+        self._response = response
+        self._connection = connection
+        self.status = response.status
+        self.reason = response.reason
+
+
+    def getheader(self, name, default = None):
+        return self._response.getheader(name, default)
+
+
+    def read(self, amt = None):
+        try:
+            return self._response.read(amt)
+        except Exception:
+            self._connection.close()
+            raise
+
+
+    def close(self):
+        if not self._response.isclosed():
+            self._connection.close()    # unread body, the connection can't be reused
+
+
+class _PooledResponse(_HTTPClientResponse):
+    """ Response that gives its connection back to the pool when its body is
+        fully read or it is closed.
+    """
+
+
+    def __init__(self, response, connection, generation, pool):
+        super().__init__(response, connection)
+        self._generation = generation
+        self._pool = pool
+
+
+    def read(self, amt = None):
+        try:
+            data = super().read(amt)
+        except Exception:
+            self._release()
+            raise
+        if self._response.isclosed():
+            self._release()
+        return data
+
+
+    def _release(self):
+        if self._pool is not None:
+            reusable = self._response.isclosed() and not self._response.will_close
+            self._pool._release(self._connection if reusable else None, self._generation)
+            self._pool = None
+
+
+    def close(self):
+        if self._pool is not None:
+            super().close()
+            self._release()
+
+
+class PooledTransport(HTTPClientTransport):
+    """ Pool of at most 'max_connections' http.client connections, each one used
+        by a request at a time and reused by the next requests of any thread.
+        Requests block while every connection is in use.
+    """
+
+
+    _idle                           = None
+    _slots                          = None
+
+
+    def __init__(self, host, port = None, secure = True, debug = False, max_connections = 10):
+        super().__init__(host, port, secure, debug)
+        self._idle = []
+        self._slots = threading.BoundedSemaphore(max_connections)
+
+
+    def _acquire(self):
+        self._slots.acquire()
+        with self._lock:
+            if self._idle:
+                return self._idle.pop(), self._generation
+            return self._new_connection(), self._generation
+
+
+    def _release(self, connection, generation):
+        """ Gives a connection back to the pool (None if it was discarded).
+        """
+        with self._lock:
+            if connection is not None:
+                if generation == self._generation:
+                    self._idle.append(connection)
+                else:
+                    connection.close()
+        self._slots.release()
+
+
+    def request(self, method, path, headers, body = None):
+        connection, generation = self._acquire()
+        try:
+            if connection.sock is None:
+                with self._phase('connect'):
+                    connection.connect()
+            connection.request(method, path, headers=headers, body=body)
+            response = connection.getresponse()
+        except Exception:
+            connection.close()
+            self._release(None, generation)
+            raise
+        return _PooledResponse(response, connection, generation, self)
+
+
+    def reset(self):
+        with self._lock:
+            self._generation += 1
+            for connection in self._idle:
+                connection.close()
+            self._idle = []
+
+
+    def close(self):
+        self.reset()
+
+
+@contextlib.contextmanager
+def _translated_httpx_errors():
+    """ Raises the httpx transport errors as the built-in exceptions raised by
+        http.client (TimeoutError and ConnectionError), which the retry policy
+        of TwitterReader knows as transient.
+    """
+    try:
+        yield
+    except httpx.TimeoutException as e:
+        raise TimeoutError(''.join(['HTTP/2 timeout: ', str(e) or e.__class__.__name__])) from e
+    except httpx.TransportError as e:
+        raise ConnectionError(''.join(['HTTP/2 connection error: ', str(e) or e.__class__.__name__])) from e
+
+
+class _HTTP2Response:
+
+
+    def __init__(self, response, on_close = None):
+        self._response = response
+        self._chunks = response.iter_bytes()
+        self._buffer = b''
+        self._on_close = on_close
+        self.status = response.status_code
+        self.reason = response.reason_phrase
+
+
+    def getheader(self, name, default = None):
+        return self._response.headers.get(name, default)
+
+
+    def read(self, amt = None):
+        try:
+            with _translated_httpx_errors():
+                while amt is None or len(self._buffer) < amt:
+                    chunk = next(self._chunks, None)
+                    if chunk is None:
+                        self.close()
+                        break
+                    self._buffer += chunk
+        except Exception:
+            self.close()
+            raise
+        if amt is None:
+            data, self._buffer = self._buffer, b''
+        else:
+            data, self._buffer = self._buffer[:amt], self._buffer[amt:]
+        return data
+
+
+    def close(self):
+        self._response.close()
+        if self._on_close is not None:
+            on_close, self._on_close = self._on_close, None
+            on_close()
+
+
+class HTTP2Transport(Transport):
+    """ HTTP/2 transport: every request is a stream of the same connection, so
+        concurrent requests of several threads share a single TLS handshake and
+        socket. 'verify' is passed to httpx (e.g. the CA bundle of a local
+        stand-in server).
+    """
+
+
+    _base_url                       = None
+    _secure                         = None
+    _verify                         = None
+    _timeout                        = None
+    _client                         = None
+    _retired_clients                = None                              # replaced clients still used by other threads, closed once their requests finish
+    _in_flight                      = None                              # number of open responses of each client
+    _lock                           = None
+
+
+    def __init__(self, host, port = None, secure = True, verify = True, timeout = 60):
+        if httpx is None:
+            raise Exception('The HTTP/2 transport requires the httpx package with HTTP/2 support (pip install httpx[http2]).')
+        self._base_url = '{}://{}{}'.format('https' if secure else 'http', host, ':{}'.format(port) if port else '')
+        self._secure = secure
+        self._verify = verify
+        self._timeout = timeout
+        self._retired_clients = []
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+
+    def _get_client(self):
+        with self._lock:
+            if self._client is None:
+                self._client = httpx.Client(base_url=self._base_url,
+                                            http1=self._secure,    # HTTP/2 is negotiated through TLS, plain text connections use prior knowledge
+                                            http2=True,
+                                            verify=self._verify,
+                                            timeout=self._timeout,
+                                           )
+            return self._client
+
+
+    def request(self, method, path, headers, body = None):
+        client = self._get_client()
+        headers = { name: value for name, value in headers.items() if name.lower() != 'host' }     # :authority pseudo-header in HTTP/2
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        request = client.build_request(method, path, headers=headers, content=body)
+        with self._lock:
+            self._in_flight[client] = self._in_flight.get(client, 0) + 1
+        try:
+            with _translated_httpx_errors():
+                response = client.send(request, stream=True)
+        except BaseException:
+            self._release(client)
+            raise
+        return _HTTP2Response(response, lambda: self._release(client))
+
+
+    def _release(self, client):
+        """ Accounts the end of a request of 'client', closing it if it was
+            retired and this was its last request in flight.
+        """
+        with self._lock:
+            self._in_flight[client] -= 1
+            if self._in_flight[client] or client not in self._retired_clients:
+                return
+            del self._in_flight[client]
+            self._retired_clients.remove(client)
+        client.close()
+
+
+    def reset(self):
+        """ Retires the current client: the next request opens a new one, and the
+            retired clients are closed as soon as they have no request in flight.
+        """
+        with self._lock:
+            if self._client is not None:
+                self._retired_clients.append(self._client)
+                self._client = None
+            idle = [ client for client in self._retired_clients if not self._in_flight.get(client) ]
+            for client in idle:
+                self._retired_clients.remove(client)
+                self._in_flight.pop(client, None)
+        for client in idle:
+            client.close()
+
+
+    def close(self):
+        self.reset()
+        with self._lock:
+            retired, self._retired_clients = self._retired_clients, []
+            self._in_flight = {}
+        for client in retired:
+            client.close()
@@ -21,6 +21,10 @@ References:
     [17] https://developer.twitter.com/en/docs/tweets/tweet-updates.html
     [18] https://developer.twitter.com/en/docs/tweets/post-and-engage/api-reference/get-statuses-retweeters-ids
     [19] https://developer.twitter.com/en/docs/tweets/post-and-engage/api-reference/get-statuses-lookup 
+    [20] https://developer.twitter.com/en/docs/basics/twitter-ids
+    [21] https://developer.twitter.com/en/docs/accounts-and-users/follow-search-get-users/api-reference/get-users-lookup
+    [22] https://developer.twitter.com/en/docs/accounts-and-users/follow-search-get-users/api-reference/get-friends-ids
+    [23] https://developer.twitter.com/en/docs/accounts-and-users/follow-search-get-users/api-reference/get-followers-ids
 """
 
 
@@ -28,11 +32,95 @@ import logging
 import sys
 import http
 import http.client
-import traceback
 import base64
 import urllib
 import json
 import time
+import os
+import itertools
+import threading
+import re
+import random
+import collections
+import concurrent.futures
+import datetime
+import functools
+import contextlib
+from transport import HTTPClientTransport
+from profiler import NullProfiler, WallTimeProfiler
+from batch_loader import BatchLoader
+
+try:
+    import numpy
+except ImportError:     # numpy is optional, only used to vectorise the tweet id conversions
+    numpy = None
+
+
+_snowflake_epoch_ms             = 1288834974657                     # Twitter epoch (2010-11-04T01:42:54.657Z) of the snowflake tweet ids [20]
+_snowflake_timestamp_shift      = 22                                # snowflake ids = 41 bits of milliseconds since the Twitter epoch, 10 bits of machine id, 12 bits of sequence number
+
+
+def tweet_id_to_datetime(tweet_id):
+    """ Returns the creation time (UTC) encoded in a snowflake tweet id [20].
+    """
+    ms = (int(tweet_id) >> _snowflake_timestamp_shift) + _snowflake_epoch_ms
+    return datetime.datetime.fromtimestamp(ms / 1000, tz=datetime.timezone.utc)
+
+
+def datetime_to_tweet_id(moment):
+    """ Returns the smallest snowflake tweet id [20] created at 'moment' (naive
+        datetimes are taken as UTC), so tweets created before 'moment' have
+        smaller ids.
+    """
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=datetime.timezone.utc)
+    ms = int(round(moment.timestamp() * 1000)) - _snowflake_epoch_ms
+    return max(ms, 0) << _snowflake_timestamp_shift
+
+
+def tweet_ids_to_epochs_ms(tweet_ids):
+    """ Vectorised version of tweet_id_to_datetime(), returning the creation
+        times as milliseconds since the Unix epoch. Returns a numpy int64 array
+        if numpy is available, otherwise a list.
+    """
+    if numpy is not None:
+        return (numpy.asarray(tweet_ids, dtype=numpy.int64) >> _snowflake_timestamp_shift) + _snowflake_epoch_ms
+    return [ (int(tweet_id) >> _snowflake_timestamp_shift) + _snowflake_epoch_ms for tweet_id in tweet_ids ]
+
+
+def tweet_ids_to_datetimes(tweet_ids):
+    """ Vectorised version of tweet_id_to_datetime(). Returns a numpy
+        datetime64[ms] array (UTC) if numpy is available, otherwise a list of
+        datetimes.
+    """
+    epochs_ms = tweet_ids_to_epochs_ms(tweet_ids)
+    if numpy is not None:
+        return epochs_ms.astype('datetime64[ms]')
+    return [ datetime.datetime.fromtimestamp(ms / 1000, tz=datetime.timezone.utc) for ms in epochs_ms ]
+
+
+def epochs_ms_to_tweet_ids(epochs_ms):
+    """ Vectorised version of datetime_to_tweet_id() for times given as
+        milliseconds since the Unix epoch (e.g. numpy datetime64[ms] values cast to
+        int64).
+    """
+    if numpy is not None:
+        return numpy.maximum(numpy.asarray(epochs_ms, dtype=numpy.int64) - _snowflake_epoch_ms, 0) << _snowflake_timestamp_shift
+    return [ max(int(ms) - _snowflake_epoch_ms, 0) << _snowflake_timestamp_shift for ms in epochs_ms ]
+
+
+def tweet_id_bounds(since_id = None, max_id = None, since = None, until = None):
+    """ Combines tweet id bounds and datetime bounds into the tightest
+        (since_id, max_id) pair, since_id exclusive and max_id inclusive as in the
+        Twitter API. 'since' is inclusive and 'until' exclusive. Absent bounds are
+        returned as None.
+    """
+    if since is not None:
+        since_id = max(int(since_id or 0), datetime_to_tweet_id(since) - 1)
+    if until is not None:
+        until_id = datetime_to_tweet_id(until) - 1
+        max_id = until_id if not max_id else min(int(max_id), until_id)
+    return (int(since_id) if since_id else None), (int(max_id) if max_id else None)
 
 
 class TwitterUserNotFoundException(Exception):
@@ -47,10 +135,149 @@ class ProtectedTweetsException(Exception):
     pass
 
 
+class TweetNotFoundException(Exception):
+    pass
+
+
+class TwitterAuthenticationException(Exception):
+    pass
+
+
 class TwitterServerErrorException(Exception):
     pass
 
 
+class TwitterTooManyRequestsException(Exception):
+    pass
+
+
+class CircuitOpenException(Exception):
+
+
+    def __init__(self, message, retry_in_sec = 0):
+        super().__init__(message)
+        self.retry_in_sec = retry_in_sec      # seconds until the circuit lets requests through again
+
+
+class RetryPolicy:
+    """ Retry policy for requests to Twitter: errors are classified as transient
+        (HTTP server errors, HTTP 429, connection resets and timeouts) or
+        permanent (inexistent, suspended or protected users and any other
+        error), and only transient errors are retried, sleeping with exponential
+        backoff and jitter between attempts.
+
+        Requests to a resource are refused (CircuitOpenException) for
+        'circuit_reset_sec' seconds after 'circuit_failure_threshold' consecutive
+        transient failures in this resource (circuit breaker), so a broken
+        endpoint doesn't consume the whole retry budget of every caller.
+    """
+
+
+    _transient_exceptions           = (TwitterServerErrorException,
+                                       TwitterTooManyRequestsException,
+                                       ConnectionError,                 # includes ConnectionResetError and http.client.RemoteDisconnected
+                                       TimeoutError,
+                                       http.client.IncompleteRead,
+                                       http.client.BadStatusLine,
+                                      )
+
+
+    def __init__(self, max_retries = 8, initial_delay_sec = 1, max_delay_sec = 300, multiplier = 2, jitter = 0.5, max_elapsed_sec = 3600, circuit_failure_threshold = 10, circuit_reset_sec = 300):
+        self.max_retries = max_retries
+        self.initial_delay_sec = initial_delay_sec
+        self.max_delay_sec = max_delay_sec
+        self.multiplier = multiplier
+        self.jitter = jitter                                            # fraction of the delay that is randomized, avoiding synchronized retries of concurrent requests
+        self.max_elapsed_sec = max_elapsed_sec
+        self.circuit_failure_threshold = circuit_failure_threshold
+        self.circuit_reset_sec = circuit_reset_sec
+
+
+    def is_transient(self, exception):
+        return isinstance(exception, self._transient_exceptions)
+
+
+    def next_delay(self, attempt, start_epoch):
+        """ Returns the seconds to sleep before retrying the failed attempt number
+            'attempt' (starting at 0) of a request started at 'start_epoch', or
+            None if the request must not be retried anymore.
+        """
+        if attempt >= self.max_retries:
+            return None
+        delay = min(self.max_delay_sec, self.initial_delay_sec * (self.multiplier ** attempt))
+        delay -= delay * self.jitter * random.random()
+        if (time.time() - start_epoch) + delay > self.max_elapsed_sec:
+            return None
+        return delay
+
+
+class CircuitBreaker:
+    """ Circuit breaker for a resource: opens after 'failure_threshold'
+        consecutive failures and, after 'reset_sec' seconds, lets requests through
+        again (half-open) until a new failure opens it.
+    """
+
+
+    _failure_threshold              = None
+    _reset_sec                      = None
+    _failures                       = 0
+    _open_until                     = 0
+    _lock                           = None
+
+
+    def __init__(self, failure_threshold, reset_sec):
+        self._failure_threshold = failure_threshold
+        self._reset_sec = reset_sec
+        self._lock = threading.Lock()
+
+
+    def before_request(self, resource):
+        if time.time() < self._open_until:
+            retry_in_sec = self._open_until - time.time()
+            raise CircuitOpenException('Circuit open for resource {} after {} consecutive failures. Retry in {:.0f} seconds.'.format(resource, self._failures, retry_in_sec), retry_in_sec)
+
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._open_until = 0
+
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._failure_threshold and self._failures >= self._failure_threshold:
+                self._open_until = time.time() + self._reset_sec
+
+
+class _DeferredCall:
+    """ Future-like wrapper that calls a function only when its result is requested.
+    """
+
+
+    def __init__(self, function, *args):
+        self._function = function
+        self._args = args
+
+
+    def done(self):
+        return False
+
+
+    def result(self):
+        return self._function(*self._args)
+
+
+def _profiled(method):
+    """ Accounts the calls of a public TwitterReader method in its profiler.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._profiler.call(method.__name__):
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
 class TwitterReader:
 
 
@@ -58,7 +285,10 @@ class TwitterReader:
 
 
     _endpoint                       = 'api.twitter.com'
-    _connection                     = None
+    _transport                      = None                              # HTTP transport shared by the threads (see transport.py), by default a http.client connection per thread
+    _lock                           = None
+    _executor                       = None
+    _executor_workers               = 0
     _debug_connection               = None
     _request_headers                = None
 
@@ -72,6 +302,10 @@ class TwitterReader:
                                            'remaining'      : None,
                                            'renew_epoch'    : None,
                                           },
+               '/users/lookup'          : {
+                                           'remaining'      : None,
+                                           'renew_epoch'    : None,
+                                          },
                '/statuses/user_timeline': {
                                            'remaining'      : None,
                                            'renew_epoch'    : None,
@@ -96,30 +330,73 @@ class TwitterReader:
                                            'remaining'      : None,
                                            'renew_epoch'    : None,
                                           },
+               '/friends/ids'           : {
+                                           'remaining'      : None,
+                                           'renew_epoch'    : None,
+                                          },
+               '/followers/ids'         : {
+                                           'remaining'      : None,
+                                           'renew_epoch'    : None,
+                                          },
                '/friendships/show'      : {
                                            'remaining'      : None,
                                            'renew_epoch'    : None,
                                           },
               }
 
+    _limits_condition               = None
+    _limits_refreshing              = None                              # resources whose rate limit status is being requested
+    _retry_policy                   = None
+    _circuit_breakers               = None
+    _prefetch                       = 0                                 # number of pages/chunks requested ahead of the caller
+    _profiler                       = None                              # wall time accounting (see profiler.py), a NullProfiler unless profiling
+    _cache                          = None                              # disk-backed response cache (see response_cache.py), None if disabled
+    _negative_cache                 = None                              # users not found, suspended or protected in previous requests (see negative_cache.py), None if disabled
+    _negative_reasons               = {TwitterUserNotFoundException     : 'not_found',
+                                       TwitterUserSuspendedException    : 'suspended',
+                                       ProtectedTweetsException         : 'protected',
+                                      }
+    _negative_exceptions            = {'not_found'                      : TwitterUserNotFoundException,
+                                       'suspended'                      : TwitterUserSuspendedException,
+                                       'protected'                      : ProtectedTweetsException,
+                                       'missing'                        : TwitterUserNotFoundException,
+                                      }
+    _authentication_error_codes     = (32, 89, 99, 215)                 # could not authenticate, invalid or expired token, unable to verify credentials, bad authentication data [6]
+    _neighbour_resources            = {'friends'                        : ('/1.1/friends/list.json', '/friends/list'),
+                                       'followers'                      : ('/1.1/followers/list.json', '/followers/list'),
+                                      }
+    _coalesce_lookups               = False                             # get_user_info() and get_tweet() calls coalesced into bulk lookups
+    _batch_window                   = 0.01                              # seconds the single lookups wait to be coalesced
+    _user_loader                    = None
+    _tweet_loaders                  = None                              # one per tweet format (extended or not)
+
     _logger                         = None
 
 
-    def __init__(self, app_name, consumer_key, consumer_secret, debug_connection = False):
+    def __init__(self, app_name, consumer_key, consumer_secret, debug_connection = False, retry_policy = None, prefetch = 0, transport = None, profile = False, trace_memory = False, cache = None, negative_cache = None, coalesce_lookups = False, batch_window = 0.01):
         self._app_name = app_name
         self._consumer_key = consumer_key
         self._consumer_secret = consumer_secret
         self._debug_connection = debug_connection
+        self._retry_policy = retry_policy or RetryPolicy()
+        self._circuit_breakers = {}
+        self._prefetch = prefetch
+        self._cache = cache
+        self._negative_cache = negative_cache
+        self._coalesce_lookups = coalesce_lookups
+        self._batch_window = batch_window
+        self._tweet_loaders = {}
 
         # limits set to 1 to allow the first request, after then the values are updated from Twitter headers
-        self._limits['/users/show']['remaining'] = 1
-        self._limits['/statuses/user_timeline']['remaining'] = 1
-        self._limits['/search/tweets']['remaining'] = 1
-        self._limits['/statuses/retweeters']['remaining'] = 1
-        self._limits['/statuses/lookup']['remaining'] = 1
-        self._limits['/friends/list']['remaining'] = 1
-        self._limits['/followers/list']['remaining'] = 1
-        self._limits['/friendships/show']['remaining'] = 1
+        self._limits = { resource: {'remaining': 1, 'renew_epoch': None} for resource in self._limits }    # per instance, each reader has its own credential and limits
+
+        self._transport = transport or HTTPClientTransport(self._endpoint, debug=debug_connection)
+        self._lock = threading.Lock()
+        self._profiler = WallTimeProfiler(trace_memory) if profile else NullProfiler()
+        if profile:
+            self._transport.profiler = self._profiler
+        self._limits_condition = threading.Condition(threading.RLock())
+        self._limits_refreshing = set()
 
         self._logger = logging.getLogger(self.__class__.__name__)
 
@@ -127,8 +404,10 @@ class TwitterReader:
     def _handle_twitter_response_code(self, response, data, user_id = ''):
         if response.status == http.HTTPStatus.OK:
             return
+        twitter_error_code = None
         try:
-            twitter_error = json.loads(data, encoding='utf-8')['errors'][0]
+            twitter_error = json.loads(data)['errors'][0]
+            twitter_error_code = twitter_error['code']
             twitter_error_msg = ''.join(['Twitter error message: ', str(twitter_error['code']), ' - ', twitter_error['message']])
         except Exception as e:
             twitter_error_msg = '(empty or invalid Twitter error message)'
@@ -137,8 +416,12 @@ class TwitterReader:
             raise TwitterUserNotFoundException(''.join(['User id = ', user_id, ' not found. ', error_msg]))
         elif response.status == http.HTTPStatus.FORBIDDEN:          # suspended user
             raise TwitterUserSuspendedException(''.join(['User id = ', user_id, ' suspended. ', error_msg]))
+        elif response.status == http.HTTPStatus.UNAUTHORIZED and twitter_error_code in self._authentication_error_codes:     # invalid or expired bearer token, not the user's fault
+            raise TwitterAuthenticationException('Authentication failed. ' + error_msg)
         elif response.status == http.HTTPStatus.UNAUTHORIZED:       # protected tweet
             raise ProtectedTweetsException(''.join(['Tweets from user id = ', user_id, ' are protected. ', error_msg]))
+        elif response.status == http.HTTPStatus.TOO_MANY_REQUESTS:  # rate limit exceeded
+            raise TwitterTooManyRequestsException('Too many requests. ' + error_msg)
         elif (response.status // 100) == 5 :                        # HTTP server error
             raise TwitterServerErrorException('HTTP server error. ' + error_msg)
         else:
@@ -154,11 +437,10 @@ class TwitterReader:
                                 #'Accept-Encoding': 'gzip',     # gives error
                                }
         bearer_token_params = urllib.parse.urlencode({'grant_type': 'client_credentials'})
-        self._connection.request('POST', '/oauth2/token', headers=bearer_token_headers, body=bearer_token_params)
-        response = self._connection.getresponse()
+        response = self._transport.request('POST', '/oauth2/token', bearer_token_headers, bearer_token_params)
         data = response.read().decode('utf-8')  # See note on https://docs.python.org/2/library/httplib.html#httplib.HTTPConnection.getresponse
         self._handle_twitter_response_code(response, data)
-        bearer_token_dict = json.loads(data, encoding='utf-8')
+        bearer_token_dict = json.loads(data)
         if ('token_type' not in bearer_token_dict) or (bearer_token_dict['token_type'] != 'bearer'):
             raise Exception(''.join(['Invalid JSON response from Twitter : ', str(bearer_token_dict)]))
         self._request_headers = { 'Host': self._endpoint ,
@@ -170,82 +452,484 @@ class TwitterReader:
 
 
     def _get_rate_limit_status(self, resource):
+        """ Returns the (remaining, renew_epoch) rate limits of 'resource' from
+            the rate limit status resource [5].
+        """
         family = resource.split('/')[1]
         params = { 'resources' : family }
         encoded_params = '?%s' % urllib.parse.urlencode(params)
-        retry = True
-        while retry:
+        start_epoch = time.time()
+        attempt = 0
+        while True:
             self._logger.debug(''.join(['Absent rate limit headers. Requesting rate limits for resource family ', family , ' ...']))
-            self._connection.request('GET', '/1.1/application/rate_limit_status.json' + encoded_params, headers=self._request_headers)
-            response = self._connection.getresponse()
-            data = response.read().decode('utf-8')  # See note on https://docs.python.org/2/library/httplib.html#httplib.HTTPConnection.getresponse
             response_key = resource + '/:id' if resource == '/users/show' else resource
             try:
+                response = self._transport.request('GET', '/1.1/application/rate_limit_status.json' + encoded_params, self._request_headers)
+                data = response.read().decode('utf-8')  # See note on https://docs.python.org/2/library/httplib.html#httplib.HTTPConnection.getresponse
                 self._handle_twitter_response_code(response, data)
-                limits = json.loads(data, encoding='utf-8')
-                self._limits[resource]['remaining'] = limits['resources'][family][response_key]['remaining']
-                self._limits[resource]['renew_epoch'] = limits['resources'][family][response_key]['reset']
-                retry = False
+                limits = json.loads(data)
+                return limits['resources'][family][response_key]['remaining'], limits['resources'][family][response_key]['reset']
             except Exception as e:
-                self._logger.warning(''.join(['Error requesting rate limits for resource family ', family , ' . Error: ', str(e), ' Sleeping 5 seconds and retrying ...']))
-                time.sleep(5)       # this 'application/rate_limit_status' resource can be queried 180 times in a 15-minutes window (at each 5 seconds)
+                delay = self._retry_policy.next_delay(attempt, start_epoch) if self._retry_policy.is_transient(e) else None
+                if delay is None:
+                    raise
+                delay = max(delay, 5)   # this 'application/rate_limit_status' resource can be queried 180 times in a 15-minutes window (at each 5 seconds)
+                self._logger.warning('Error requesting rate limits for resource family {} . Error: {} Sleeping {:.1f} seconds and retrying ...'.format(family, e, delay))
+                time.sleep(delay)
+                attempt += 1
+
+
+    @contextlib.contextmanager
+    def _limits_released(self):
+        """ Releases the limits condition (held by the caller) inside the context,
+            so slow calls don't block the requests of the other threads.
+        """
+        self._limits_condition.release()
+        try:
+            yield
+        finally:
+            self._limits_condition.acquire()
 
 
     def _check_limit_remaining(self, resource):
-        if self._limits[resource]['remaining'] <= 0:
-            if self._limits[resource]['remaining'] == -1:       # Twitter didn't send the rate limits headers, request these limits
-                self._get_rate_limit_status(resource)
-            if self._limits[resource]['remaining'] == 0:
-                sleep_sec = (self._limits[resource]['renew_epoch'] + 1) - time.time() # (renew_epoch + 1) => avoiding synchonization problems
-                sleep_sec = 0 if sleep_sec < 0 else sleep_sec
-                self._logger.warning(''.join(['Requests limit reached. Sleeping for ', str(sleep_sec), ' seconds ...']))
-                time.sleep(sleep_sec)
-                self.reconnect()    # better to force a restart since the server maybe had dropped the current connection
+        warned = False
+        with self._limits_condition:
+            while True:
+                limits = self._limits[resource]
+                if limits['remaining'] == -1:       # Twitter didn't send the rate limits headers, request these limits
+                    if resource in self._limits_refreshing:     # requested by another thread, wait for it
+                        self._limits_condition.wait(1)
+                        continue
+                    self._limits_refreshing.add(resource)
+                    try:
+                        with self._limits_released():
+                            remaining, renew_epoch = self._get_rate_limit_status(resource)
+                        if limits['remaining'] == -1:   # no response headers updated the limits meanwhile
+                            limits['remaining'], limits['renew_epoch'] = remaining, renew_epoch
+                    finally:
+                        self._limits_refreshing.discard(resource)
+                        self._limits_condition.notify_all()
+                    continue
+                if limits['remaining'] > 0:
+                    limits['remaining'] -= 1        # reserve the request, so concurrent requests can't overrun the window
+                    return
+                if limits['renew_epoch'] is None:   # the first request of the window is still in flight, wait for its rate limits headers
+                    with self._profiler.phase('rate_limit_wait'):
+                        self._limits_condition.wait(1)
+                    continue
+                sleep_sec = (limits['renew_epoch'] + 1) - time.time() # (renew_epoch + 1) => avoiding synchonization problems
+                if sleep_sec > 0:
+                    if not warned:
+                        self._logger.warning(''.join(['Requests limit reached for resource ', resource, '. Sleeping for ', str(sleep_sec), ' seconds ...']))
+                        warned = True
+                    with self._profiler.phase('rate_limit_wait'):
+                        self._limits_condition.wait(sleep_sec)      # releases the lock, so requests to other resources go on meanwhile
+                    continue
+                limits['remaining'] = 1             # new window, allow one request to get the new limits from Twitter headers
+                limits['renew_epoch'] = None
+                with self._limits_released():
+                    self.reconnect()    # better to force a restart since the server maybe had dropped the current connection
+
+
+    def _release_limit(self, resource):
+        """ Gives back a request reserved by _check_limit_remaining() that didn't reach Twitter.
+        """
+        with self._limits_condition:
+            if self._limits[resource]['remaining'] >= 0:
+                self._limits[resource]['remaining'] += 1
+            self._limits_condition.notify_all()
 
 
     def _update_rate_limit(self, resource, response):
-        self._limits[resource]['remaining'] = int(response.getheader('x-rate-limit-remaining', default='-1')) # header can be absent
-        self._limits[resource]['renew_epoch'] = int(response.getheader('x-rate-limit-reset', default='-1'))   # header can be absent
+        with self._limits_condition:
+            self._limits[resource]['remaining'] = int(response.getheader('x-rate-limit-remaining', default='-1')) # header can be absent
+            self._limits[resource]['renew_epoch'] = int(response.getheader('x-rate-limit-reset', default='-1'))   # header can be absent
+            self._limits_condition.notify_all()
+
+
+    def _get_executor(self, workers):
+        """ Returns a thread pool with at least 'workers' threads. The pool is kept
+            between calls so the threads reuse their (keep-alive) connections.
+        """
+        if self._executor_workers < workers:
+            if self._executor:
+                self._executor.shutdown(wait=False)
+            self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix=self.__class__.__name__)
+            self._executor_workers = workers
+        return self._executor
+
+
+    def _get_circuit_breaker(self, resource):
+        with self._lock:
+            if resource not in self._circuit_breakers:
+                self._circuit_breakers[resource] = CircuitBreaker(self._retry_policy.circuit_failure_threshold, self._retry_policy.circuit_reset_sec)
+            return self._circuit_breakers[resource]
+
+
+    def _send_request(self, method, url, resource, encoded_params, user_id, params=None):
+        self._check_limit_remaining(resource)
+        try:
+            with self._profiler.phase('first_byte'):
+                if method == 'GET':
+                    response = self._transport.request(method, url + ('?' + encoded_params if encoded_params else ''), self._request_headers)
+                else:
+                    response = self._transport.request(method, url, self._request_headers, encoded_params)
+            with self._profiler.phase('body'):
+                data = response.read().decode('utf-8')  # See note on https://docs.python.org/2/library/httplib.html#httplib.HTTPConnection.getresponse
+        except Exception:
+            self._release_limit(resource)
+            raise
+        self._update_rate_limit(resource, response)
+        self._handle_twitter_response_code(response, data, user_id)
+        if self._cache is not None:
+            self._cache.put(method, url, resource, params, data, { name: response.getheader(name) for name in ('content-type', 'date', 'last-modified') })
+        self._profiler.page_boundary()
+        return data
+
+
+    def _request(self, method, url, resource, params=None, user_id=''):
+        """ Sends a request accounted in the rate limits of 'resource' and returns the
+            decoded JSON response, retrying transient errors according to the retry
+            policy. Safe to be called from several threads.
+        """
+        data = self._request_raw(method, url, resource, params, user_id)
+        with self._profiler.phase('decode'):
+            return json.loads(data)
+
+
+    def _request_raw(self, method, url, resource, params=None, user_id=''):
+        """ Same as _request(), but returns the response body before JSON decoding.
+            Responses found in the cache are returned without any request, so they
+            aren't accounted in the rate limits.
+        """
+        if self._cache is not None:
+            data = self._cache.get(method, url, resource, params)
+            if data is not None:
+                self._logger.debug('Response of {} found in the cache.'.format(resource))
+                return data
+        encoded_params = urllib.parse.urlencode(params) if params else ''
+        circuit_breaker = self._get_circuit_breaker(resource)
+        start_epoch = time.time()
+        attempt = 0
+        while True:
+            circuit_breaker.before_request(resource)
+            try:
+                data = self._send_request(method, url, resource, encoded_params, user_id, params)
+            except Exception as e:
+                if not self._retry_policy.is_transient(e):
+                    circuit_breaker.record_success()    # permanent errors come from a working endpoint
+                    raise
+                circuit_breaker.record_failure()
+                delay = self._retry_policy.next_delay(attempt, start_epoch)
+                if delay is None:
+                    raise
+                self._logger.warning('Transient error requesting {} (attempt {}): {} Sleeping {:.1f} seconds and retrying ...'.format(resource, attempt + 1, e, delay))
+                time.sleep(delay)
+                attempt += 1
+                continue
+            circuit_breaker.record_success()
+            return data
 
 
     def _request_tweets(self, params):
-        self._check_limit_remaining('/statuses/user_timeline')
-        encoded_params = '?%s' % urllib.parse.urlencode(params)
-        self._connection.request('GET', '/1.1/statuses/user_timeline.json' + encoded_params, headers=self._request_headers)
-        response = self._connection.getresponse()
-        data = response.read().decode('utf-8')  # See note on https://docs.python.org/2/library/httplib.html#httplib.HTTPConnection.getresponse
-        self._handle_twitter_response_code(response, data, params['user_id'])
-        self._update_rate_limit('/statuses/user_timeline', response)
-        return json.loads(data, encoding='utf-8')
+        return self._request('GET', '/1.1/statuses/user_timeline.json', '/statuses/user_timeline', params, params['user_id'])
+
+
+    def _lookup_tweets(self, tweet_ids, extended=False):
+        """ Retrieves up to 100 tweets from their ids in a single request [19].
+        """
+        params = {'id'                  : ','.join(tweet_ids),
+                  'include_entities'    : 'false',
+                  'trim_user'           : 'true',
+                  'map'                 : 'false',
+                  'include_ext_alt_text': 'false',
+                  'include_card_uri'    : 'false',
+                 }
+        if extended:    # extended tweets format [17]
+            params['tweet_mode'] = 'extended'
+        return self._request('POST', '/1.1/statuses/lookup.json', '/statuses/lookup', params)
+
+
+    def _lookup_users(self, user_ids):
+        """ Retrieves up to 100 users from their ids in a single request [21].
+        """
+        try:
+            return self._request('POST', '/1.1/users/lookup.json', '/users/lookup', {'user_id': ','.join(user_ids), 'include_entities': 'false'})
+        except TwitterUserNotFoundException:    # none of the users is available
+            return []
+
+
+    def _submit(self, function, *args):
+        """ Calls 'function' in the thread pool if prefetching is enabled. Otherwise
+            the call is deferred until its result is requested, so no request is
+            sent before the caller asks for the next page.
+        """
+        if self._prefetch:
+            return self._get_executor(self._prefetch).submit(self._profiler.wrap(function), *args)
+        return _DeferredCall(function, *args)
+
+
+    @staticmethod
+    def _peek_json_value(data, key):
+        """ Finds the value of a top level number or string 'key' in a JSON text
+            without decoding it, so the next page can be requested first. Returns
+            None if not found. Keys inside JSON strings never match since their
+            quotes are escaped.
+        """
+        matches = re.findall(r'"' + key + r'"\s*:\s*(-?\d+|"(?:[^"\\]|\\.)*")', data)
+        if not matches:
+            return None
+        return json.loads(matches[-1])      # the last match: metadata follows the results in Twitter responses
+
+
+    def _iter_cursor_pages(self, url, resource, params):
+        """ Yields the decoded pages of a cursored resource. With prefetching the
+            next page is requested as soon as its cursor is known, before the
+            current page is decoded and handed to the caller.
+        """
+        params = dict(params, cursor=-1)
+        future = self._submit(self._request_raw, 'GET', url, resource, dict(params))
+        while future:
+            data = future.result()
+            next_cursor = self._peek_json_value(data, 'next_cursor') if self._prefetch else None
+            if next_cursor is not None:
+                params['cursor'] = next_cursor
+                future = self._submit(self._request_raw, 'GET', url, resource, dict(params)) if next_cursor else None
+            with self._profiler.phase('decode'):
+                page = json.loads(data)
+            self._logger.debug('Remaining \'{}\' requests = {}.'.format(resource, self._limits[resource]['remaining']))
+            if next_cursor is None:
+                params['cursor'] = page['next_cursor']
+                future = self._submit(self._request_raw, 'GET', url, resource, dict(params)) if page['next_cursor'] else None
+            with self._profiler.phase('caller'):
+                yield page
+
+
+    def _request_cursor_pages(self, url, resource, params, key):
+        """ Retrieves all the pages of a cursored resource, concatenating the
+            'key' element of each page.
+        """
+        results = []
+        for page in self._iter_cursor_pages(url, resource, params):
+            results += page[key]
+        return results
+
+
+    def _iter_search_pages(self, search_params, max_results):
+        """ Yields the decoded pages of a search [10] until 'max_results' tweets
+            are retrieved (0 = no limit) or the results end, following the
+            'next_results' metadata. With prefetching the next page is requested
+            before the current page is decoded and handed to the caller. The
+            'since_id' of 'search_params' bounds every page ('next_results' does
+            not carry it) and the search stops at the first page reaching it.
+        """
+        url = '/1.1/search/tweets.json'
+        resource = '/search/tweets'
+        max_results = max_results or float('inf')
+        since_id = int(search_params.get('since_id') or 0)
+        acc_results = 0
+        future = self._submit(self._request_raw, 'GET', url, resource, search_params)
+        while future:
+            data = future.result()
+            future = None
+            next_results = self._peek_json_value(data, 'next_results') if self._prefetch else None
+            if next_results is not None and acc_results + search_params['count'] < max_results:     # a page has at most 'count' tweets
+                future = self._submit(self._request_raw, 'GET', url, resource, self._next_search_params(next_results, search_params))
+            with self._profiler.phase('decode'):
+                page = json.loads(data)
+            reached_since_id = since_id and page['statuses'] and page['statuses'][-1]['id'] <= since_id
+            if reached_since_id:
+                page['statuses'] = [ tweet for tweet in page['statuses'] if tweet['id'] > since_id ]
+                future = None   # a prefetched page is older than 'since_id'
+            acc_results += len(page['statuses'])
+            if future is None and not reached_since_id and acc_results < max_results and 'next_results' in page['search_metadata']:
+                future = self._submit(self._request_raw, 'GET', url, resource, self._next_search_params(page['search_metadata']['next_results'], search_params))
+            with self._profiler.phase('caller'):
+                yield page
+            if acc_results >= max_results:
+                return
+
+
+    @staticmethod
+    def _next_search_params(next_results, search_params):
+        params = dict(urllib.parse.parse_qsl(next_results.lstrip('?')))
+        params['count'] = int(params.get('count', 100))
+        if search_params.get('since_id'):
+            params['since_id'] = search_params['since_id']
+        return params
+
+
+    def _iter_lookup_batches(self, batches, extended, concurrency):
+        """ Yields (batch, tweets) for each batch of at most 100 tweet ids, keeping
+            up to 'concurrency' '/statuses/lookup' requests in flight. The batches
+            are yielded in the input order.
+        """
+        executor = self._get_executor(concurrency) if concurrency > 1 else None
+        pending = collections.deque()
+        for batch in itertools.chain(batches, [None]):
+            if batch:
+                if executor:
+                    pending.append((batch, executor.submit(self._profiler.wrap(self._lookup_tweets), batch, extended)))
+                else:
+                    pending.append((batch, _DeferredCall(self._lookup_tweets, batch, extended)))
+            while pending and (batch is None or len(pending) >= concurrency or pending[0][1].done()):
+                done_batch, future = pending.popleft()
+                result = future.result()
+                with self._profiler.phase('caller'):
+                    yield done_batch, result
+
+
+    @staticmethod
+    def _iter_ids(ids):
+        """ Yields stripped, non-empty ids from an iterable (e.g. an open file) or
+            from the name of a file with one id per line.
+        """
+        if isinstance(ids, str):
+            with open(ids, mode='rt', encoding='ascii') as fd:
+                yield from TwitterReader._iter_ids(fd)
+            return
+        for element in ids:
+            element = str(element).strip()
+            if element:
+                yield element
+
+
+    @staticmethod
+    def _iter_batches(iterable, size):
+        iterator = iter(iterable)
+        while True:
+            batch = list(itertools.islice(iterator, size))
+            if not batch:
+                return
+            yield batch
+
+
+    @contextlib.contextmanager
+    def _negative_caching(self, user, kind = 'user_id', reasons = ('not_found', 'suspended', 'protected', 'missing')):
+        """ Raises the exception of the negative cache entry of 'user' if its
+            reason is one of 'reasons' (no request is sent), and records in the
+            negative cache the user errors of these reasons raised inside the
+            context. Authentication failures (TwitterAuthenticationException)
+            are never recorded.
+        """
+        if self._negative_cache is None:
+            yield
+            return
+        reason = self._negative_cache.get(user, kind)
+        if reason in reasons:
+            raise self._negative_exceptions[reason](''.join(['User ', 'id' if kind == 'user_id' else 'screen name', ' = ', str(user), ' ', reason.replace('_', ' '), ' in a previous request (negative cache).']))
+        try:
+            yield
+        except (TwitterUserNotFoundException, TwitterUserSuspendedException, ProtectedTweetsException) as e:
+            if self._negative_reasons[type(e)] in reasons:
+                self._negative_cache.add(user, self._negative_reasons[type(e)], str(e), kind)
+            raise
+
+
+    def _get_user_loader(self):
+        with self._lock:
+            if self._user_loader is None:
+                self._user_loader = BatchLoader(lambda user_ids: { user['id_str']: user for user in self.get_users_info(user_ids) },
+                                                100,
+                                                self._batch_window,
+                                                lambda user_id: TwitterUserNotFoundException(''.join(['User id = ', user_id, ' not found or suspended (absent from the users lookup).'])))
+            return self._user_loader
+
+
+    def _get_tweet_loader(self, extended):
+        with self._lock:
+            if extended not in self._tweet_loaders:
+                self._tweet_loaders[extended] = BatchLoader(lambda tweet_ids: { tweet['id_str']: tweet for tweet in self._lookup_tweets(tweet_ids, extended) },
+                                                            100,
+                                                            self._batch_window,
+                                                            lambda tweet_id: TweetNotFoundException(''.join(['Tweet id = ', tweet_id, ' not found (deleted or from a protected or suspended user).'])))
+            return self._tweet_loaders[extended]
+
+
+    def _get_retweeters_of(self, tweet):
+        """ Returns the retweeter ids of 'tweet', or [] if it was deleted meanwhile.
+        """
+        try:
+            return self.get_retweeters(tweet['id'])
+        except TwitterUserNotFoundException:
+            self._logger.debug('Tweet {} not found retrieving its retweeters.'.format(tweet['id']))
+            return []
 
 
     ##### PUBLIC CLASS MEMBERS #####
 
 
+    def get_rate_limits(self):
+        """ Returns a copy of the current rate limits information: a dictionary
+            mapping each resource to its 'remaining' requests and 'renew_epoch'.
+        """
+        with self._limits_condition:
+            return { resource: dict(limits) for resource, limits in self._limits.items() }
+
+
+    def has_budget(self, resource):
+        """ Returns whether a request to 'resource' can be sent now without
+            waiting for a new rate limit window.
+        """
+        with self._limits_condition:
+            limits = self._limits[resource]
+            return limits['remaining'] != 0 or (limits['renew_epoch'] is not None and limits['renew_epoch'] + 1 <= time.time())
+
+
+    def profile_phase(self, name):
+        """ Context manager accounting the enclosed code in the phase 'name' of
+            the profiler (e.g. 'output' around the writing of the results).
+        """
+        return self._profiler.phase(name)
+
+
+    def profile_job(self, name):
+        """ Context manager accounting the enclosed calls in the job 'name' of
+            the profiler.
+        """
+        return self._profiler.job(name)
+
+
+    def get_profile(self):
+        """ Returns the wall time accounting of the calls and jobs so far (see
+            profiler.WallTimeProfiler.summary()), empty if not profiling.
+        """
+        return self._profiler.summary()
+
+
     def connect(self):
         self._logger.debug(''.join(['Connecting to Twitter endpoint ', self._endpoint, ' ...']))
-        self._connection = http.client.HTTPSConnection(self._endpoint)
-        self._connection.set_debuglevel(1 if self._debug_connection else 0)
+        self._transport.reset()
         if not self._request_headers:
             self._logger.debug('Trying to get application bearer token ...')
             self._get_request_headers()
 
 
     def cleanup(self):
-        self._connection.close()
+        for loader in [self._user_loader] + list(self._tweet_loaders.values()):
+            if loader is not None:
+                loader.close()
+                self._logger.debug('Lookup coalescing: {}.'.format(loader.stats()))
+        if self._executor:
+            self._executor.shutdown()
+            self._executor = None
+            self._executor_workers = 0
+        self._transport.close()
+        if self._cache is not None:
+            self._logger.debug('Response cache: {}.'.format(self._cache.stats()))
+        report = self._profiler.report()
+        if report:
+            self._logger.info(report)
+        self._profiler.close()
 
 
     def reconnect(self):
         self._logger.info(''.join(['Restarting connection to Twitter endpoint ', self._endpoint, ' ...']))
-        try:
-            self._connection.close()
-        except Exception as e:
-            self._logger.warning('Error trying to close twitter connection while reconnecting.')
-            traceback.print_exc()
-        self.connect()
+        self.connect()      # the transport replaces (and closes) the current connections
 
 
-    def search_users(self, word, language = 'en', max_results = 1000):
+    @_profiled
+    def search_users(self, word, language = 'en', max_results = 1000, seen = None, min_new_ratio = 0, min_pages = 1):
         """ Return a list of user based on a list of words.
 
         Besides using the word parameter to filter the language of the user, the
@@ -254,10 +938,19 @@ class TwitterReader:
         out retweets. It is recommended not to use too small function words
         (less than 3 characters) since they can match undesired languages.
 
+        'seen' is a set of user ids (strings) already discovered, e.g. by the
+        searches of other words or a seen_users.SeenUsersSet persisted across
+        runs. Users in 'seen' are skipped and the users found are added to it.
+        The pagination of the word stops before 'max_results' when, after
+        'min_pages' pages, the ratio of new users per tweet of a page falls
+        below 'min_new_ratio' (0 = never), so the search budget goes to words
+        that still find new users.
+
         Peudo-code:
             read list of words
             for each 'word':
                 search most recents tweets using 'word' and recover at most max_results_per_word parameter
+                stop the search if the tweets bring too few new users
             for each 'tweet':
                 save user information if not already seen
         """
@@ -267,56 +960,144 @@ class TwitterReader:
                          'count' :              100,
                          'include_entities' :   'true',
                  }
-        encoded_search_params = '?%s' % urllib.parse.urlencode(search_params)
         acc_results = 0
+        pages = 0
         users = {}
-        while acc_results < max_results:
-            # get tweets
-            self._check_limit_remaining('/search/tweets')
-            self._connection.request('GET', '/1.1/search/tweets.json' + encoded_search_params, headers=self._request_headers)
-            response = self._connection.getresponse()
-            data = response.read().decode('utf-8')  # See note on https://docs.python.org/2/library/httplib.html#httplib.HTTPConnection.getresponse
-            self._handle_twitter_response_code(response, data)
-            tweets = json.loads(data, encoding='utf-8')
-            self._update_rate_limit('/search/tweets', response)
-
+        for tweets in self._iter_search_pages(search_params, max_results):
             # find users
+            new_users = 0
             for tweet in tweets['statuses']:
-                if tweet['user']['id_str'] in users:
+                if tweet['user']['id_str'] in users or (seen is not None and tweet['user']['id_str'] in seen):
                     self._logger.debug(''.join([ '\t\tUser ', tweet['user']['screen_name'], ' , id = ', tweet['user']['id_str'], ' already seen. Ignoring ...' ]))
                     continue
                 self._logger.debug(''.join([ '\t\tAdding user ', tweet['user']['screen_name'], ' , id = ', tweet['user']['id_str'] ]))
                 users[tweet['user']['id_str']] = tweet['user']
+                new_users += 1
 
             # account results
             results = len(tweets['statuses'])
             acc_results += results
+            pages += 1
             self._logger.debug(''.join(['\tRetrieved ', str(results), ' tweets. Current number of users found = ',  str(len(users.keys())), '. Remaining \'/search/tweets\' requests = ', str(self._limits['/search/tweets']['remaining']), '.']))
-
-            # get next results page
-            if 'next_results' not in tweets['search_metadata']:     # end of results
+            if min_new_ratio and pages >= min_pages and results and new_users / results < min_new_ratio:
+                self._logger.debug('\tOnly {} new users in {} tweets. Stopping the search for word {} ...'.format(new_users, results, word))
                 break
-            encoded_search_params = tweets['search_metadata']['next_results']
 
+        if seen is not None:    # only after the search succeeds, so a retried search finds the same users again
+            seen.update(users.keys())
         self._logger.debug(''.join(['Number of users found for word ', word, ' = ',  str(len(users.keys())), '.']))
         return users
 
 
+    @_profiled
     def get_user_info(self, user_id):
-        self._check_limit_remaining('/users/show')
-        self._connection.request('GET', ''.join(['/1.1/users/show.json?user_id=', user_id]), headers=self._request_headers)
-        response = self._connection.getresponse()
-        data = response.read().decode('utf-8')  # See note on https://docs.python.org/2/library/httplib.html#httplib.HTTPConnection.getresponse
-        self._handle_twitter_response_code(response, data, user_id)
-        self._update_rate_limit('/users/show', response)
+        """ Retrieves the user object of 'user_id' [14]. If the lookups are
+            coalesced, the call is sent in a '/users/lookup' request [21] with
+            the other calls made within the batch window (see load_user_info()).
+        """
+        if self._coalesce_lookups:
+            return self.load_user_info(user_id).result()
+        with self._negative_caching(user_id, reasons=('not_found', 'suspended', 'missing')):     # the profile of protected users is public
+            user_info = self._request('GET', '/1.1/users/show.json', '/users/show', {'user_id': user_id}, user_id)
         self._logger.debug(''.join(['Remaining \'/users/show\' requests = ', str(self._limits['/users/show']['remaining']), '.']))
-        return json.loads(data, encoding='utf-8')
+        return user_info
+
+
+    def load_user_info(self, user_id):
+        """ Returns a future of the user object of 'user_id'. The ids loaded
+            within the batch window are requested together in '/users/lookup'
+            requests [21] of up to 100 ids, and the loads of an id already
+            requested share its request. The future raises
+            TwitterUserNotFoundException for users not found or suspended.
+        """
+        return self._get_user_loader().load(str(user_id))
 
 
-    def get_user_timeline(self, user_id, since_id=None, extended=False):
+    def flush_lookups(self):
+        """ Requests the user and tweet ids loaded so far without waiting for
+            the end of the batch window.
+        """
+        for loader in [self._user_loader] + list(self._tweet_loaders.values()):
+            if loader is not None:
+                loader.flush()
+
+
+    @_profiled
+    def get_users_info(self, user_ids):
+        """ Retrieves the user objects of 'user_ids' (an iterable or the name of a
+            file with one id per line) with up to 100 users per request [21]. Users
+            not found or suspended are absent from the returned list. With a
+            negative cache, the users absent from previous requests are skipped
+            and the absent users are recorded.
+        """
+        lookup_url_key = '/users/lookup'
+        total_users = []
+        user_ids = self._iter_ids(user_ids)
+        if self._negative_cache is not None:
+            user_ids = self._negative_cache.filter(user_ids, reasons=('not_found', 'suspended', 'missing'))
+        for batch in self._iter_batches(user_ids, 100):
+            users = self._lookup_users(batch)
+            if self._negative_cache is not None:
+                returned_ids = set(user['id_str'] for user in users)
+                self._negative_cache.add_many([ user_id for user_id in batch if user_id not in returned_ids ], 'missing')
+            total_users += users
+            self._logger.debug('\tRetrieved {}/{} users. Current number of users retrieved = {}. Remaining \'{}\' requests = {}.'.format(len(users), len(batch), len(total_users), lookup_url_key, self._limits[lookup_url_key]['remaining']))
+        return total_users
+
+
+    @_profiled
+    def get_user_timeline(self, user_id, since_id=None, extended=False, since=None, until=None, coverage=None):
         """ Downloads all the tweets in the user timeline according to [15].
+
+        The tweets can be restricted to ids greater than 'since_id' and to the
+        creation times between the datetimes 'since' (inclusive) and 'until'
+        (exclusive), which are mapped to tweet ids [20]. The pagination stops at
+        the first page crossing the lower bound, and no request is spent on
+        tweets newer than the upper bound.
+
+        With 'coverage' (a timeline_coverage.TimelineCoverage), only the id
+        intervals not covered yet are requested, and the intervals retrieved are
+        added to it when the call succeeds (to be committed by the caller once
+        the tweets are saved). See iter_user_timeline_pages() to keep the pages
+        retrieved before an error.
         """
-        timeline_url = '/1.1/statuses/user_timeline.json'
+        tweets = []
+        covered = []
+        for page, covered_since_id, covered_max_id in self.iter_user_timeline_pages(user_id, since_id, extended, since, until, coverage):
+            covered.append((covered_since_id, covered_max_id))
+            if not page:
+                continue
+            if tweets and page[0]['id'] > tweets[0]['id']:     # tweets published during the collection
+                tweets = page + tweets
+            else:
+                tweets += page
+        if coverage is not None:
+            for interval in covered:
+                coverage.add(user_id, *interval)
+        return tweets
+
+
+    def iter_user_timeline_pages(self, user_id, since_id=None, extended=False, since=None, until=None, coverage=None):
+        """ Yields (tweets, since_id, max_id) for each page of the user timeline
+        [15] as it arrives (bounds as in get_user_timeline()): the tweets of the
+        page, from newest to oldest, and the id interval (since_id exclusive,
+        max_id inclusive) whose retrievable tweets are all in the page.
+
+        The pages go from the newest tweets to the oldest and, without
+        'coverage', a last page may hold the tweets published during the
+        collection. With 'coverage' (a
+        timeline_coverage.TimelineCoverage), only the intervals not covered yet
+        are requested, so a caller adding the yielded intervals to 'coverage'
+        after saving each page resumes an interrupted timeline, or collects it
+        incrementally, without requesting again the pages it has. The upper
+        bound of a timeline without 'until' is the tweet id of the current
+        time [20], which assumes a synchronised clock.
+        """
+        with self._negative_caching(user_id):
+            yield from self._iter_timeline_pages(user_id, since_id, extended, since, until, coverage)
+
+
+    def _iter_timeline_pages(self, user_id, since_id, extended, since, until, coverage):
         timeline_params = {'user_id'            : user_id,
                            'count'              : 200,
                            'include_rts'        : 'true',
@@ -324,222 +1105,336 @@ class TwitterReader:
                            'trim_user'          : 'true',
                           }
 
+        since_id, max_id = tweet_id_bounds(since_id, None, since, until)
         if since_id:
             self._logger.debug('Retrieving tweets since id {} ...'.format(since_id))
-            timeline_params['since_id'] = int(since_id)
+        if max_id:
+            self._logger.debug('Retrieving tweets up to id {} ...'.format(max_id))
 
         if extended:    # extended tweets format [17]
             self._logger.debug('Retrieving extended tweets (more than 140 characters) ...')
             timeline_params['tweet_mode'] = 'extended'
 
-        # first timeline request
-        tweets = self._request_tweets(timeline_params)
-        retrieved_tweets = len(tweets)
-        self._logger.debug(''.join(['Retrieved ', str(retrieved_tweets), ' tweets in the first request. Remaining \'/statuses/user_timeline\' requests = ', str(self._limits['/statuses/user_timeline']['remaining']), '.']))
-        if retrieved_tweets == 0:    # finish this profile collecting
-            return tweets
-
-        # older tweets
-        while retrieved_tweets > 0:
-            timeline_params['max_id'] = tweets[-1]['id'] - 1
-            temp = self._request_tweets(timeline_params)
-            retrieved_tweets = len(temp)
-            self._logger.debug(''.join(['Retrieved ', str(retrieved_tweets), ' tweets. Remaining \'/statuses/user_timeline\' requests = ', str(self._limits['/statuses/user_timeline']['remaining']), '.']))
-            tweets += temp
-        del timeline_params['max_id']
+        now_id = datetime_to_tweet_id(datetime.datetime.now(datetime.timezone.utc))
+        upper_id = max_id or now_id
+        intervals = coverage.gaps(user_id, since_id, upper_id) if coverage is not None else [(since_id or 0, upper_id)]
+        if coverage is not None:
+            self._logger.debug('{} intervals not covered in the timeline of user {}: {}.'.format(len(intervals), user_id, intervals))
+
+        # tweets from newest to oldest. The lower bound is checked here instead of sent as 'since_id', so the page crossing it ends the pagination without an extra (empty) request
+        retrieved = False
+        for interval_since_id, interval_max_id in intervals:
+            if interval_max_id == now_id:   # no upper bound, as Twitter may be slightly ahead of the local clock
+                timeline_params.pop('max_id', None)
+            else:
+                timeline_params['max_id'] = interval_max_id
+            page_max_id = interval_max_id
+            while True:
+                temp = self._request_tweets(timeline_params)
+                self._logger.debug(''.join(['Retrieved ', str(len(temp)), ' tweets. Remaining \'/statuses/user_timeline\' requests = ', str(self._limits['/statuses/user_timeline']['remaining']), '.']))
+                if not temp:    # no more retrievable tweets up to page_max_id, the older intervals are empty as well
+                    yield [], 0, page_max_id
+                    break
+                retrieved = True
+                if 'max_id' not in timeline_params:
+                    page_max_id = max(page_max_id, temp[0]['id'])
+                if interval_since_id and temp[-1]['id'] <= interval_since_id:
+                    yield [ tweet for tweet in temp if tweet['id'] > interval_since_id ], interval_since_id, page_max_id
+                    break
+                yield temp, temp[-1]['id'] - 1, page_max_id
+                page_max_id = timeline_params['max_id'] = temp[-1]['id'] - 1
+            if not temp:
+                break
+        if not retrieved or max_id or coverage is not None:     # finish this profile collecting, newer tweets are out of the bounds (or left for the next incremental run)
+            return
 
         # newer tweets since collecting
-        timeline_params['since_id'] = tweets[0]['id']
+        timeline_params.pop('max_id', None)
+        timeline_params['since_id'] = now_id
+        newer_now_id = datetime_to_tweet_id(datetime.datetime.now(datetime.timezone.utc))
         temp = self._request_tweets(timeline_params)
         self._logger.debug(''.join(['Retrieved ', str(len(temp)), ' newer tweets since collecting. Remaining \'/statuses/user_timeline\' requests = ', str(self._limits['/statuses/user_timeline']['remaining']), '.']))
-        return temp + tweets
+        yield temp, (temp[-1]['id'] - 1 if temp else now_id), max(newer_now_id, temp[0]['id'] if temp else 0)
+
 
+    def iter_retweet_network(self, user_id, concurrency=4, since_id=None, extended=False, since=None, until=None, skip_ids=None):
+        """ Yields (tweet, retweeter ids) for each tweet in the user timeline (see
+        get_user_timeline() for the bounds), in the order the tweets are
+        retrieved.
 
-    def search_expression(self, expr, language = 'en', max_results = 1000):
-        """ Downloads tweets that contains a specific expression.
+        The retweeters of the tweets of each timeline page [18] are requested as
+        soon as the page arrives, up to 'concurrency' tweets at once, while the
+        next timeline pages are retrieved ('/statuses/retweeters' and
+        '/statuses/user_timeline' have separate rate limits). Tweets with a
+        'retweet_count' of 0 cost no request. Tweets whose ids are in 'skip_ids'
+        (e.g. already collected) are neither requested nor yielded.
         """
-        if max_results == 0:
-            max_results = float('inf')
+        skip_ids = skip_ids or ()
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=self.__class__.__name__)    # own pool: get_retweeters() may prefetch in the shared one
+        pending = collections.deque()
+        try:
+            for page in itertools.chain(self.iter_user_timeline_pages(user_id, since_id, extended, since, until), [None]):
+                for tweet in page[0] if page else []:
+                    if tweet['id'] in skip_ids:
+                        continue
+                    if tweet.get('retweet_count', 1):
+                        pending.append((tweet, executor.submit(self._profiler.wrap(self._get_retweeters_of), tweet)))
+                    else:
+                        pending.append((tweet, None))
+                while pending and (page is None or pending[0][1] is None or pending[0][1].done()):
+                    tweet, future = pending.popleft()
+                    yield tweet, future.result() if future else []
+        finally:
+            for _, future in pending:
+                if future:
+                    future.cancel()
+            executor.shutdown(wait=True)
+
+
+    @_profiled
+    def search_expression(self, expr, language = 'en', max_results = 1000, since_id = None, max_id = None, since = None, until = None):
+        """ Downloads tweets that contains a specific expression, optionally
+            restricted to tweet ids greater than 'since_id' and lower than or equal
+            to 'max_id', and to the creation times between the datetimes 'since'
+            (inclusive) and 'until' (exclusive), which are mapped to tweet ids [20].
+        """
+        total_tweets = []
+        for tweets in self.iter_search_expression_pages(expr, language, max_results, since_id, max_id, since, until):
+            total_tweets += tweets
+            self._logger.debug(''.join(['\tRetrieved ', str(len(tweets)), ' tweets. Current number of tweets found = ',  str(len(total_tweets)), '. Remaining \'/search/tweets\' requests = ', str(self._limits['/search/tweets']['remaining']), '.']))
+
+        self._logger.debug(''.join(['Number of tweets found for expr \'', expr, '\' = ',  str(len(total_tweets)), '.']))
+        return total_tweets
+
+
+    def iter_search_expression_pages(self, expr, language = 'en', max_results = 1000, since_id = None, max_id = None, since = None, until = None):
+        """ Yields the pages (lists of up to 100 tweets) of search_expression(),
+            as they are retrieved.
+        """
+        since_id, max_id = tweet_id_bounds(since_id, max_id, since, until)
         search_params = {'q':                   '\"' + expr + '\" -filter:retweets',
                          'lang' :               language,
                          'result_type' :        'recent',
                          'count' :              100,
                          'include_entities' :   'true',
                         }
-        encoded_search_params = '?%s' % urllib.parse.urlencode(search_params)
-        acc_results = 0
-        total_tweets = []
-        while acc_results < max_results:
-            # get tweets
-            self._check_limit_remaining('/search/tweets')
-            self._connection.request('GET', '/1.1/search/tweets.json' + encoded_search_params, headers=self._request_headers)
-            response = self._connection.getresponse()
-            data = response.read().decode('utf-8')  # See note on https://docs.python.org/2/library/httplib.html#httplib.HTTPConnection.getresponse
-            self._handle_twitter_response_code(response, data)
-            tweets = json.loads(data, encoding='utf-8')
-            self._update_rate_limit('/search/tweets', response)
-
-            total_tweets += tweets['statuses']
-
-            # account results
-            results = len(tweets['statuses'])
-            acc_results += results
-            self._logger.debug(''.join(['\tRetrieved ', str(results), ' tweets. Current number of tweets found = ',  str(len(total_tweets)), '. Remaining \'/search/tweets\' requests = ', str(self._limits['/search/tweets']['remaining']), '.']))
-
-            # get next results page
-            if 'next_results' not in tweets['search_metadata']:     # end of results
-                break
-            encoded_search_params = tweets['search_metadata']['next_results']
-
-        self._logger.debug(''.join(['Number of tweets found for expr \'', expr, '\' = ',  str(len(total_tweets)), '.']))
+        if since_id:
+            search_params['since_id'] = int(since_id)
+        if max_id:
+            search_params['max_id'] = int(max_id)
+        for page in self._iter_search_pages(search_params, max_results):
+            yield page['statuses']
+
+
+    @_profiled
+    def search_expression_partitioned(self, expr, since, until = None, partitions = 4, language = 'en', max_results_per_partition = 0, readers = None):
+        """ Downloads tweets that contains a specific expression created between the
+        datetimes 'since' (inclusive) and 'until' (exclusive, default = now),
+        crawling 'partitions' time slices concurrently.
+
+        The time range is converted into tweet id bounds using the snowflake
+        timestamp encoding [20] and split into 'partitions' since_id/max_id
+        slices of equal duration. Each slice is searched with its own connection
+        and, if 'readers' (other connected TwitterReader objects, e.g. with other
+        credentials) is given, the slices are spread over this reader and the
+        other readers, so one expression can use the search budget of all of
+        them. The results are returned in decreasing id order (newest first),
+        as in search_expression().
+        """
+        until = until or datetime.datetime.now(datetime.timezone.utc)
+        lowest_id = datetime_to_tweet_id(since)
+        highest_id = datetime_to_tweet_id(until) - 1
+        if highest_id < lowest_id:
+            return []
+        readers = [self] + list(readers or [])
+        step = (highest_id - lowest_id) // partitions + 1
+        slices = []     # newest slice first: (since_id, max_id), since_id is exclusive and max_id inclusive
+        for slice_max_id in range(highest_id, lowest_id - 1, -step):
+            slices.append((max(slice_max_id - step, lowest_id - 1), slice_max_id))
+        self._logger.debug('Searching expression \'{}\' in {} slices from {} to {} with {} readers ...'.format(expr, len(slices), since, until, len(readers)))
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(slices), thread_name_prefix=self.__class__.__name__) as executor:
+            futures = [ executor.submit(readers[idx % len(readers)].search_expression, expr, language, max_results_per_partition, since_id, max_id)
+                        for idx, (since_id, max_id) in enumerate(slices) ]
+            total_tweets = []
+            for future in futures:      # the slices are disjoint, so concatenating them from newest to oldest keeps the id order
+                total_tweets += future.result()
+
+        self._logger.debug('Number of tweets found for expr \'{}\' in {} slices = {}.'.format(expr, len(slices), len(total_tweets)))
         return total_tweets
 
 
-    def hydrate_tweets(self, tweet_ids, extended=False):
-        """ Retrieves tweets (hydrate) from their tweet ids [19].
+    @_profiled
+    def get_tweet(self, tweet_id, extended=False):
+        """ Retrieves the tweet 'tweet_id' [19], coalesced with the other calls
+            made within the batch window if the lookups are coalesced (see
+            load_tweet()). Raises TweetNotFoundException if it is unavailable.
+        """
+        if self._coalesce_lookups:
+            return self.load_tweet(tweet_id, extended).result()
+        tweets = self._lookup_tweets([str(tweet_id)], extended)
+        if not tweets:
+            raise TweetNotFoundException(''.join(['Tweet id = ', str(tweet_id), ' not found (deleted or from a protected or suspended user).']))
+        return tweets[0]
+
+
+    def load_tweet(self, tweet_id, extended=False):
+        """ Returns a future of the tweet 'tweet_id'. The ids loaded within the
+            batch window are requested together in '/statuses/lookup' requests
+            [19] of up to 100 ids (see load_user_info()).
         """
+        return self._get_tweet_loader(extended).load(str(tweet_id))
 
-        lookup_url = '/1.1/statuses/lookup.json'
+
+    @_profiled
+    def hydrate_tweets(self, tweet_ids, extended=False, since=None, until=None):
+        """ Retrieves tweets (hydrate) from their tweet ids [19]. If the datetimes
+            'since' (inclusive) or 'until' (exclusive) are given, the ids created
+            out of this interval [20] are discarded before any request.
+        """
         lookup_url_key = '/statuses/lookup'
-        params = {'id'                  : None,
-                  'include_entities'    : 'false',
-                  'trim_user'           : 'true',
-                  'map'                 : 'false',
-                  'include_ext_alt_text': 'false',
-                  'include_card_uri'    : 'false',
-                 }
         if extended:    # extended tweets format [17]
             self._logger.debug('Retrieving extended tweets (more than 140 characters) ...')
-            params['tweet_mode'] = 'extended'
-        max_number_ids_allowed = 100
+        since_id, max_id = tweet_id_bounds(None, None, since, until)
+        if since_id or max_id:
+            tweet_ids = [ tweet_id for tweet_id in tweet_ids if (not since_id or int(tweet_id) > since_id) and (not max_id or int(tweet_id) <= max_id) ]
 
         total_tweets = []
-        for idx in range(0, len(tweet_ids), max_number_ids_allowed):
-            params['id'] = ','.join(tweet_ids[idx: idx+max_number_ids_allowed])
-            params_encoded = urllib.parse.urlencode(params)
-            self._check_limit_remaining(lookup_url_key)
-            self._connection.request('POST', lookup_url, headers=self._request_headers, body=params_encoded)
-            response = self._connection.getresponse()
-            data = response.read().decode('utf-8')  # See note on https://docs.python.org/2/library/httplib.html#httplib.HTTPConnection.getresponse
-            self._handle_twitter_response_code(response, data)
-            tweets = json.loads(data, encoding='utf-8')
-            self._update_rate_limit(lookup_url_key, response)
+        for batch, tweets in self._iter_lookup_batches(self._iter_batches(tweet_ids, 100), extended, max(1, self._prefetch)):
             total_tweets += tweets
-
-            self._logger.debug('\tRetrieved {} tweets. Current number of tweets retrieved = {}. Remaining \'{}\' requests = {}.'.format(len(tweets), len(total_tweets), lookup_url, self._limits[lookup_url_key]['remaining']))
+            self._logger.debug('\tRetrieved {} tweets. Current number of tweets retrieved = {}. Remaining \'{}\' requests = {}.'.format(len(tweets), len(total_tweets), lookup_url_key, self._limits[lookup_url_key]['remaining']))
 
         self._logger.debug('Total number of tweets retrieved {}/{}.'.format(len(total_tweets), len(tweet_ids)))
         return total_tweets
 
 
+    @_profiled
+    def hydrate_tweets_stream(self, tweet_ids, fd, extended=False, concurrency=1, missing_fd=None, checkpoint_filename=None):
+        """ Retrieves tweets (hydrate) from their tweet ids [19] in constant memory.
+
+        The ids are read lazily from 'tweet_ids', an iterable (e.g. an open file
+        with one id per line) or the name of a file with one id per line, and are
+        sent in batches of 100 ids, up to 'concurrency' batches at once. Each batch
+        is written to 'fd' (one tweet per line in JSON format) as soon as it and
+        the batches before it return, so the output keeps the input order. The ids
+        not returned by Twitter (deleted tweets or protected users) are written to
+        'missing_fd', one per line.
+
+        If 'checkpoint_filename' is given, the number of input ids already
+        processed is saved there after each batch, and a later call with the same
+        checkpoint resumes after the last completed batch ('fd' and 'missing_fd'
+        must be opened in append mode in this case).
+
+        Returns a tuple (number of retrieved tweets, number of missing tweets).
+        """
+        lookup_url_key = '/statuses/lookup'
+        processed_ids = 0
+        if checkpoint_filename and os.path.exists(checkpoint_filename):
+            with open(checkpoint_filename, mode='rt', encoding='ascii') as checkpoint_fd:
+                processed_ids = json.load(checkpoint_fd)['processed_ids']
+            self._logger.info('Resuming tweets retrieval after {} processed ids ...'.format(processed_ids))
+        tweet_ids = itertools.islice(self._iter_ids(tweet_ids), processed_ids, None)
+
+        acc_tweets = acc_missing = 0
+        for done_batch, tweets in self._iter_lookup_batches(self._iter_batches(tweet_ids, 100), extended, concurrency):
+            returned_ids = set(tweet['id_str'] for tweet in tweets)
+            missing_ids = [ tweet_id for tweet_id in done_batch if tweet_id not in returned_ids ]
+            with self._profiler.phase('output'):
+                for tweet in tweets:
+                    fd.write(json.dumps(tweet, sort_keys=True, ensure_ascii=True))
+                    fd.write('\n')
+                if missing_fd:
+                    for tweet_id in missing_ids:
+                        missing_fd.write(tweet_id + '\n')
+            acc_tweets += len(tweets)
+            acc_missing += len(missing_ids)
+            processed_ids += len(done_batch)
+            if checkpoint_filename:
+                with self._profiler.phase('output'):
+                    fd.flush()
+                    if missing_fd:
+                        missing_fd.flush()
+                    with open(checkpoint_filename + '.tmp', mode='wt', encoding='ascii') as checkpoint_fd:
+                        json.dump({'processed_ids': processed_ids}, checkpoint_fd)
+                    os.replace(checkpoint_filename + '.tmp', checkpoint_filename)
+            self._logger.debug('\tRetrieved {} tweets ({} missing). Current number of tweets retrieved = {}. Remaining \'{}\' requests = {}.'.format(len(tweets), len(missing_ids), acc_tweets, lookup_url_key, self._limits[lookup_url_key]['remaining']))
+
+        self._logger.debug('Total number of tweets retrieved {}/{}.'.format(acc_tweets, acc_tweets + acc_missing))
+        return acc_tweets, acc_missing
+
+
+    @_profiled
     def get_retweeters(self, tweet_id):
-        retweet_url = '/1.1/statuses/retweeters/ids.json'
-        retweet_params = {'id'      : tweet_id,
-                           'count'  : 100,
-                           'cursor' : -1,
-                          }
-        self._check_limit_remaining('/statuses/retweeters')
-        encoded_params = '?%s' % urllib.parse.urlencode(retweet_params)
-        self._connection.request('GET', retweet_url + encoded_params, headers=self._request_headers)
-        response = self._connection.getresponse()
-        data = response.read().decode('utf-8')  # See note on https://docs.python.org/2/library/httplib.html#httplib.HTTPConnection.getresponse
-        self._handle_twitter_response_code(response, data)
-        self._update_rate_limit('/statuses/retweeters', response)
-        self._logger.debug(''.join(['Remaining \'/statuses/retweeters\' requests = ', str(self._limits['/statuses/retweeters']['remaining']), '.']))
-        data = json.loads(data, encoding='utf-8')
-        retweeters = data['ids'][:]
-        while data['next_cursor'] != 0:
-            retweet_params['cursor'] = data['next_cursor']
-            self._check_limit_remaining('/statuses/retweeters')
-            encoded_params = '?%s' % urllib.parse.urlencode(retweet_params)
-            self._connection.request('GET', retweet_url + encoded_params, headers=self._request_headers)
-            response = self._connection.getresponse()
-            data = response.read().decode('utf-8')  # See note on https://docs.python.org/2/library/httplib.html#httplib.HTTPConnection.getresponse
-            self._handle_twitter_response_code(response, data)
-            self._update_rate_limit('/statuses/retweeters', response)
-            self._logger.debug(''.join(['Remaining \'/statuses/retweeters\' requests = ', str(self._limits['/statuses/retweeters']['remaining']), '.']))
-            data = json.loads(data, encoding='utf-8')
-            retweeters += data['ids'][:]
-        return retweeters
+        return self._request_cursor_pages('/1.1/statuses/retweeters/ids.json',
+                                          '/statuses/retweeters',
+                                          {'id'     : tweet_id,
+                                           'count'  : 100,
+                                          },
+                                          'ids')
 
 
+    @_profiled
     def get_friends(self, screen_name):
-        friends_url = '/1.1/friends/list.json'
-        friends_params = {'screen_name'             : screen_name,
-                          'count'                   : 200,
-                          'cursor'                  : -1,
-                          'skip_status'             : True,
-                          'include_user_entities'   : False,
-                          }
-        self._check_limit_remaining('/friends/list')
-        encoded_params = '?%s' % urllib.parse.urlencode(friends_params)
-        self._connection.request('GET', friends_url + encoded_params, headers=self._request_headers)
-        response = self._connection.getresponse()
-        data = response.read().decode('utf-8')  # See note on https://docs.python.org/2/library/httplib.html#httplib.HTTPConnection.getresponse
-        self._handle_twitter_response_code(response, data)
-        self._update_rate_limit('/friends/list', response)
-        self._logger.debug(''.join(['Remaining \'/friends/list\' requests = ', str(self._limits['/friends/list']['remaining']), '.']))
-        data = json.loads(data, encoding='utf-8')
-        friends = data['users'][:]
-        while data['next_cursor'] != 0:
-            friends_params['cursor'] = data['next_cursor']
-            self._check_limit_remaining('/friends/list')
-            encoded_params = '?%s' % urllib.parse.urlencode(friends_params)
-            self._connection.request('GET', friends_url + encoded_params, headers=self._request_headers)
-            response = self._connection.getresponse()
-            data = response.read().decode('utf-8')  # See note on https://docs.python.org/2/library/httplib.html#httplib.HTTPConnection.getresponse
-            self._handle_twitter_response_code(response, data)
-            self._update_rate_limit('/friends/list', response)
-            self._logger.debug(''.join(['Remaining \'/friends/list\' requests = ', str(self._limits['/friends/list']['remaining']), '.']))
-            data = json.loads(data, encoding='utf-8')
-            friends += data['users'][:]
-        return friends
+        return [ user for users in self.iter_neighbour_pages(screen_name, 'friends') for user in users ]
 
 
+    @_profiled
     def get_followers(self, screen_name):
-        followers_url = '/1.1/followers/list.json'
-        followers_params = {'screen_name'           : screen_name,
-                            'count'                 : 200,
-                            'cursor'                : -1,
-                            'skip_status'           : True,
-                            'include_user_entities' : False,
-                          }
-        self._check_limit_remaining('/followers/list')
-        encoded_params = '?%s' % urllib.parse.urlencode(followers_params)
-        self._connection.request('GET', followers_url + encoded_params, headers=self._request_headers)
-        response = self._connection.getresponse()
-        data = response.read().decode('utf-8')  # See note on https://docs.python.org/2/library/httplib.html#httplib.HTTPConnection.getresponse
-        self._handle_twitter_response_code(response, data)
-        self._update_rate_limit('/followers/list', response)
-        self._logger.debug(''.join(['Remaining \'/followers/list\' requests = ', str(self._limits['/followers/list']['remaining']), '.']))
-        data = json.loads(data, encoding='utf-8')
-        followers = data['users'][:]
-        while data['next_cursor'] != 0:
-            followers_params['cursor'] = data['next_cursor']
-            self._check_limit_remaining('/followers/list')
-            encoded_params = '?%s' % urllib.parse.urlencode(followers_params)
-            self._connection.request('GET', followers_url + encoded_params, headers=self._request_headers)
-            response = self._connection.getresponse()
-            data = response.read().decode('utf-8')  # See note on https://docs.python.org/2/library/httplib.html#httplib.HTTPConnection.getresponse
-            self._handle_twitter_response_code(response, data)
-            self._update_rate_limit('/followers/list', response)
-            self._logger.debug(''.join(['Remaining \'/followers/list\' requests = ', str(self._limits['/followers/list']['remaining']), '.']))
-            data = json.loads(data, encoding='utf-8')
-            followers += data['users'][:]
-        return followers
+        return [ user for users in self.iter_neighbour_pages(screen_name, 'followers') for user in users ]
 
 
+    def iter_neighbour_pages(self, screen_name, direction = 'friends'):
+        """ Yields the pages (lists of up to 200 user objects) of the friends or
+            followers ('direction') of 'screen_name', as they are retrieved.
+        """
+        if direction not in self._neighbour_resources:
+            raise ValueError('Invalid direction {}, expected one of {}.'.format(direction, tuple(self._neighbour_resources)))
+        url, resource = self._neighbour_resources[direction]
+        with self._negative_caching(screen_name, 'screen_name'):
+            for page in self._iter_cursor_pages(url,
+                                                resource,
+                                                {'screen_name'            : screen_name,
+                                                 'count'                  : 200,
+                                                 'skip_status'            : True,
+                                                 'include_user_entities'  : False,
+                                                }):
+                yield page['users']
+
+
+    @_profiled
+    def get_friend_ids(self, user_id):
+        """ Returns the ids of the users followed by 'user_id' [22], 5000 per
+            request (instead of the 200 user objects per request of get_friends()).
+        """
+        with self._negative_caching(user_id):
+            return self._request_cursor_pages('/1.1/friends/ids.json',
+                                              '/friends/ids',
+                                              {'user_id'    : user_id,
+                                               'count'      : 5000,
+                                              },
+                                              'ids')
+
+
+    @_profiled
+    def get_follower_ids(self, user_id):
+        """ Returns the ids of the followers of 'user_id' [23], 5000 per request.
+        """
+        with self._negative_caching(user_id):
+            return self._request_cursor_pages('/1.1/followers/ids.json',
+                                              '/followers/ids',
+                                              {'user_id'    : user_id,
+                                               'count'      : 5000,
+                                              },
+                                              'ids')
+
+
+    @_profiled
     def get_friendship(self, source_screen_name, target_screen_name):
-        friendship_url = '/1.1/friendships/show.json'
-        friendship_params = {'source_screen_name'   : source_screen_name,
-                             'target_screen_name'   : target_screen_name,
-                            }
-        self._check_limit_remaining('/friendships/show')
-        encoded_params = '?%s' % urllib.parse.urlencode(friendship_params)
-        self._connection.request('GET', friendship_url + encoded_params, headers=self._request_headers)
-        response = self._connection.getresponse()
-        data = response.read().decode('utf-8')  # See note on https://docs.python.org/2/library/httplib.html#httplib.HTTPConnection.getresponse
-        self._handle_twitter_response_code(response, data)
-        self._update_rate_limit('/friendships/show', response)
+        friendship = self._request('GET',
+                                   '/1.1/friendships/show.json',
+                                   '/friendships/show',
+                                   {'source_screen_name'   : source_screen_name,
+                                    'target_screen_name'   : target_screen_name,
+                                   })
         self._logger.debug(''.join(['Remaining \'/friendship/show\' requests = ', str(self._limits['/friendships/show']['remaining']), '.']))
-        return json.loads(data, encoding='utf-8')
+        return friendship